@@ -0,0 +1,121 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import as_completed
+from datetime import datetime
+from modules.file_manager import write_json_atomically
+from modules.warmup import make_worker_pool
+from modules.worker import RESULTS_FOLDER, process_job
+
+def render_trend(trend_number, render_profile, results_folder, profiling=None, render_workers=1):
+    """
+    Renders one trend in a worker process, reporting failures instead of raising them.
+
+    Args:
+        trend_number (int): Index of the trend, starting at 0.
+        render_profile (str): Render profile of the video.
+        results_folder (str): Folder where the finished video is published.
+        profiling (bool): Whether the job is profiled, None to follow the environment.
+        render_workers (int): Number of processes rendering chunks of the video.
+
+    Returns:
+        dict: The status, timing and result or error of the trend.
+    """
+    started = time.perf_counter()
+    try:
+        result = process_job({"trend_number": trend_number, "options": {"render_profile": render_profile, "profiling": profiling,
+                                                                            "render_workers": render_workers}}, results_folder)
+        return {"trend_number": trend_number + 1, "status": "done", "seconds": time.perf_counter() - started, **result}
+    except Exception as e:
+        return {"trend_number": trend_number + 1, "status": "failed", "seconds": time.perf_counter() - started, "error": repr(e)}
+
+def run_batch(trend_numbers, workers, render_profile, results_folder=RESULTS_FOLDER, profiling=None, render_workers=1):
+    """
+    Renders several trends in parallel processes, started warm with the models loaded.
+
+    Args:
+        trend_numbers (list): Indexes of the trends, starting at 0.
+        workers (int): Number of processes.
+        render_profile (str): Render profile of the videos.
+        results_folder (str): Folder where the finished videos are published.
+        profiling (bool): Whether the jobs are profiled, None to follow the environment.
+        render_workers (int): Number of processes rendering chunks of each video.
+
+    Returns:
+        list: One result per trend, in the order of `trend_numbers`.
+    """
+    results = {}
+    with make_worker_pool(workers) as executor:
+        futures = {executor.submit(render_trend, trend_number, render_profile, results_folder, profiling, render_workers): trend_number
+                   for trend_number in trend_numbers}
+        for future in as_completed(futures):
+            trend_number = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker process itself died, e.g. killed by the OOM killer.
+                result = {"trend_number": trend_number + 1, "status": "failed", "seconds": None, "error": repr(e)}
+            print(f"Trend {result['trend_number']}: {result['status']}" + (f" ({result['error']})" if "error" in result else ""))
+            results[trend_number] = result
+    return [results[trend_number] for trend_number in trend_numbers]
+
+def write_report(report_path, report):
+    """
+    Writes the batch report atomically, so that a reader never sees a partial file.
+
+    Args:
+        report_path (str): Path of the JSON report.
+        report (dict): The report.
+    """
+    write_json_atomically(report_path, report)
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Render trend videos in parallel, without Telegram.")
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument("--count", type=int, default=5, help="Render the top COUNT trends (default: 5).")
+    selection.add_argument("--trends", type=int, nargs="+", metavar="N", help="Render these trends, numbered from 1.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of render processes.")
+    parser.add_argument("--render-workers", type=int, default=1,
+                        help="Processes rendering chunks of each video; workers x render workers should not exceed the CPUs.")
+    parser.add_argument("--profile", choices=["preview", "publish"], default="publish", help="Render profile.")
+    parser.add_argument("--results", default=RESULTS_FOLDER, help="Folder where the videos are published.")
+    parser.add_argument("--profiling", action="store_true", default=None,
+                        help="Profile every job and publish the profiles next to the videos (default: TRENDS_PROFILE_RATE).")
+    parser.add_argument("--report", help="Path of the JSON report (default: <results>/batch-<timestamp>.json).")
+    args = parser.parse_args(argv)
+    if args.trends and min(args.trends) < 1:
+        parser.error("trend numbers start at 1")
+    return args
+
+def main(argv=None):
+    """
+    Runs the batch and writes its report.
+
+    Returns:
+        int: The exit code, 0 if every trend was rendered, 1 otherwise.
+    """
+    args = parse_arguments(argv)
+    trend_numbers = [number - 1 for number in args.trends] if args.trends else list(range(args.count))
+    started_at = datetime.now()
+    started = time.perf_counter()
+
+    results = run_batch(trend_numbers, args.workers, args.profile, args.results, args.profiling, args.render_workers)
+
+    failed = [result for result in results if result["status"] != "done"]
+    report = {
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "profile": args.profile,
+        "workers": args.workers,
+        "seconds": time.perf_counter() - started,
+        "succeeded": len(results) - len(failed),
+        "failed": len(failed),
+        "results": results,
+    }
+    report_path = args.report or os.path.join(args.results, f"batch-{started_at.strftime('%Y%m%d-%H%M%S')}.json")
+    write_report(report_path, report)
+    print(f"{report['succeeded']}/{len(results)} trends rendered in {report['seconds']:.1f} s, report written to {report_path}")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
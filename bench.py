@@ -0,0 +1,324 @@
+import os
+import sys
+import time
+
+def bench_sentiment(number_of_texts=2000):
+    """
+    Compares the throughput of TextBlob with the batched lexicon scorer.
+    """
+    from textblob import TextBlob
+    import modules.sentiment_engine as sentiment_engine
+
+    texts = [
+        "I really enjoyed reading this article. It was very informative and well-written.",
+        "This article was poorly written and lacked useful information.",
+        "The team lost the final, a disappointing end. Fans were still proud of the amazing season!",
+        "Stocks rose sharply after the strong earnings report, but analysts are not sure it will last.",
+    ] * (number_of_texts // 4)
+
+    started = time.perf_counter()
+    sentiment_engine.load_lexicon()
+    lexicon_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    expected = [TextBlob(text).sentiment.polarity for text in texts]
+    textblob_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    results = sentiment_engine.score_texts(texts)
+    engine_seconds = time.perf_counter() - started
+
+    same_sign = sum((a > 0) - (a < 0) == (b > 0) - (b < 0) for a, (b, _) in zip(expected, results))
+    print(f"sentiment: {len(texts)} texts, lexicon loaded in {lexicon_seconds * 1000:.1f} ms")
+    print(f"  TextBlob: {len(texts) / textblob_seconds:10.0f} texts/s")
+    print(f"  engine:   {len(texts) / engine_seconds:10.0f} texts/s ({textblob_seconds / engine_seconds:.1f}x)")
+    print(f"  same sign as TextBlob: {same_sign}/{len(texts)}")
+
+def bench_keywords(number_of_keywords=1500, number_of_sentences=2000):
+    """
+    Compares a per-sentence regex over the keyword list with the shared keyword matcher.
+    """
+    import random
+    import re
+    from modules.keyword_matcher import KeywordMatcher
+
+    rng = random.Random(0)
+    alphabet = "abcdefghijklmnopqrstuvwxyz"
+    vocabulary = ["".join(rng.choice(alphabet) for _ in range(rng.randint(3, 9))) for _ in range(5000)]
+    keywords = [" ".join(rng.sample(vocabulary, rng.randint(1, 3))) for _ in range(number_of_keywords)]
+    sentences = [" ".join(rng.choice(vocabulary) for _ in range(20)) + "." for _ in range(number_of_sentences)]
+    text = " ".join(sentences)
+
+    started = time.perf_counter()
+    naive_kept = []
+    for sentence in sentences:
+        pattern = r'\b(?:{})\b'.format('|'.join(map(re.escape, keywords)))
+        if not re.search(pattern, sentence, flags=re.IGNORECASE):
+            naive_kept.append(sentence)
+    naive_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    matcher = KeywordMatcher(keywords)
+    build_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    spans = []
+    position = 0
+    for sentence in sentences:
+        spans.append((position, position + len(sentence)))
+        position += len(sentence) + 1
+    kept = matcher.filter_spans(text, spans)
+    matcher_seconds = time.perf_counter() - started
+
+    print(f"keywords: {number_of_keywords} keywords, {len(text)} characters")
+    print(f"  per-sentence regex: {naive_seconds * 1000:8.1f} ms")
+    print(f"  keyword matcher:    {matcher_seconds * 1000:8.1f} ms (built once in {build_seconds * 1000:.1f} ms)")
+    print(f"  same sentences kept: {[text[start:end] for start, end in kept] == naive_kept}")
+
+def bench_motion(number_of_frames=96, fps=24, budget_share=0.5):
+    """
+    Measures the per-frame cost of the Ken Burns motion at 1080x1920 against the frame budget.
+
+    The motion is only one layer of the frame, so it must leave room for the overlays and the
+    encoder: it passes when it takes at most `budget_share` of the frame budget.
+
+    Returns:
+        bool: True if the motion fits its share of the frame budget.
+    """
+    import tempfile
+    import numpy as np
+    from moviepy.editor import ImageClip
+    from modules.editing import BACKGROUND_SCALE, KEN_BURNS_ZOOM
+    from modules.motion import make_ken_burns_clip
+
+    output_size = (1080, 1920)
+    rng = np.random.default_rng(0)
+    # A landscape background, memory-mapped and scaled as in create_video_with_data.
+    scale = KEN_BURNS_ZOOM * BACKGROUND_SCALE
+    source = rng.integers(0, 256, (int(1920 * scale), int(1080 * scale * 1.5), 3), dtype=np.uint8)
+    duration = number_of_frames / fps
+
+    with tempfile.TemporaryDirectory() as folder:
+        source_path = os.path.join(folder, "background.npy")
+        np.save(source_path, source)
+        clip = make_ken_burns_clip(source_path, output_size, duration, fps, zoom=KEN_BURNS_ZOOM)
+        started = time.perf_counter()
+        for index in range(number_of_frames):
+            clip.get_frame(index / fps)
+        motion_ms = (time.perf_counter() - started) * 1000 / number_of_frames
+        clip.close()
+
+    # The same zoom through MoviePy's per-frame resize of the whole full-resolution clip.
+    full_source = rng.integers(0, 256, (1920, int(1080 * 1.5), 3), dtype=np.uint8)
+    resized = ImageClip(full_source).set_duration(duration).resize(lambda t: 1 + 0.15 * t / duration)
+    started = time.perf_counter()
+    for index in range(0, number_of_frames, 8):
+        resized.get_frame(index / fps)
+    resize_ms = (time.perf_counter() - started) * 1000 / len(range(0, number_of_frames, 8))
+
+    budget_ms = 1000 / fps * budget_share
+    passed = motion_ms <= budget_ms
+    print(f"motion: {output_size[0]}x{output_size[1]}, frame budget {1000 / fps:.1f} ms, motion share {budget_ms:.1f} ms")
+    print(f"  precomputed crop boxes: {motion_ms:6.1f} ms/frame ({'PASS' if passed else 'FAIL'})")
+    print(f"  clip.resize per frame:  {resize_ms:6.1f} ms/frame")
+    return passed
+
+def make_render_inputs(folder, number_of_images=16, image_seconds=0.25):
+    """
+    Writes synthetic images and a silent narration for the render benchmarks.
+    """
+    import wave
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    images = []
+    for index in range(number_of_images):
+        path = os.path.join(folder, f"media_{index + 1}.jpg")
+        Image.fromarray(rng.integers(0, 256, (1200, 1600, 3), dtype=np.uint8)).save(path)
+        images.append(path)
+    audio_path = os.path.join(folder, "audio.wav")
+    with wave.open(audio_path, "wb") as output:
+        output.setnchannels(2)
+        output.setsampwidth(2)
+        output.setframerate(44100)
+        output.writeframes(bytes(int(44100 * number_of_images * image_seconds) * 4))
+    return images, audio_path
+
+def render_legacy(images, audio_path, output_path, fps=24):
+    """
+    Renders as before: full-resolution backgrounds in memory and MoviePy compositing.
+    """
+    from moviepy.editor import AudioFileClip, CompositeVideoClip, ImageClip
+    from modules.editing import convert_to_rgb_resize_and_blur
+
+    audio = AudioFileClip(audio_path)
+    duration = audio.duration / len(images)
+    clips = [ImageClip(convert_to_rgb_resize_and_blur(path, 1920)[0]).set_position(('center', 'center'))
+             .set_duration(duration).set_start(index * duration) for index, path in enumerate(images)]
+    video = CompositeVideoClip(clips, size=(1080, 1920)).set_duration(audio.duration).set_audio(audio)
+    frame = ImageClip('media/props/frame.png').set_duration(audio.duration).resize((1080, 1920))
+    CompositeVideoClip([video, frame], size=(1080, 1920)).write_videofile(output_path, fps=fps, preset="ultrafast", logger=None)
+
+def render_streaming(images, audio_path, output_path, fps=24):
+    """
+    Renders with memory-mapped backgrounds, the reused frame buffer and the memoryview writer.
+    """
+    from modules.audio_mixer import get_wav_duration
+    from modules.editing import BACKGROUND_SCALE, KEN_BURNS_ZOOM, cache_background
+    from modules.frame_renderer import FrameCompositor, StaticOverlay, write_video
+    from modules.motion import make_ken_burns_clip
+
+    total_duration = get_wav_duration(audio_path)
+    duration = total_duration / len(images)
+    scale = KEN_BURNS_ZOOM * BACKGROUND_SCALE
+    clips = [make_ken_burns_clip(cache_background(path, int(1920 * scale), int(1080 * scale)), (1080, 1920), duration, fps)
+             .set_start(index * duration) for index, path in enumerate(images)]
+    compositor = FrameCompositor((1080, 1920), clips, [StaticOverlay('media/props/frame.png', (1080, 1920))])
+    write_video(compositor, total_duration, fps, output_path, audio_path, preset="ultrafast")
+
+def measure_render(render, queue):
+    """
+    Runs a render in a fresh process and reports its peak RSS and duration.
+    """
+    import resource
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as folder:
+        images, audio_path = make_render_inputs(folder)
+        started = time.perf_counter()
+        render(images, audio_path, os.path.join(folder, "video.mp4"))
+        seconds = time.perf_counter() - started
+    queue.put((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, seconds))
+
+def bench_render_memory():
+    """
+    Compares the peak RSS of a 16-image render at 1080x1920 between the two render paths.
+    """
+    import multiprocessing
+
+    context = multiprocessing.get_context("spawn")
+    print("render memory: 16 images, 1080x1920, 4 s at 24 fps")
+    for name, render in (("moviepy composite", render_legacy), ("streaming", render_streaming)):
+        queue = context.Queue()
+        process = context.Process(target=measure_render, args=(render, queue))
+        process.start()
+        peak_mb, seconds = queue.get()
+        process.join()
+        print(f"  {name:18s} peak RSS {peak_mb:7.1f} MB  {seconds:6.1f} s")
+
+def bench_chunked_render(number_of_images=16, image_seconds=0.5):
+    """
+    Compares the latency of one render in this process with the chunked render on every CPU.
+    """
+    import tempfile
+    from modules.audio_mixer import get_wav_duration
+    from modules.editing import BACKGROUND_SCALE, KEN_BURNS_ZOOM, RENDER_PROFILES, cache_background, render_chunked, render_frames
+
+    workers = os.cpu_count() or 1
+    settings = RENDER_PROFILES["publish"]
+    with tempfile.TemporaryDirectory() as folder:
+        images, audio_path = make_render_inputs(folder, number_of_images, image_seconds)
+        duration = get_wav_duration(audio_path)
+        image_duration = duration / len(images)
+        scale = KEN_BURNS_ZOOM * BACKGROUND_SCALE
+        plan = {
+            "size": settings["size"], "fps": settings["fps"], "preset": "ultrafast", "ffmpeg_params": None,
+            "duration": duration, "subtitles": None, "frame_path": 'media/props/frame.png', "audio_path": audio_path,
+            "output_path": os.path.join(folder, "video.mp4"),
+            "backgrounds": [{"path": cache_background(path, int(1920 * scale), int(1080 * scale)),
+                             "start": index * image_duration, "duration": image_duration} for index, path in enumerate(images)],
+        }
+        started = time.perf_counter()
+        render_frames(plan, plan["output_path"], audio_path=audio_path)
+        single_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        render_chunked(plan, workers)
+        chunked_seconds = time.perf_counter() - started
+    print(f"chunked render: {number_of_images} images, 1080x1920, {duration:.0f} s at {settings['fps']} fps, {workers} CPUs")
+    print(f"  one process: {single_seconds:6.1f} s")
+    print(f"  {workers} chunks:    {chunked_seconds:6.1f} s ({single_seconds / chunked_seconds:.2f}x)")
+
+def bench_profiler(repeats=5, interval=0.01):
+    """
+    Measures the overhead of the sampling profiler on a mixed Python and Pillow workload.
+    """
+    from PIL import Image
+    from modules.profiler import SamplingProfiler
+
+    image = Image.new("RGB", (1920, 1080), (120, 60, 30))
+
+    def workload():
+        words = {}
+        for index in range(200000):
+            word = f"word{index % 5000}"
+            words[word] = words.get(word, 0) + 1
+        for _ in range(10):
+            image.resize((1080, 608), Image.LANCZOS)
+
+    workload()
+    plain = []
+    profiled = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        workload()
+        plain.append(time.perf_counter() - started)
+        sampler = SamplingProfiler(interval)
+        started = time.perf_counter()
+        with sampler:
+            workload()
+        profiled.append(time.perf_counter() - started)
+    plain_seconds = min(plain)
+    profiled_seconds = min(profiled)
+    print(f"profiler: sampling every {interval * 1000:.0f} ms, best of {repeats}")
+    print(f"  plain:    {plain_seconds * 1000:8.1f} ms")
+    print(f"  profiled: {profiled_seconds * 1000:8.1f} ms ({(profiled_seconds / plain_seconds - 1) * 100:+.1f}%), {sum(sampler.samples.values())} samples")
+
+def first_job_seconds():
+    """
+    Returns the seconds a worker takes to import the render modules, near zero once warm.
+    """
+    import importlib
+
+    started = time.perf_counter()
+    importlib.import_module("modules.editing")
+    return time.perf_counter() - started
+
+def bench_warmup(workers=2):
+    """
+    Compares the first job of cold spawned workers with the warm workers of make_worker_pool.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from modules.warmup import make_worker_pool
+
+    results = {}
+    for name, make_pool in [
+        ("cold", lambda: ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))),
+        ("warm", lambda: make_worker_pool(workers)),
+    ]:
+        started = time.perf_counter()
+        with make_pool() as executor:
+            futures = [executor.submit(first_job_seconds) for _ in range(workers)]
+            job_seconds = [future.result() for future in futures]
+            results[name] = (time.perf_counter() - started, max(job_seconds))
+    print(f"warm-up: {workers} workers, first job importing the render modules")
+    for name, (total_seconds, job_seconds) in results.items():
+        print(f"  {name}: pool ready and jobs done in {total_seconds:6.2f} s, slowest first job {job_seconds * 1000:8.1f} ms")
+
+BENCHMARKS = {
+    "sentiment": bench_sentiment,
+    "keywords": bench_keywords,
+    "motion": bench_motion,
+    "render_memory": bench_render_memory,
+    "profiler": bench_profiler,
+    "chunked_render": bench_chunked_render,
+    "warmup": bench_warmup,
+}
+
+if __name__ == '__main__':
+    # Benchmarks with a budget return whether they met it; any miss fails the run.
+    failed = [name for name in sys.argv[1:] or BENCHMARKS if BENCHMARKS[name]() is False]
+    if failed:
+        print(f"Over budget: {', '.join(failed)}")
+        sys.exit(1)
@@ -0,0 +1,386 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+FAKE_TOKEN = "123456:LOADTEST"
+FIXTURE_TRENDS = [f"Load test trend {number}" for number in range(1, 21)]
+
+class FakeBotAPI:
+    def __init__(self, latency=0.0, flood_every=0):
+        """
+        Local stand-in for the Telegram Bot API, answering in a thread of its own.
+
+        It accepts every method, answers sendMessage and sendVideo with plausible
+        messages and counts the calls, so that the bot runs unmodified against it.
+
+        Args:
+        - latency (float): Seconds each answer is delayed, as a remote server would.
+        - flood_every (int): Answer every n-th sendVideo with flood control (429), 0 to never.
+        """
+        self.latency = latency
+        self.flood_every = flood_every
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/bot"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-bot-api", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def answer(self, method, fields):
+        """
+        Builds the answer of a Bot API call.
+
+        Args:
+        - method (str): The Bot API method.
+        - fields (dict): The form fields of the request.
+
+        Returns:
+        - tuple: The HTTP status and the JSON answer.
+        """
+        with self.lock:
+            self.calls[method] += 1
+            call_number = self.calls[method]
+        if method == "getMe":
+            return 200, {"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "LoadTest", "username": "LoadTestBot"}}
+        if method not in ("sendMessage", "sendVideo"):
+            return 200, {"ok": True, "result": True}
+        if method == "sendVideo" and self.flood_every and call_number % self.flood_every == 0:
+            with self.lock:
+                self.calls["floodControl"] += 1
+            return 429, {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                         "parameters": {"retry_after": 1}}
+        chat_id = int(fields.get("chat_id", 0))
+        message = {"message_id": call_number, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}}
+        if method == "sendMessage":
+            message["text"] = fields.get("text", "")
+        else:
+            message["video"] = {"file_id": f"video-{call_number}", "file_unique_id": f"unique-{call_number}",
+                                "width": 1080, "height": 1920, "duration": 30}
+        return 200, {"ok": True, "result": message}
+
+    def make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.headers.get("Content-Type", "").startswith("multipart/"):
+                    # Only the small fields are needed, the uploaded video is ignored.
+                    fields = {name: value for name, value in re.findall(
+                        rb'name="([^"]+)"\r\n\r\n([^\r]{0,256})\r\n', body)}
+                    fields = {name.decode(): value.decode(errors="ignore") for name, value in fields.items()}
+                else:
+                    fields = {name: values[0] for name, values in parse_qs(body.decode()).items()}
+                if api.latency:
+                    time.sleep(api.latency)
+                status, answer = api.answer(self.path.rsplit("/", 1)[-1], fields)
+                payload = json.dumps(answer).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+def get_rss_megabytes():
+    """
+    Returns the resident memory of the process, from /proc where available.
+
+    Returns:
+        float: The RSS in MB, the peak RSS on platforms without /proc.
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def count_open_files():
+    """
+    Returns the number of file descriptors of the process, None where /proc is missing.
+    """
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+def count_child_processes():
+    """
+    Returns the number of child processes not reaped yet, e.g. ffmpeg readers and encoders,
+    None where /proc is missing.
+    """
+    pid = str(os.getpid())
+    try:
+        entries = [entry for entry in os.listdir("/proc") if entry.isdigit()]
+    except OSError:
+        return None
+    children = 0
+    for entry in entries:
+        try:
+            with open(f"/proc/{entry}/stat") as file:
+                # The command name may contain spaces and parentheses, the fields after it do not.
+                fields = file.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if fields[1] == pid:
+            children += 1
+    return children
+
+def install_fixtures(bot, scrape_seconds, render_seconds, render_mode, video_kb):
+    """
+    Replaces the scraping and rendering stages of the bot with fixtures of known cost.
+
+    Everything else (video store, delivery queue, storage manager, handlers) is the real code.
+
+    Args:
+        bot (module): The bot module.
+        scrape_seconds (float): Time the resource generation waits, as network stages do.
+        render_seconds (float): Time a render takes in the executor.
+        render_mode (str): "cpu" to hold the GIL like a real render, "sleep" to release it.
+        video_kb (int): Size of the fixture videos.
+    """
+    import modules.editing
+    import modules.file_manager
+    import modules.prerender
+    from modules.async_pipeline import AsyncResourceManager
+
+    def get_fixture_trends():
+        return list(FIXTURE_TRENDS)
+
+    async def generate_fixture_stages(resource_manager):
+        trend_name = FIXTURE_TRENDS[resource_manager.trend_number]
+        await asyncio.sleep(scrape_seconds)
+        path = modules.file_manager.create_media_folder(trend_name)
+        resource_manager.job_dir = path
+        summary = {"TextScript": f"{trend_name}.", "Description": f"About {trend_name}", "Tags": ["load", "test"]}
+        return resource_manager.build_output(FIXTURE_TRENDS, trend_name, path, summary, [], None, None,
+                                             {"path": None, "cc": "Fixture music"})
+
+    def render_fixture_video(data, profile="publish", cancel_event=None, workers=1):
+        deadline = time.perf_counter() + render_seconds
+        while time.perf_counter() < deadline:
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            if render_mode == "sleep":
+                time.sleep(0.01)
+            else:
+                sum(range(10000))
+        video_path = os.path.join(data["Dir"], f"video_{profile}.mp4")
+        with open(video_path, "wb") as file:
+            file.write(os.urandom(video_kb * 1024))
+        return video_path
+
+    bot.get_trends = get_fixture_trends
+    modules.prerender.get_trends = get_fixture_trends
+    AsyncResourceManager.generate_stages = generate_fixture_stages
+    modules.editing.create_video_with_data = render_fixture_video
+
+def make_update(application, update_id, chat_id, command):
+    """
+    Builds the update of a user sending a command in a private chat.
+    """
+    from telegram import Update
+    text = f"/{command}"
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"Chat {chat_id}"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+        },
+    }, application.bot)
+
+async def monitor(interval, timeline, stop_event):
+    """
+    Samples the event-loop lag, the memory, the open files and the child processes until stopped.
+
+    The lag is how late a sleep of `interval` seconds wakes up, i.e. how long the
+    loop was busy with something else, e.g. blocking code in a handler.
+    """
+    started = time.perf_counter()
+    while not stop_event.is_set():
+        before = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = time.perf_counter() - before - interval
+        timeline.append({
+            "seconds": round(time.perf_counter() - started, 3),
+            "lag_ms": round(max(lag, 0) * 1000, 2),
+            "rss_mb": round(get_rss_megabytes(), 1),
+            "open_files": count_open_files(),
+            "child_processes": count_child_processes(),
+        })
+
+def summarize_values(values):
+    """
+    Returns the median, 95th percentile and maximum of a list of values.
+    """
+    if not values:
+        return {"p50": None, "p95": None, "max": None}
+    ordered = sorted(values)
+    return {
+        "p50": round(statistics.median(ordered), 3),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "max": round(ordered[-1], 3),
+    }
+
+async def run_load(args):
+    """
+    Sends the commands of many chats at once to the bot and measures how it copes.
+
+    Args:
+        args (argparse.Namespace): The options of the load test.
+
+    Returns:
+        dict: The report.
+    """
+    import modules.bot as bot
+    from telegram import Update
+    from telegram.ext import TypeHandler
+
+    bot.number_of_videos = args.videos
+    install_fixtures(bot, args.scrape_seconds, args.render_seconds, args.render_mode, args.video_kb)
+    api = FakeBotAPI(args.api_latency, args.flood_every)
+    api.start()
+
+    application = bot.build_application(FAKE_TOKEN, api.base_url)
+    enqueued = {}
+    latencies = {}
+    done = asyncio.Event()
+    total = args.chats * args.commands_per_chat
+
+    async def record_done(update, context):
+        latencies[update.update_id] = time.perf_counter() - enqueued[update.update_id]
+        if len(latencies) == total:
+            done.set()
+
+    # Group 1 runs after the command handler of group 0 returns.
+    application.add_handler(TypeHandler(Update, record_done), group=1)
+
+    timeline = []
+    stop_event = asyncio.Event()
+    await application.initialize()
+    await application.start()
+    monitor_task = asyncio.ensure_future(monitor(args.sample_interval, timeline, stop_event))
+    started = time.perf_counter()
+    update_id = 0
+    for _ in range(args.commands_per_chat):
+        for chat_number in range(args.chats):
+            update_id += 1
+            enqueued[update_id] = time.perf_counter()
+            await application.update_queue.put(make_update(application, update_id, 1000 + chat_number, args.command))
+    try:
+        await asyncio.wait_for(done.wait(), args.timeout)
+    except asyncio.TimeoutError:
+        print(f"Timed out with {total - len(latencies)} commands unfinished.")
+    seconds = time.perf_counter() - started
+    stop_event.set()
+    await monitor_task
+    await application.stop()
+    await bot.close_http_client(application)
+    await application.shutdown()
+    api.stop()
+
+    return {
+        "chats": args.chats,
+        "commands": total,
+        "completed": len(latencies),
+        "seconds": round(seconds, 3),
+        "commands_per_second": round(len(latencies) / seconds, 3),
+        "videos_per_second": round(api.calls["sendVideo"] / seconds, 3),
+        "latency_seconds": summarize_values(list(latencies.values())),
+        "loop_lag_ms": summarize_values([sample["lag_ms"] for sample in timeline]),
+        "rss_mb": summarize_values([sample["rss_mb"] for sample in timeline]),
+        "open_files": {"start": timeline[0]["open_files"] if timeline else None,
+                       "end": timeline[-1]["open_files"] if timeline else None},
+        "child_processes": {"start": timeline[0]["child_processes"] if timeline else None,
+                            "end": timeline[-1]["child_processes"] if timeline else None},
+        "api_calls": dict(api.calls),
+        "timeline": timeline,
+    }
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the bot against a local fake Bot API with fixture renders.")
+    parser.add_argument("--chats", type=int, default=10, help="Number of chats sending commands at once.")
+    parser.add_argument("--commands-per-chat", type=int, default=1, help="Commands sent by each chat.")
+    parser.add_argument("--command", choices=["send_videos", "preview", "help"], default="send_videos")
+    parser.add_argument("--videos", type=int, default=5, help="Videos sent per /send_videos.")
+    parser.add_argument("--scrape-seconds", type=float, default=1.0, help="Duration of the fixture resource generation.")
+    parser.add_argument("--render-seconds", type=float, default=2.0, help="Duration of a fixture render.")
+    parser.add_argument("--render-mode", choices=["cpu", "sleep"], default="cpu",
+                        help="Whether the fixture render holds the GIL like a real one.")
+    parser.add_argument("--video-kb", type=int, default=512, help="Size of the fixture videos.")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="Seconds the fake Bot API takes to answer.")
+    parser.add_argument("--flood-every", type=int, default=0, help="Answer every n-th sendVideo with flood control.")
+    parser.add_argument("--sample-interval", type=float, default=0.1, help="Seconds between two monitor samples.")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds after which the test stops waiting.")
+    parser.add_argument("--report", help="Path of the JSON report, with the full timeline.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """
+    Runs the load test in a temporary working directory, so the real media folder is untouched.
+
+    Returns:
+        int: The exit code, 0 if every command completed, 1 otherwise.
+    """
+    args = parse_arguments(argv)
+    report_path = os.path.abspath(args.report) if args.report else None
+    working_folder = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        try:
+            report = asyncio.run(run_load(args))
+        finally:
+            os.chdir(working_folder)
+
+    latency = report["latency_seconds"]
+    lag = report["loop_lag_ms"]
+    print(f"{report['completed']}/{report['commands']} commands from {report['chats']} chats in {report['seconds']:.1f} s "
+          f"({report['commands_per_second']:.2f} commands/s, {report['videos_per_second']:.2f} videos/s)")
+    print(f"  handler latency: p50 {latency['p50']} s, p95 {latency['p95']} s, max {latency['max']} s")
+    print(f"  event loop lag:  p50 {lag['p50']} ms, p95 {lag['p95']} ms, max {lag['max']} ms")
+    print(f"  memory:          p50 {report['rss_mb']['p50']} MB, max {report['rss_mb']['max']} MB")
+    print(f"  open files:      {report['open_files']['start']} -> {report['open_files']['end']}")
+    print(f"  child processes: {report['child_processes']['start']} -> {report['child_processes']['end']}")
+    print(f"  Bot API calls:   {report['api_calls']}")
+    if report_path:
+        from batch import write_report
+        write_report(report_path, report)
+        print(f"Report written to {report_path}")
+    return 0 if report["completed"] == report["commands"] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
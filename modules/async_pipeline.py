@@ -0,0 +1,535 @@
+import asyncio
+import os
+import subprocess
+import threading
+import time
+from functools import partial
+import httpx
+import modules.editing
+import modules.media_dedup
+import modules.media_finder
+import modules.video_ingest
+import modules.web_scraper
+from modules.deadline import DeadlineBudget, gather_until
+from modules.job_manifest import JobManifest
+from modules.profiler import SamplingProfiler
+from modules.resource_manager import PIPELINE, ResourceManager, get_stage_inputs, is_stage_output
+from modules.search_client import default_client
+
+USER_AGENT = "Mozilla/5.0"
+
+def make_http_client(timeout=10, max_connections=8):
+    """
+    Creates the HTTP client shared by the async pipelines of a process.
+
+    Args:
+        timeout (float): Timeout of every request in seconds.
+        max_connections (int): Maximum number of simultaneous connections.
+
+    Returns:
+        httpx.AsyncClient: The client, to be closed with `aclose`.
+    """
+    return httpx.AsyncClient(headers={"User-Agent": USER_AGENT}, timeout=timeout, follow_redirects=True,
+                             limits=httpx.Limits(max_connections=max_connections))
+
+class AsyncResourceManager(ResourceManager):
+    def __init__(self, trend_number, client=None, executor=None, search_client=None, deadline_seconds=None, **options):
+        """
+        Asynchronous version of the resource pipeline, for callers running in an event loop.
+
+        The stages are those of PIPELINE, as for ResourceManager. Network stages share one
+        HTTP client and run concurrently; CPU stages run in an executor. Cancelling a
+        coroutine of the manager cancels its HTTP requests, kills its ffmpeg processes and
+        sets `cancel_event`, so that no further executor stage starts and a running render
+        stops at the next frame. Other CPU stages (e.g. speech synthesis or subtitles) cannot
+        be interrupted: one already running in the executor runs to its end, and its output
+        is discarded. A cancelled manager stays cancelled.
+
+        With a deadline, the job budgets itself instead of running out of time: it reads
+        fewer articles, fetches fewer media and no video clips, and renders a preview,
+        as far as needed to deliver a video in time. The stages it cut short are listed
+        in `degraded`; from the first one on, no stage of the job is recorded in the
+        manifest, so that a later run without hurry does not reuse them. The profile the
+        video was actually rendered with is `rendered_profile`.
+
+        Args:
+        - trend_number (int): Index of the trend to retrieve.
+        - client (httpx.AsyncClient): Shared HTTP client, one is created per run by default.
+        - executor (concurrent.futures.Executor): Executor of the CPU stages, the loop default one by default.
+        - search_client (SearchClient): Search client, the process-wide one by default.
+        - deadline_seconds (float): Time from the start of the generation to the delivery of the video, None for no deadline.
+        - options: Other ResourceManager parameters.
+        """
+        super().__init__(trend_number, **options)
+        self.client = client
+        self.executor = executor
+        self.search_client = search_client or default_client
+        self.cancel_event = threading.Event()
+        self.profiler = None
+        self.deadline_seconds = deadline_seconds
+        self.budget = None
+        self.degraded = set()
+        self.rendered_profile = None
+
+    async def run_blocking(self, func, *args):
+        """
+        Runs a blocking function in the executor.
+
+        Args:
+        - func (callable): The function.
+        - args: Its arguments.
+
+        Returns:
+        - The result of the function.
+        """
+        if self.cancel_event.is_set():
+            raise asyncio.CancelledError()
+        loop = asyncio.get_running_loop()
+        if self.profiler:
+            func = self.profiler.wrap(func)
+        try:
+            return await loop.run_in_executor(self.executor, partial(func, *args))
+        except asyncio.CancelledError:
+            self.cancel_event.set()
+            raise
+
+    async def run_subprocess(self, command, timeout):
+        """
+        Runs a command, killing it if it times out or if the caller is cancelled.
+
+        Args:
+        - command (list): The command.
+        - timeout (float): Seconds after which the command is killed.
+
+        Returns:
+        - tuple: The return code and the decoded stderr.
+        """
+        process = await asyncio.create_subprocess_exec(*command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+        return process.returncode, stderr.decode(errors="ignore")
+
+    async def run_stage_async(self, manifest, stage, func, artifacts=lambda value: []):
+        """
+        Asynchronous counterpart of `run_stage`.
+
+        Args:
+        - manifest (JobManifest): Manifest of the trend directory.
+        - stage (str): Name of the stage.
+        - func (callable): Coroutine function producing the stage output. None or an empty output means failure.
+        - artifacts (callable): Function returning the files produced, given the stage output.
+
+        Returns:
+        - The stage output, either recorded or freshly computed.
+        """
+        inputs = manifest.inputs_digest(get_stage_inputs(stage))
+        # Once a stage is degraded, the manifest no longer holds the values the job runs on,
+        # so a recorded stage may depend on the full outputs the degraded stage replaced.
+        if not self.degraded and manifest.is_complete(stage, inputs):
+            if self.budget:
+                self.budget.skip(stage)
+            return manifest.get(stage)
+        started = time.perf_counter()
+        value = await func()
+        seconds = time.perf_counter() - started
+        if self.budget:
+            self.budget.record(stage, seconds)
+        if is_stage_output(value) and not self.degraded:
+            manifest.record(stage, value, artifacts(value), seconds, inputs)
+        return value
+
+    async def get_site_content_async(self, url):
+        """
+        Downloads an article and extracts its text.
+
+        Args:
+        - url (str): URL of the article.
+
+        Returns:
+        - str or None: The text of the article, None if it could not be fetched.
+        """
+        try:
+            response = await self.client.get(url)
+            response.raise_for_status()
+        except httpx.HTTPError:
+            return None
+        return await self.run_blocking(modules.web_scraper.extract_article_text, response.text)
+
+    async def get_trend_contents_async(self, trend_name, number_of_articles, max_pages=5, cutoff=None):
+        """
+        Retrieves the contents of articles on a trend, downloading each page of results concurrently.
+
+        The results of every page are searched once up front; the pages are only the
+        batches in which the articles are downloaded, until enough were read.
+
+        Args:
+        - trend_name (str): The trend.
+        - number_of_articles (int): Desired number of articles.
+        - max_pages (int): Maximum number of pages of search results.
+        - cutoff (float): Event loop time after which the articles still downloading are given up,
+          once at least one was read. None to read them all.
+
+        Returns:
+        - list: The article contents, in the order of the search results.
+        """
+        loop = asyncio.get_running_loop()
+        contents = []
+        results = await self.run_blocking(lambda: list(self.search_client.iter_results(trend_name, number_of_articles, max_pages)))
+        results = [result for result in results if not modules.web_scraper.is_blacklisted(result, modules.web_scraper.BLACK_LIST)]
+        for start in range(0, len(results), number_of_articles):
+            page = results[start:start + number_of_articles]
+            timeout = None if cutoff is None else cutoff - loop.time()
+            page_contents = await gather_until([self.get_site_content_async(result["href"]) for result in page], timeout,
+                                               minimum=0 if contents else 1)
+            contents.extend(content for content in page_contents if content)
+            if len(contents) >= number_of_articles:
+                break
+            if cutoff is not None and loop.time() >= cutoff and contents:
+                print(f"Scraping of {trend_name} ran out of time with {len(contents)}/{number_of_articles} articles.")
+                break
+        return contents[:number_of_articles]
+
+    async def scrape_contents_async(self, trend_name):
+        """
+        Asynchronous counterpart of `scrape_contents`.
+
+        Args:
+        - trend_name (str): The trend.
+
+        Returns:
+        - dict or None: Contents for the text and the description, None if nothing was found.
+        """
+        cutoff = asyncio.get_running_loop().time() + self.budget.allowance("contents") if self.budget else None
+        contents = await self.get_trend_contents_async(trend_name, self.number_of_articles_to_read, cutoff=cutoff)
+        if not contents:
+            return None
+        # Served by the search cache; only the article pages are downloaded again.
+        desc_contents = await self.get_trend_contents_async(trend_name, self.desc_articles, cutoff=cutoff)
+        if cutoff is not None and asyncio.get_running_loop().time() >= cutoff:
+            # Possibly fewer articles than an unhurried run reads.
+            self.degraded.add("contents")
+        return {"Text": contents, "Description": desc_contents}
+
+    async def get_commons_json(self, params):
+        """
+        Sends a query to the Wikimedia Commons API.
+
+        Args:
+        - params (dict): The query parameters.
+
+        Returns:
+        - dict: The decoded response, empty if the query failed.
+        """
+        try:
+            response = await self.client.get(modules.media_finder.COMMONS_API_ENDPOINT, params=params)
+            response.raise_for_status()
+            return response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"Wikimedia Commons query failed: {e}")
+            return {}
+
+    async def get_commons_urls(self, search_term, number_of_media, min_height, videos):
+        """
+        Retrieves the URLs of images or videos matching a search term, the file lookups running concurrently.
+
+        Args:
+        - search_term (str): The term to search.
+        - number_of_media (int): The number of media requested.
+        - min_height (int): The minimum height of the images.
+        - videos (bool): Whether to search mp4 videos instead of images.
+
+        Returns:
+        - list: The URLs.
+        """
+        if not videos:
+            data = await self.get_commons_json(modules.media_finder.build_media_query(search_term))
+            return modules.media_finder.parse_media_urls(data, number_of_media, min_height)
+        data = await self.get_commons_json(modules.media_finder.build_video_search_query(search_term))
+        titles = modules.media_finder.parse_video_titles(data)
+        pages = await asyncio.gather(*(self.get_commons_json(modules.media_finder.build_file_url_query(title)) for title in titles))
+        return [url for page in pages for url in modules.media_finder.parse_file_urls(page)]
+
+    async def search_media_with_synonyms_async(self, trend_name, text, min_height, number_of_media, videos):
+        """
+        Asynchronous counterpart of `search_media_with_synonyms`; the WordNet work runs in the executor.
+
+        Args:
+        - trend_name (str): The trend or topic name.
+        - text (str): The text where the trend_name is found.
+        - min_height (int): Minimum height requirement for images.
+        - number_of_media (int): Number of media to retrieve.
+        - videos (bool): Whether to search mp4 videos instead of images.
+
+        Returns:
+        - list: A list of URLs of the retrieved media.
+        """
+        main_noun = await self.run_blocking(modules.media_finder.main_noun_from_sentence, trend_name)
+        synonyms = await self.run_blocking(modules.media_finder.get_synonyms, main_noun)
+        urls = []
+        for synonym in synonyms:
+            search_term = await self.run_blocking(modules.media_finder.get_search_term, synonym, text)
+            urls.extend(await self.get_commons_urls(search_term, number_of_media, min_height, videos))
+            if len(urls) >= number_of_media:
+                break
+        return urls
+
+    async def download_async(self, url, save_path):
+        """
+        Streams a file to disk.
+
+        Args:
+        - url (str): URL of the file.
+        - save_path (str): Path of the file to write.
+
+        Returns:
+        - str or None: The path, None if the download failed.
+        """
+        try:
+            async with self.client.stream("GET", url) as response:
+                response.raise_for_status()
+                with open(save_path, "wb") as file:
+                    async for chunk in response.aiter_bytes(65536):
+                        file.write(chunk)
+        except httpx.HTTPError as e:
+            print(f"HTTP error occurred: {e}")
+            return None
+        except asyncio.CancelledError:
+            if os.path.exists(save_path):
+                os.remove(save_path)
+            raise
+        return save_path
+
+    async def fetch_thumbnail_async(self, url):
+        """
+        Asynchronous counterpart of `media_dedup.fetch_thumbnail`.
+
+        Args:
+        - url (str): URL of the original file.
+
+        Returns:
+        - bytes or None: The thumbnail, None if it could not be downloaded.
+        """
+        try:
+            response = await self.client.get(modules.media_dedup.get_thumbnail_url(url))
+            response.raise_for_status()
+            return response.content
+        except httpx.HTTPError as e:
+            print(f"Unable to download the thumbnail of {url}: {e}")
+            return None
+
+    async def deduplicate_media_async(self, urls, number):
+        """
+        Asynchronous counterpart of `media_dedup.deduplicate_media`, the thumbnails downloading concurrently.
+
+        Args:
+        - urls (list): URLs of candidate Commons files, best first.
+        - number (int): Number of files wanted.
+
+        Returns:
+        - list: Up to `number` URLs of distinct visuals.
+        """
+        index = modules.media_dedup.default_index
+        missing = await self.run_blocking(index.missing, urls)
+        if missing:
+            thumbnails = await asyncio.gather(*(self.fetch_thumbnail_async(url) for url in missing))
+            await self.run_blocking(index.add_thumbnails, missing, thumbnails)
+            await self.run_blocking(index.save)
+        return index.select_distinct(urls, number)
+
+    async def fetch_segment_async(self, url, output_path):
+        """
+        Asynchronous counterpart of `video_ingest.fetch_segment`.
+
+        Args:
+        - url (str): URL of the video.
+        - output_path (str): Path of the mp4 segment to write.
+
+        Returns:
+        - str or None: The path of the segment, None if it could not be fetched.
+        """
+        try:
+            _, probe_output = await self.run_subprocess(modules.video_ingest.build_probe_command(url), 60)
+            start = modules.video_ingest.choose_segment_start(modules.video_ingest.parse_duration(probe_output))
+            return_code, error = await self.run_subprocess(modules.video_ingest.build_segment_command(url, output_path, start), 300)
+        except asyncio.TimeoutError:
+            print(f"Timed out while fetching a segment of {url}")
+            return None
+        if return_code != 0:
+            print(f"An error occurred while fetching a segment of {url}: {error.strip()}")
+            return None
+        return output_path
+
+    async def search_and_download_media_async(self, trend_name, text, folder_path, min_height=1080, number_of_media=16,
+                                              videos=True, timeout=None):
+        """
+        Asynchronous counterpart of `search_and_download_media`: the image and video searches,
+        then all the downloads, run concurrently.
+
+        Args:
+        - trend_name (str): The trend to search media for.
+        - text (str): The text script of the trend.
+        - folder_path (str): The trend directory.
+        - min_height (int): Minimum height requirement for media.
+        - number_of_media (int): Number of media to download.
+        - videos (bool): Whether video clips are fetched along the images.
+        - timeout (float): Seconds after which the downloads still running are given up, once one succeeded.
+
+        Returns:
+        - list or None: Paths of the video segments then of the images, None if nothing was found.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        num_videos = number_of_media // 8 if videos else 0
+        num_images = number_of_media - num_videos
+        candidate_factor = modules.media_dedup.CANDIDATE_FACTOR
+        searches = [self.search_media_with_synonyms_async(trend_name, text, min_height, num_images * candidate_factor, False)]
+        if videos:
+            searches.append(self.search_media_with_synonyms_async(trend_name, text, min_height, num_videos, True))
+        results = await asyncio.gather(*searches)
+        urls, video_urls = results[0], results[1] if videos else []
+        if not urls:
+            print("Unable to find images for the given trend and its synonyms.")
+        if videos and not video_urls:
+            print("Unable to find videos for the given trend and its synonyms.")
+            num_images = number_of_media
+            urls.extend(await self.search_media_with_synonyms_async(trend_name, text, min_height, num_videos * candidate_factor, False))
+        urls = await self.deduplicate_media_async(urls, num_images)
+        if not urls:
+            print("Unable to find media for the given trend and its synonyms.")
+            return None
+
+        downloads = [self.fetch_segment_async(url, os.path.join(folder_path, f"media_{index + 1}.mp4"))
+                     for index, url in enumerate(video_urls)]
+        downloads += [self.download_async(url, os.path.join(folder_path, f"media_{index + 1}.jpg"))
+                      for index, url in enumerate(urls)]
+        timeout = None if timeout is None else timeout - (loop.time() - started)
+        return [media_path for media_path in await gather_until(downloads, timeout) if media_path]
+
+    async def generate_resources_async(self):
+        """
+        Asynchronous counterpart of `generate_resources`, recording the same manifest stages.
+
+        Returns:
+        - dict: Dictionary containing generated resources, None if a stage failed.
+        """
+        if self.deadline_seconds and not self.budget:
+            self.budget = DeadlineBudget(self.deadline_seconds)
+        return await self.run_profiled_async("resources", self.generate_with_client)
+
+    async def run_profiled_async(self, name, func):
+        """
+        Asynchronous counterpart of `run_profiled`.
+
+        The event loop is shared with other jobs, so only the executor stages of the job
+        are sampled: the CPU work, whereas the network stages mostly wait.
+
+        Args:
+        - name (str): Name of the step, used in the profile file names.
+        - func (callable): Coroutine function running the step.
+
+        Returns:
+        - The output of the step.
+        """
+        if not self.profiling:
+            return await func()
+        self.profiler = SamplingProfiler()
+        self.profiler.start(track_caller=False)
+        try:
+            return await func()
+        finally:
+            profiler, self.profiler = self.profiler, None
+            profiler.stop()
+            self.save_profile(profiler, name)
+
+    async def generate_with_client(self):
+        """
+        Runs the stages of `generate_resources_async` with a shared or a dedicated HTTP client.
+        """
+        if self.client is not None:
+            return await self.generate_stages()
+        async with make_http_client() as client:
+            self.client = client
+            try:
+                return await self.generate_stages()
+            finally:
+                self.client = None
+
+    async def generate_stages(self):
+        """
+        Runs the stages of `generate_resources_async` with the HTTP client in place.
+        """
+        job = self.start_job(await self.run_blocking(self.fetch_trends))
+        manifest = JobManifest(job["path"])
+        for stage in PIPELINE:
+            value = await self.run_stage_async(manifest, stage["name"], lambda: self.run_pipeline_stage(stage["name"], job),
+                                               stage["artifacts"])
+            if not is_stage_output(value):
+                print("Error: " + stage["error"].format(**job))
+                return None
+            job[stage["name"]] = value
+        return self.finish_job(job)
+
+    async def run_pipeline_stage(self, name, job):
+        """
+        Runs a stage of PIPELINE: its async implementation if there is one, the blocking one in the executor otherwise.
+
+        Args:
+        - name (str): Name of the stage.
+        - job (dict): The job, see `start_job`.
+
+        Returns:
+        - The stage output.
+        """
+        stage_async = getattr(self, f"stage_{name}_async", None)
+        if stage_async is not None:
+            return await stage_async(job)
+        return await self.run_blocking(getattr(self, f"stage_{name}"), job)
+
+    async def stage_contents_async(self, job):
+        """
+        Stage: scrapes the articles of the trend concurrently.
+        """
+        return await self.scrape_contents_async(job["trend_name"])
+
+    async def stage_media_async(self, job):
+        """
+        Stage: searches and downloads the media concurrently, as many as the deadline allows.
+        """
+        number_of_media, videos = self.budget.plan_media(16) if self.budget else (16, True)
+        media_timeout = self.budget.allowance("media") if self.budget else None
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        media = await self.search_and_download_media_async(job["trend_name"], job["summary"]["TextScript"], job["path"],
+                                                           number_of_media=number_of_media, videos=videos, timeout=media_timeout)
+        if (number_of_media, videos) != (16, True) or (media_timeout is not None and loop.time() - started >= media_timeout):
+            self.degraded.add("media")
+        return media
+
+    async def render_video_async(self, output, profile=None):
+        """
+        Asynchronous counterpart of `render_video`; cancelling it stops the render at the next frame.
+
+        Args:
+        - output (dict): Resources returned by `generate_resources_async`.
+        - profile (str): Render profile, the one of the manager by default.
+
+        Returns:
+        - str: Path of the rendered video.
+        """
+        if not profile and self.budget:
+            profile = self.budget.choose_render_profile(self.render_profile)
+            if profile != self.render_profile:
+                print(f"Rendering a {profile} of {output['Trend_name']} to meet the deadline.")
+        profile = profile or self.render_profile
+        self.rendered_profile = profile
+        self.job_dir = output["Dir"]
+        manifest = JobManifest(output["Dir"])
+        render = lambda: self.run_blocking(modules.editing.create_video_with_data, output, profile, self.cancel_event, self.render_workers)
+        return await self.run_stage_async(manifest, f"video_{profile}",
+                                          lambda: self.run_profiled_async(f"render_{profile}", render),
+                                          lambda value: [value])
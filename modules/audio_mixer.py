@@ -0,0 +1,151 @@
+import subprocess
+import wave
+import numpy as np
+from imageio_ffmpeg import get_ffmpeg_exe
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+
+def get_wav_duration(wav_path):
+    """
+    Reads the duration of a wav file from its header.
+
+    Args:
+        wav_path (str): Path of the wav file.
+
+    Returns:
+        float: Duration in seconds, 0 if the file cannot be read.
+    """
+    try:
+        with wave.open(wav_path, "rb") as wav_file:
+            return wav_file.getnframes() / wav_file.getframerate()
+    except (OSError, wave.Error, EOFError):
+        return 0.0
+
+def open_audio_stream(audio_path, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+    """
+    Starts an ffmpeg process decoding an audio file to raw float32 samples.
+
+    Args:
+        audio_path (str): Path of the audio file.
+        sample_rate (int): Sample rate of the decoded stream.
+        channels (int): Number of channels of the decoded stream.
+
+    Returns:
+        subprocess.Popen: The ffmpeg process, whose stdout yields interleaved f32le samples.
+    """
+    command = [
+        get_ffmpeg_exe(), "-v", "error", "-i", audio_path,
+        "-f", "f32le", "-acodec", "pcm_f32le", "-ac", str(channels), "-ar", str(sample_rate), "-"
+    ]
+    return subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+def read_block(stream, frames, channels=CHANNELS):
+    """
+    Reads up to a number of frames from a decoding process.
+
+    Args:
+        stream (subprocess.Popen): The ffmpeg process, or None once exhausted.
+        frames (int): Number of frames to read.
+        channels (int): Number of channels of the stream.
+
+    Returns:
+        np.ndarray: Array of shape (n, channels) with n <= frames, empty at the end of the stream.
+    """
+    if stream is None:
+        return np.zeros((0, channels), dtype=np.float32)
+    data = stream.stdout.read(frames * channels * 4)
+    samples = np.frombuffer(data[:len(data) - len(data) % (channels * 4)], dtype=np.float32)
+    return samples.reshape(-1, channels)
+
+def close_stream(stream):
+    """
+    Stops a decoding process, even if it did not reach the end of its file.
+
+    Args:
+        stream (subprocess.Popen): The ffmpeg process.
+    """
+    if stream is None:
+        return
+    stream.stdout.close()
+    if stream.poll() is None:
+        stream.kill()
+    stream.wait()
+
+def ducking_envelope(narration, previous_gain, duck_gain, window=1024, threshold=0.02):
+    """
+    Computes the gain applied to the music under the narration of a block.
+
+    The RMS of the narration is measured on windows of samples; windows louder than
+    the threshold lower the music to `duck_gain`, and the gain is interpolated between
+    window centres so that it changes smoothly.
+
+    Args:
+        narration (np.ndarray): Narration samples of shape (n, channels).
+        previous_gain (float): Gain at the end of the previous block.
+        duck_gain (float): Gain of the music while the narration is speaking.
+        window (int): Number of frames per RMS window.
+        threshold (float): RMS above which the narration counts as speech.
+
+    Returns:
+        np.ndarray: Per-frame gains of shape (n,).
+    """
+    frames = len(narration)
+    windows = max(1, -(-frames // window))
+    padded = np.zeros((windows * window, narration.shape[1]), dtype=np.float32)
+    padded[:frames] = narration
+    rms = np.sqrt(np.mean(np.square(padded.reshape(windows, -1)), axis=1))
+    targets = np.where(rms > threshold, duck_gain, 1.0)
+    positions = np.concatenate(([0.0], np.arange(windows) * window + window / 2))
+    gains = np.concatenate(([previous_gain], targets))
+    return np.interp(np.arange(frames), positions, gains).astype(np.float32)
+
+def mix_narration_with_music(narration_path, music_path, output_path, music_gain=0.08, duck_gain=1.0, block_seconds=1.0):
+    """
+    Mixes the narration with the background music into a single 16-bit wav track.
+
+    Both files are decoded block by block and only for the duration of the narration,
+    so memory stays constant whatever the length of the music file.
+
+    Args:
+        narration_path (str): Path of the narration audio.
+        music_path (str): Path of the background music.
+        output_path (str): Path of the mixed wav to write.
+        music_gain (float): Volume of the music relative to the narration.
+        duck_gain (float): Extra gain applied to the music while the narration speaks (1.0 disables ducking).
+        block_seconds (float): Duration of the blocks processed at a time.
+
+    Returns:
+        str: The path of the mixed track.
+    """
+    frames_per_block = int(SAMPLE_RATE * block_seconds)
+    narration_stream = music_stream = None
+    gain = 1.0
+    try:
+        narration_stream = open_audio_stream(narration_path)
+        music_stream = open_audio_stream(music_path)
+        with wave.open(output_path, "wb") as output:
+            output.setnchannels(CHANNELS)
+            output.setsampwidth(2)
+            output.setframerate(SAMPLE_RATE)
+            while True:
+                narration = read_block(narration_stream, frames_per_block)
+                if not len(narration):
+                    break
+                music = read_block(music_stream, len(narration))
+                if len(music) < len(narration):
+                    close_stream(music_stream)
+                    music_stream = None
+                    music = np.pad(music, ((0, len(narration) - len(music)), (0, 0)))
+                music_gains = np.full(len(narration), music_gain, dtype=np.float32)
+                if duck_gain != 1.0:
+                    envelope = ducking_envelope(narration, gain, duck_gain)
+                    gain = float(envelope[-1])
+                    music_gains *= envelope
+                mixed = narration + music * music_gains[:, None]
+                np.clip(mixed, -1.0, 1.0, out=mixed)
+                output.writeframes((mixed * 32767).astype("<i2").tobytes())
+    finally:
+        close_stream(narration_stream)
+        close_stream(music_stream)
+    return output_path
@@ -1,11 +1,16 @@
 import os
 import time
 from datetime import datetime, timedelta
-from modules.resource_manager import ResourceManager
-from modules.file_manager import delete_files_except_mp4, delete_folder
-from modules.editing import create_video_with_data
+from modules.async_pipeline import AsyncResourceManager, make_http_client
+from modules.file_manager import get_media_folder_path
+from modules.storage_manager import StorageManager
+from modules.video_store import VideoStore, make_key
+from modules.web_scraper import get_trends
+from modules.prerender import PreRenderer
+from modules.warmup import warm_up
+from modules.delivery import DeliveryQueue
 from telegram import Bot
-from telegram.error import TelegramError
+from telegram.error import BadRequest
 from telegram.ext import Application, CommandHandler, CallbackContext
 from dotenv import load_dotenv
 import asyncio
@@ -15,14 +20,31 @@ load_dotenv(dotenv_path='data/var.env')
 TELEGRAM_BOT_TOKEN = os.getenv("tg")
 
 bot_name = 'FrameDeployerBot'
+number_of_videos = 5
+timeout_minutes = 5
+prerender_interval_minutes = 15
+prerender_concurrency = 1
+delivery_workers = 2
+upload_timeout_seconds = 120
+# Chunk processes wanted per render; concurrent renders share editing.CHUNK_PROCESS_LIMIT between them.
+render_workers = os.cpu_count() or 1
+# Kept free at the end of the time limit of a trend to store and upload its video.
+deadline_margin_seconds = 30
+storage_quota_gigabytes = 5
+storage_interval_minutes = 10
+video_store = VideoStore()
+http_client = make_http_client()
+storage_manager = StorageManager(quota_bytes=storage_quota_gigabytes * 1024 ** 3, orphan_minutes=timeout_minutes * 3)
 
 def check_status():
     print(f'🤖 The {bot_name} is operational!')
 
 
 async def generate_resources_with_timeout(resource_manager, timeout_minutes):
+    # The pipeline budgets itself to finish before its deadline; the timeout is the last resort,
+    # cancelling the pipeline itself: its requests, ffmpeg processes and remaining stages.
     try:
-        return await asyncio.wait_for(asyncio.to_thread(resource_manager.generate_resources), timeout_minutes * 60)
+        return await asyncio.wait_for(resource_manager.generate_resources_async(), timeout_minutes * 60)
     except asyncio.TimeoutError:
         return None
 
@@ -40,7 +62,9 @@ I guess you want to know the currently available commands (if not, stop spamming
 
 **Commands**:
 🚀 /start: Check the status of the bot.
-📹 /send_videos: Send videos on the first 5 trends.'''
+📹 /send_videos: Send videos on the first 5 trends.
+👀 /preview <n>: Send a low resolution preview of the n-th trend.
+🔬 Add "profiling" to a command to profile the jobs it renders.'''
     escaped_info = escape_markdown_v2(info)
     await update.message.reply_text(escaped_info, parse_mode='MarkdownV2')
 
@@ -57,48 +81,191 @@ def escape_markdown_v2(text):
     escape_chars = r'\_*[]()~`>#+-=|{}.!'
     return ''.join([f'\\{char}' if char in escape_chars else char for char in text])
 
+def get_store_key(resource_manager, key, preview_key):
+    """
+    Chooses the store key of a rendered video, so that a video degraded to meet its deadline is never served as a full one.
+
+    Args:
+    - resource_manager (AsyncResourceManager): The manager that rendered the video.
+    - key (str): The key of the video requested.
+    - preview_key (str): The key of the preview of the same trend.
+
+    Returns:
+    - str: `key` for the video requested, `preview_key` for a preview rendered instead,
+      or a key of its own for a video made of cut short resources, which is delivered once.
+    """
+    if resource_manager.degraded:
+        return f"{key}-degraded-{time.time_ns()}"
+    if resource_manager.rendered_profile != resource_manager.render_profile:
+        return preview_key
+    return key
+
+async def produce_video(resource_manager, key, timeout_minutes, folder_path, preview_key=None):
+    """
+    Generates the resources of a trend, renders its video and publishes it in the video store.
+
+    Args:
+    - resource_manager (AsyncResourceManager): The manager of the trend to render.
+    - key (str): The key of the video in the store.
+    - timeout_minutes (int): Time limit for the resource generation.
+    - folder_path (str): The job folder of the trend, protected from collection while the job runs.
+    - preview_key (str): The key of the preview of the trend, under which a preview rendered to meet the deadline is stored.
+
+    Returns:
+    - dict or None: The stored entry, None if the generation failed.
+    """
+    with storage_manager.in_use(folder_path):
+        output = await generate_resources_with_timeout(resource_manager, timeout_minutes)
+        if not output:
+            return None
+        video_path = await resource_manager.render_video_async(output)
+        if not video_path:
+            return None
+        description_text = f"```{output['Description']}\n\n🎵 Music: {output['MusicPath']['cc']}\n\n\n{output['Tags']}```"
+        entry = video_store.put(get_store_key(resource_manager, key, preview_key or key), video_path, description_text)
+    # The folder of a profiled job is left to the storage manager, so its profiles can be read.
+    if resource_manager.rendered_profile == "publish" and not resource_manager.profiling:
+        storage_manager.delete_later(output['Dir'])
+    # Preview resources are kept so the trend can be promoted to a publish render without scraping again.
+    return entry
+
+async def send_stored_video(bot, chat_id, key, entry):
+    """
+    Sends a stored video, reusing its Telegram file_id when it was already uploaded once.
+
+    Args:
+    - bot (Bot): The bot sending the video.
+    - chat_id (int): The chat to send the video to.
+    - key (str): The key of the video in the store.
+    - entry (dict): The stored entry.
+    """
+    if entry["file_id"]:
+        try:
+            await bot.send_video(chat_id=chat_id, video=entry["file_id"], caption=entry["caption"], parse_mode='MarkdownV2')
+            return
+        except BadRequest as e:
+            print(f"Stored file_id rejected, uploading the video again: {e}")
+    # The handle only lives for the duration of the upload.
+    with open(entry["path"], 'rb') as video_file:
+        message = await bot.send_video(chat_id=chat_id, video=video_file, caption=entry["caption"], parse_mode='MarkdownV2',
+                                       write_timeout=upload_timeout_seconds)
+    video_store.set_file_id(key, message.video.file_id)
+
+delivery_queue = DeliveryQueue(send_stored_video, workers=delivery_workers)
+
+def make_trend_job(trend_number, trend, date_string, render_profile="publish", profiling=None):
+    """
+    Builds the store key of a trend and the coroutine function rendering it.
+
+    Args:
+    - trend_number (int): Index of the trend.
+    - trend (str): Name of the trend.
+    - date_string (str): Date the trend refers to.
+    - render_profile (str): Render profile of the video, "preview" or "publish".
+    - profiling (bool): Whether the job is profiled, None to sample jobs at the rate set in the environment.
+
+    Returns:
+    - tuple: The video key and the coroutine function producing the video.
+    """
+    resource_manager = AsyncResourceManager(trend_number, client=http_client, render_profile=render_profile, profiling=profiling,
+                                            render_workers=render_workers, deadline_seconds=timeout_minutes * 60 - deadline_margin_seconds)
+    key = make_key(trend, date_string, resource_manager.config_hash())
+    preview_key = make_key(trend, date_string, resource_manager.config_hash("preview"))
+    return key, lambda: produce_video(resource_manager, key, timeout_minutes, get_media_folder_path(trend), preview_key)
+
+prerenderer = PreRenderer(video_store, make_trend_job, top_n=number_of_videos, max_concurrency=prerender_concurrency)
+
 async def send_videos_command(update, context):
     chat_id = update.effective_chat.id
-    number = 5
-    timer = 5
-    await context.bot.send_message(chat_id=chat_id, text=f"I will send you {number} videos, please wait...")
-    
-    for trend_number in range(number):
-        resource_manager = ResourceManager(trend_number)
-        await context.bot.send_message(chat_id=chat_id, text=f"I am producing {trend_number + 1}/{number} right now...")
+    number = number_of_videos
+    timer = timeout_minutes
+    profiling = True if "profiling" in (context.args or []) else None
+    with prerenderer.interactive():
+        await context.bot.send_message(chat_id=chat_id, text=f"I will send you {number} videos, please wait...")
+        trends = await asyncio.to_thread(get_trends)
+        date_string = datetime.now().strftime("%d-%m-%Y")
+        
+        # Finished videos are uploaded by the delivery queue while the next trends render.
+        deliveries = []
+        for trend_number in range(number):
+            key, create = make_trend_job(trend_number, trends[trend_number], date_string, profiling=profiling)
+            if not video_store.get(key):
+                await context.bot.send_message(chat_id=chat_id, text=f"I am producing {trend_number + 1}/{number} right now...")
+
+            try:
+                entry = await asyncio.wait_for(video_store.get_or_create(key, create), timeout=timer * 60)
+            except asyncio.TimeoutError:
+                await context.bot.send_message(chat_id=chat_id, text=f"Timeout occurred while generating resources for trend {trend_number + 1}. Moving to the next trend...")
+                continue
+            if entry:
+                deliveries.append(delivery_queue.submit(context.bot, chat_id, key, entry))
+        await asyncio.gather(*deliveries)
+
+async def preview_command(update, context):
+    chat_id = update.effective_chat.id
+    trend_number = int(context.args[0]) - 1 if context.args and context.args[0].isdigit() else 0
+    profiling = True if "profiling" in (context.args or []) else None
+    with prerenderer.interactive():
+        trends = await asyncio.to_thread(get_trends)
+        if not 0 <= trend_number < len(trends):
+            await context.bot.send_message(chat_id=chat_id, text=f"There are only {len(trends)} trends right now.")
+            return
+        date_string = datetime.now().strftime("%d-%m-%Y")
+        key, create = make_trend_job(trend_number, trends[trend_number], date_string, render_profile="preview", profiling=profiling)
+        await context.bot.send_message(chat_id=chat_id, text=f"I am producing a preview of trend {trend_number + 1}...")
 
-        task = asyncio.create_task(generate_resources_with_timeout(resource_manager, timer))
         try:
-            output = await asyncio.wait_for(task, timeout=timer * 60)
+            entry = await asyncio.wait_for(video_store.get_or_create(key, create), timeout=timeout_minutes * 60)
         except asyncio.TimeoutError:
-            await context.bot.send_message(chat_id=chat_id, text=f"Timeout occurred while generating resources for trend {trend_number + 1}. Moving to the next trend...")
-            continue
-        if output:
-            create_video_with_data(output)
-            delete_files_except_mp4(output["Dir"])
-            description_text = f"```{output['Description']}\n\n🎵 Music: {output['MusicPath']['cc']}\n\n\n{output['Tags']}```"
-            video_path = os.path.join(output['Dir'], "video.mp4")
-            if video_path:
-                try:
-                    await context.bot.send_video(chat_id=chat_id, video=open(video_path, 'rb'), caption=description_text, parse_mode='MarkdownV2')
-                    asyncio.sleep(10)
-                except TelegramError as e:
-                    print(f"Error sending video to Telegram: {e}")
-                finally:
-                    delete_folder(output['Dir'])
+            await context.bot.send_message(chat_id=chat_id, text=f"Timeout occurred while generating the preview of trend {trend_number + 1}.")
+            return
+        if entry:
+            await delivery_queue.submit(context.bot, chat_id, key, entry)
 
 async def start(update, context):
     await context.bot.send_message(chat_id=update.effective_chat.id, text="Hi I am FrameDeployerBot, if you want /help ask for it!")
 
-def start_bot():
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-    check_status()
-    
+async def warm_up_models(application):
+    # Loaded before polling starts, so the first command does not wait for them.
+    await asyncio.to_thread(warm_up)
+
+async def close_http_client(application):
+    await delivery_queue.stop()
+    await http_client.aclose()
+
+def build_application(token=TELEGRAM_BOT_TOKEN, base_url=None):
+    """
+    Builds the bot application with its handlers and background jobs.
+
+    Args:
+    - token (str): The bot token.
+    - base_url (str): Bot API endpoint, e.g. a local stand-in server; the Telegram one by default.
+
+    Returns:
+    - Application: The application, not started.
+    """
+    builder = Application.builder().token(token).post_init(warm_up_models).post_shutdown(close_http_client)
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build()
+
     # Register handlers
     application.add_handler(CommandHandler('start', start))
     application.add_handler(CommandHandler('send_videos', send_videos_command))
+    application.add_handler(CommandHandler('preview', preview_command))
     application.add_handler(CommandHandler('help', display_informations))
 
+    # Keep the top trends rendered in the background
+    application.job_queue.run_repeating(prerenderer.poll, interval=prerender_interval_minutes * 60, first=10)
+
+    # Keep the job folders under the storage quota
+    application.job_queue.run_repeating(storage_manager.poll, interval=storage_interval_minutes * 60, first=60)
+    return application
+
+def start_bot():
+    application = build_application()
+    check_status()
+
     # Start the bot
     application.run_polling()
 
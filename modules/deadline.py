@@ -0,0 +1,163 @@
+import asyncio
+import time
+
+# Expected seconds of each stage of a publish job, before any timing of the run is known.
+STAGE_ESTIMATES = {
+    "contents": 30,
+    "summary": 10,
+    "media": 45,
+    "sentiment": 2,
+    "speech": 20,
+    "music": 1,
+    "subtitles": 30,
+    "video_preview": 20,
+    "video_publish": 90,
+}
+PIPELINE_STAGES = ["contents", "summary", "media", "sentiment", "speech", "music", "subtitles"]
+# Fewest images a degraded video is made of.
+MIN_MEDIA = 4
+
+class DeadlineBudget:
+    def __init__(self, seconds, estimates=None, clock=time.monotonic):
+        """
+        Time budget of a job that must deliver a video before a deadline.
+
+        Each stage may use the time left once the later stages are provisioned for,
+        the render at its cheapest profile. The estimates of the stages are scaled by
+        how slow the stages of the run have been so far, so a run with slow scraping
+        also expects slow downloads and degrades earlier.
+
+        Args:
+        - seconds (float): Time from now to the deadline.
+        - estimates (dict): Expected seconds of each stage, STAGE_ESTIMATES by default.
+        - clock (callable): Monotonic clock, replaceable in tests.
+        """
+        self.clock = clock
+        self.deadline = clock() + seconds
+        self.estimates = dict(STAGE_ESTIMATES, **(estimates or {}))
+        self.observed = {}
+        self.done = set()
+        self.slowness = 1.0
+
+    def remaining(self):
+        """
+        Returns the seconds left before the deadline, negative once it passed.
+        """
+        return self.deadline - self.clock()
+
+    def record(self, stage, seconds):
+        """
+        Records the duration of a stage of the run, refining the estimates of the others.
+
+        Args:
+        - stage (str): The stage.
+        - seconds (float): Its duration.
+        """
+        self.done.add(stage)
+        self.observed[stage] = seconds
+        expected = sum(self.estimates.get(name, 0) for name in self.observed)
+        if expected > 0:
+            # Bounded, so that one outlier does not starve or flood the other stages.
+            self.slowness = min(max(sum(self.observed.values()) / expected, 0.5), 4.0)
+
+    def skip(self, stage):
+        """
+        Marks a stage that costs nothing in this run, e.g. restored from the manifest.
+        """
+        self.done.add(stage)
+
+    def projected(self, stages):
+        """
+        Estimates the seconds the given stages will take, the completed ones excluded.
+
+        Args:
+        - stages (list): The stages.
+
+        Returns:
+        - float: The expected duration.
+        """
+        return sum(self.estimates.get(stage, 0) for stage in stages if stage not in self.done) * self.slowness
+
+    def allowance(self, stage):
+        """
+        Returns the seconds a pipeline stage may take so that the later stages and a preview render still fit.
+
+        Args:
+        - stage (str): A stage of PIPELINE_STAGES.
+
+        Returns:
+        - float: The allowance, at least 0.
+        """
+        later = PIPELINE_STAGES[PIPELINE_STAGES.index(stage) + 1:] + ["video_preview"]
+        return max(self.remaining() - self.projected(later), 0.0)
+
+    def plan_media(self, number_of_media):
+        """
+        Chooses how many media to fetch, and whether video clips are affordable, within the media allowance.
+
+        Args:
+        - number_of_media (int): The number of media of an unhurried run.
+
+        Returns:
+        - tuple: The number of media, and whether to fetch video clips.
+        """
+        ratio = self.allowance("media") / max(self.projected(["media"]), 1e-6)
+        if ratio >= 1:
+            return number_of_media, True
+        return max(MIN_MEDIA, min(number_of_media, int(number_of_media * ratio))), False
+
+    def choose_render_profile(self, render_profile):
+        """
+        Falls back to the preview profile when the requested render no longer fits before the deadline.
+
+        Args:
+        - render_profile (str): The requested profile.
+
+        Returns:
+        - str: The profile to render with.
+        """
+        if render_profile != "preview" and self.remaining() < self.projected([f"video_{render_profile}"]):
+            return "preview"
+        return render_profile
+
+async def gather_until(awaitables, timeout, minimum=1):
+    """
+    Runs awaitables concurrently and returns the results ready by a timeout, cancelling the others.
+
+    Past the timeout, it keeps waiting until at least `minimum` results are ready (or
+    nothing is left running), so that a slow stage still yields something to work with.
+
+    Args:
+        awaitables (list): The awaitables.
+        timeout (float): Seconds to wait, None to wait for all of them.
+        minimum (int): Number of truthy results waited for past the timeout.
+
+    Returns:
+        list: The results in order, None for the ones cancelled or failed.
+    """
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    loop = asyncio.get_running_loop()
+    cutoff = None if timeout is None else loop.time() + timeout
+
+    def succeeded(task):
+        return task.done() and not task.cancelled() and task.exception() is None
+
+    pending = set(tasks)
+    try:
+        while pending:
+            remaining = None if cutoff is None else cutoff - loop.time()
+            if remaining is None:
+                await asyncio.wait(pending)
+            elif remaining > 0:
+                await asyncio.wait(pending, timeout=remaining)
+            elif sum(1 for task in tasks if succeeded(task) and task.result()) >= minimum:
+                break
+            else:
+                await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            pending = {task for task in pending if not task.done()}
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    return [task.result() if succeeded(task) else None for task in tasks]
@@ -0,0 +1,139 @@
+import asyncio
+import warnings
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+from modules.rate_limiter import TokenBucket, backoff_delay
+
+def get_retry_after_seconds(error):
+    """
+    Reads the delay requested by Telegram flood control, whichever type the library returns.
+
+    Args:
+        error (RetryAfter): The flood control error.
+
+    Returns:
+        float: Seconds to wait before retrying.
+    """
+    with warnings.catch_warnings():
+        # Reading an int is deprecated in favour of timedelta; both are accepted here.
+        warnings.simplefilter("ignore")
+        delay = error.retry_after
+    return delay.total_seconds() if hasattr(delay, "total_seconds") else float(delay)
+
+class DeliveryQueue:
+    def __init__(self, send, workers=2, global_rate=20, chat_rate=1, retries=4, backoff_base=2.0, backoff_max=60.0):
+        """
+        Queue of finished videos waiting to be sent, drained by a few concurrent workers.
+
+        Sends are throttled by a global token bucket and one per chat, as Telegram limits
+        both. Transient failures (flood control, network errors) are retried with the
+        stored video, without rendering it again. A timeout is not retried: the upload
+        may have reached Telegram, and sending it again could post the video twice.
+
+        Args:
+        - send (callable): Coroutine function taking (bot, chat_id, key, entry) and sending the video.
+        - workers (int): Number of sends in progress at once.
+        - global_rate (float): Sends per second allowed for the whole bot.
+        - chat_rate (float): Sends per second allowed in one chat.
+        - retries (int): Number of attempts per delivery.
+        - backoff_base (float): Delay cap of the first retry in seconds.
+        - backoff_max (float): Largest delay cap in seconds.
+        """
+        self.send = send
+        self.workers = workers
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_buckets = {}
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.queue = None
+        self.tasks = []
+
+    def start(self):
+        """
+        Starts the workers in the running event loop, if they are not running yet.
+        """
+        if self.tasks:
+            return
+        self.queue = asyncio.Queue()
+        self.tasks = [asyncio.ensure_future(self.work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """
+        Cancels the workers; deliveries still queued are abandoned.
+        """
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def submit(self, bot, chat_id, key, entry):
+        """
+        Queues the delivery of a stored video.
+
+        Args:
+        - bot (Bot): The bot sending the video.
+        - chat_id (int): The chat to send the video to.
+        - key (str): The key of the video in the store.
+        - entry (dict): The stored entry.
+
+        Returns:
+        - asyncio.Future: Resolves to True once sent, False if every attempt failed.
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((bot, chat_id, key, entry, future))
+        return future
+
+    async def deliver(self, bot, chat_id, key, entry):
+        """
+        Sends a video, waiting for the rate limits and retrying transient failures.
+
+        Args:
+        - bot (Bot): The bot sending the video.
+        - chat_id (int): The chat to send the video to.
+        - key (str): The key of the video in the store.
+        - entry (dict): The stored entry.
+
+        Returns:
+        - bool: Whether the video was sent.
+        """
+        chat_bucket = self.chat_buckets.setdefault(chat_id, TokenBucket(self.chat_rate, 1))
+        for attempt in range(self.retries):
+            await chat_bucket.acquire_async()
+            await self.global_bucket.acquire_async()
+            try:
+                await self.send(bot, chat_id, key, entry)
+                return True
+            except BadRequest as e:
+                # Raised for a malformed request, which a retry would not fix.
+                print(f"Telegram rejected {key} for {chat_id}: {e}")
+                return False
+            except TimedOut as e:
+                # The request may have completed after the client gave up on it.
+                print(f"Timed out while sending {key} to {chat_id}, not retrying to avoid a duplicate: {e}")
+                return False
+            except RetryAfter as e:
+                delay = get_retry_after_seconds(e)
+                print(f"Flood control while sending {key} to {chat_id}, retrying in {delay} seconds.")
+            except NetworkError as e:
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                print(f"Network error while sending {key} to {chat_id} (attempt {attempt + 1}): {e}")
+            if attempt < self.retries - 1:
+                await asyncio.sleep(delay)
+        print(f"Giving up sending {key} to {chat_id}.")
+        return False
+
+    async def work(self):
+        while True:
+            bot, chat_id, key, entry, future = await self.queue.get()
+            try:
+                result = await self.deliver(bot, chat_id, key, entry)
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                print(f"Error sending video to Telegram: {e}")
+                if not future.done():
+                    future.set_result(False)
+            finally:
+                self.queue.task_done()
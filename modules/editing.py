@@ -5,18 +5,54 @@ from PIL import Image
 import PIL.ImageFilter as ImageFilter
 import numpy as np
 import os
+import threading
+from concurrent.futures import FIRST_EXCEPTION, wait
+from contextlib import ExitStack, contextmanager
 import moviepy.config as mpy_config
 
 import conf
+from modules.audio_mixer import mix_narration_with_music, get_wav_duration
+from modules.frame_renderer import ClipOverlay, FrameCompositor, RenderCancelled, StaticOverlay, concat_videos, plan_chunks, write_video
+from modules.motion import make_ken_burns_clip, make_shrinking_clip
+from modules.video_ingest import make_video_clip
+from modules.warmup import get_worker_context, make_worker_pool
 
 mpy_config.change_settings({"IMAGEMAGICK_BINARY": conf.IMAGEMAGICK_BINARY})
 
-def convert_to_rgb_resize_and_blur(image_path):
+KEN_BURNS_ZOOM = 1.15
+# Chunk render processes allowed at once in this process, shared by its concurrent renders (e.g. in the bot).
+CHUNK_PROCESS_LIMIT = os.cpu_count() or 1
+# Backgrounds are prepared at the output resolution (times the zoom), so that the motion samples them
+# with the nearest filter, about one source pixel per output pixel, within its frame budget.
+BACKGROUND_SCALE = 1.0
+
+RENDER_PROFILES = {
+    # Quick check that the content of a trend is usable.
+    "preview": {
+        "size": (540, 960),
+        "fps": 12,
+        "preset": "ultrafast",
+        "ffmpeg_params": ["-crf", "32", "-tune", "fastdecode"],
+        "file_name": "preview.mp4",
+    },
+    # Final quality, sent to the users.
+    "publish": {
+        "size": (1080, 1920),
+        "fps": 24,
+        "preset": "medium",
+        "ffmpeg_params": None,
+        "file_name": "video.mp4",
+    },
+}
+
+def convert_to_rgb_resize_and_blur(image_path, new_height=1920, min_width=0):
     ''' 
     Convert the image to RGB format, resize while maintaining aspect ratio, and apply Gaussian blur.
     
     Parameters:
     - image_path (str): Path of the image to process.
+    - new_height (int): Height of the resized image, the blur radius scales with it.
+    - min_width (int): Minimum width of the resized image; narrower images are scaled up further.
     
     Returns:
     - blurred_img_np (np.ndarray): Numpy array of the processed image.
@@ -25,35 +61,55 @@ def convert_to_rgb_resize_and_blur(image_path):
     '''
     with Image.open(image_path) as img:
         original_width, original_height = img.size
-        new_height = 1920
         aspect_ratio = original_width / original_height
         new_width = int(new_height * aspect_ratio)
+        if new_width < min_width:
+            new_width, new_height = min_width, int(min_width / aspect_ratio)
         resized_img = img.convert('RGB').resize((new_width, new_height), Image.LANCZOS)
-        blurred_img = resized_img.filter(ImageFilter.GaussianBlur(radius=10))  
+        blurred_img = resized_img.filter(ImageFilter.GaussianBlur(radius=10 * new_height / 1920))  
         blurred_img_np = np.array(blurred_img)
         return blurred_img_np, new_width, new_height
 
-def edit_caption(txt):
+def cache_background(image_path, new_height=1920, min_width=0):
+    ''' 
+    Prepare the blurred background of an image once and store it as a .npy file next to the image.
+    
+    Parameters:
+    - image_path (str): Path of the image to process.
+    - new_height (int): Height of the background.
+    - min_width (int): Minimum width of the background.
+    
+    Returns:
+    - str: Path of the .npy file, meant to be memory-mapped while the image is on screen.
+    '''
+    background_path = f"{os.path.splitext(image_path)[0]}_{new_height}x{min_width}.npy"
+    if not os.path.exists(background_path) or os.path.getmtime(background_path) < os.path.getmtime(image_path):
+        blurred_img_np, new_width, new_height = convert_to_rgb_resize_and_blur(image_path, new_height, min_width)
+        np.save(background_path, blurred_img_np)
+    return background_path
+
+def edit_caption(txt, scale=1.0):
     ''' 
     Create a TextClip with the specified text, formatted in uppercase, centered, and styled with Arial-Bold font.
     
     Parameters:
     - txt (str): Text to display in the TextClip.
+    - scale (float): Scale of the caption relative to a 1080x1920 video.
     
     Returns:
     - TextClip: Generated TextClip object.
     '''
     txt = txt.upper()
-    max_text_width = 980
+    max_text_width = int(980 * scale)
     font_path = 'media\\props\\Comfortaa.ttf'
     
     return TextClip(
         txt,
         font="Impact",
-        fontsize=120,
+        fontsize=int(120 * scale),
         color='white',
         stroke_color='black',
-        stroke_width=2.5,
+        stroke_width=2.5 * scale,
         size=(max_text_width, None),
         align='North'
     ).set_position('center', 'center')
@@ -106,16 +162,17 @@ def make_textclip_with_stroke(sub):
     
     return composite_clip
 
-def add_title_with_background(title_text, duration):
+def add_title_with_background(title_text, duration, fps=24):
     """
     Create a title with a background rectangle that shrinks and disappears after the specified duration.
 
     Parameters:
     - title_text (str): The text to display as the title.
     - duration (int): Duration in seconds before the text shrinks and disappears.
+    - fps (int): Frame rate the shrinking is computed for.
 
     Returns:
-    - CompositeVideoClip: The final video clip with the title.
+    - VideoClip: The final video clip with the title.
     """
     txt_w = 720
     txt_h = 45
@@ -127,59 +184,217 @@ def add_title_with_background(title_text, duration):
     
     text_with_bg = CompositeVideoClip([rect_clip, txt_clip.set_position("center")])
     
-    def resize_clip(clip, t):
-        factor = max(0, 1 - t / duration)
-        return clip.resize(width=int(txt_w * factor), height=int(txt_h * factor))
-    
-    final_clip = text_with_bg.fl(resize_clip, apply_to=['mask'])
+    # The title is rendered once; the shrink only resizes that small still frame.
+    final_clip = make_shrinking_clip(text_with_bg.get_frame(0), text_with_bg.mask.get_frame(0), duration, fps)
     
     return final_clip
 
 
-def create_video_with_data(data):
-    ''' 
-    Create a video using provided data, combining images, audio, subtitles, and music.
-    
+def plan_render(data, profile="publish"):
+    '''
+    Prepares everything the frames of a video depend on, as plain data that can be sent to other processes.
+    The narration is mixed with the music and the backgrounds are cached once, here.
+
     Parameters:
     - data (dict): Dictionary containing paths to audio, music, subtitles, images, and other metadata.
+    - profile (str): Name of the render profile in RENDER_PROFILES, "preview" or "publish".
+
+    Returns:
+    - dict: The render plan, read by `build_compositor` and `render_frames`.
     '''
-    title_text = data["Trend_name"]
+    settings = RENDER_PROFILES[profile]
     audio_path = data['Audio']
     music_path = data["MusicPath"]["path"]
-    srt_path = data['Subs']
     images = data['Images']
     images_folder = os.path.dirname(images[0])
-    output_video_path = os.path.join(images_folder, "video.mp4")
-    
-    main_audio = AudioFileClip(audio_path)
-    background_music = AudioFileClip(music_path).volumex(0.08)
-    final_audio = CompositeAudioClip([main_audio, background_music.set_duration(main_audio.duration)])
-    
-    audio_duration = main_audio.duration
+
+    mixed_audio_path = mix_narration_with_music(audio_path, music_path, os.path.join(images_folder, "mixed.wav"))
+
+    audio_duration = get_wav_duration(mixed_audio_path)
     total_video_duration = audio_duration + 4
     base_image_duration = (total_video_duration - 4) / len(images)
-    
-    video_size = (1080, 1920)
-    frame_path = 'media/props/frame.png'
-    frame_clip = ImageClip(frame_path).set_duration(total_video_duration).resize(video_size)
-    
-    image_clips = []
+
+    video_size = settings["size"]
+    backgrounds = []
     for index, image_path in enumerate(images):
         image_duration = base_image_duration
         if index == 0 or index == len(images) - 1:
             image_duration += 2
-        
-        resized_img, new_width, new_height = convert_to_rgb_resize_and_blur(image_path)
-        img_clip = ImageClip(resized_img).set_position(('center', 'center')).set_duration(image_duration)
-        image_clips.append(img_clip.set_start((index * base_image_duration) if index != 0 else 0))
-    
-    video_clip = CompositeVideoClip(image_clips, size=video_size)
-    video_clip = video_clip.set_duration(total_video_duration)
-    video_clip = video_clip.set_audio(final_audio)
-    
-    subs = SubtitlesClip(srt_path, edit_caption).set_position(('center', 580))
+        if not image_path.lower().endswith(".mp4"):
+            background_scale = KEN_BURNS_ZOOM * BACKGROUND_SCALE
+            image_path = cache_background(image_path, int(video_size[1] * background_scale), int(video_size[0] * background_scale))
+        backgrounds.append({"path": image_path, "start": (index * base_image_duration) if index != 0 else 0, "duration": image_duration})
+
+    return {
+        "size": video_size,
+        "fps": settings["fps"],
+        "preset": settings["preset"],
+        "ffmpeg_params": settings["ffmpeg_params"],
+        "duration": total_video_duration,
+        "backgrounds": backgrounds,
+        "subtitles": data['Subs'],
+        "frame_path": 'media/props/frame.png',
+        "audio_path": mixed_audio_path,
+        "output_path": os.path.join(images_folder, settings["file_name"]),
+    }
+
+def build_compositor(plan):
+    '''
+    Builds the compositor of a render plan. Backgrounds are memory-mapped, and each frame copies only its crop box.
+    The compositor owns every clip it is built from and closes them with itself; if building
+    fails halfway, the clips already made are closed before the error propagates.
+
+    Parameters:
+    - plan (dict): Output of `plan_render`.
+
+    Returns:
+    - FrameCompositor: The compositor of the video frames, to close or use as a context manager.
+    '''
+    video_size = plan["size"]
+    fps = plan["fps"]
+    scale = video_size[1] / 1920
+
+    with ExitStack() as stack:
+        background_clips = []
+        for index, background in enumerate(plan["backgrounds"]):
+            if background["path"].lower().endswith(".mp4"):
+                img_clip = make_video_clip(background["path"], video_size, background["duration"], fps)
+            else:
+                img_clip = make_ken_burns_clip(background["path"], video_size, background["duration"], fps, zoom=KEN_BURNS_ZOOM,
+                                               zoom_in=index % 2 == 0, pan=0.5 if index % 4 < 2 else -0.5)
+            stack.callback(img_clip.close)
+            background_clips.append(img_clip.set_start(background["start"]))
 
-    final_clip = CompositeVideoClip([video_clip, frame_clip, subs], size=video_size)
+        overlays = [StaticOverlay(plan["frame_path"], video_size)]
+        if plan["subtitles"]:
+            subs = SubtitlesClip(plan["subtitles"], lambda txt: edit_caption(txt, scale)).set_position(('center', int(580 * scale)))
+            overlays.append(ClipOverlay(subs))
+            stack.callback(overlays[-1].close)
+        compositor = FrameCompositor(video_size, background_clips, overlays)
+        # From here on, the compositor closes the clips.
+        stack.pop_all()
+    return compositor
+
+def render_frames(plan, output_path, start_frame=0, end_frame=None, audio_path=None, cancel_event=None):
+    '''
+    Renders and encodes a range of frames of a render plan.
+
+    Parameters:
+    - plan (dict): Output of `plan_render`.
+    - output_path (str): Path of the mp4 to write.
+    - start_frame (int): First frame to render.
+    - end_frame (int): Frame after the last one to render, the end of the video by default.
+    - audio_path (str): Audio track to mux, None for a silent video.
+    - cancel_event (threading.Event): Stops the render between two frames when set.
+
+    Returns:
+    - str: Path of the rendered video.
+    '''
+    return write_video(build_compositor(plan), plan["duration"], plan["fps"], output_path, audio_path,
+                       preset=plan["preset"], ffmpeg_params=plan["ffmpeg_params"], cancel_event=cancel_event,
+                       start_frame=start_frame, end_frame=end_frame)
+
+chunk_cancel_event = None
+
+def set_chunk_cancel_event(event):
+    '''
+    Initializer of the chunk render processes, sharing the event that cancels the render.
+    '''
+    global chunk_cancel_event
+    chunk_cancel_event = event
+
+def render_chunk(plan, start_frame, end_frame, output_path):
+    '''
+    Renders a chunk of the video in a chunk render process.
+    '''
+    return render_frames(plan, output_path, start_frame, end_frame, cancel_event=chunk_cancel_event)
+
+def render_chunked(plan, workers, cancel_event=None):
+    '''
+    Renders a video in chunks split at image boundaries, each chunk in its own process,
+    then joins the chunks without re-encoding and muxes the mixed audio.
+
+    Parameters:
+    - plan (dict): Output of `plan_render`.
+    - workers (int): Number of chunk render processes.
+    - cancel_event (threading.Event): Stops every chunk between two frames when set.
+
+    Returns:
+    - str: Path of the rendered video.
+    '''
+    fps = plan["fps"]
+    total_frames = int(plan["duration"] * fps + 1e-6)
+    boundaries = [round(background["start"] * fps) for background in plan["backgrounds"][1:]]
+    chunks = plan_chunks(total_frames, boundaries, workers)
+    folder = os.path.dirname(plan["output_path"])
+    chunk_paths = [os.path.join(folder, f"chunk_{index}.mp4") for index in range(len(chunks))]
+
+    # The workers start warm from a clean process, even when the caller runs threads (e.g. the bot executor).
+    chunks_cancelled = get_worker_context().Event()
+    try:
+        with make_worker_pool(len(chunks), set_chunk_cancel_event, (chunks_cancelled,)) as executor:
+            pending = {executor.submit(render_chunk, plan, start, end, path) for (start, end), path in zip(chunks, chunk_paths)}
+            try:
+                while pending:
+                    done, pending = wait(pending, timeout=0.5, return_when=FIRST_EXCEPTION)
+                    for future in done:
+                        future.result()
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise RenderCancelled(f"Render of {plan['output_path']} cancelled")
+            except BaseException:
+                chunks_cancelled.set()
+                raise
+        return concat_videos(chunk_paths, plan["output_path"], plan["audio_path"])
+    finally:
+        for chunk_path in chunk_paths:
+            if os.path.exists(chunk_path):
+                os.remove(chunk_path)
+
+chunk_processes_lock = threading.Lock()
+chunk_processes_running = 0
+
+@contextmanager
+def reserve_chunk_processes(wanted):
+    '''
+    Reserves chunk render processes within CHUNK_PROCESS_LIMIT, without waiting for them.
+    Concurrent renders share the limit, so together they do not start more processes than there are CPUs.
+
+    Parameters:
+    - wanted (int): Number of chunk render processes wanted.
+
+    Returns:
+    - int: Number of processes granted, at most `wanted`; 1 or less means rendering in the calling process.
+    '''
+    global chunk_processes_running
+    with chunk_processes_lock:
+        granted = min(wanted, CHUNK_PROCESS_LIMIT - chunk_processes_running)
+        # A single process brings nothing over the calling one, which renders without a reservation.
+        granted = granted if granted > 1 else 0
+        chunk_processes_running += granted
+    try:
+        yield max(granted, 1)
+    finally:
+        with chunk_processes_lock:
+            chunk_processes_running -= granted
+
+def create_video_with_data(data, profile="publish", cancel_event=None, workers=1):
+    ''' 
+    Create a video using provided data, combining images, audio, subtitles, and music.
+    Video segments (.mp4) in the media list are streamed frame by frame instead of being loaded.
     
-    final_clip.write_videofile(output_video_path, fps=24)
+    Parameters:
+    - data (dict): Dictionary containing paths to audio, music, subtitles, images, and other metadata.
+    - profile (str): Name of the render profile in RENDER_PROFILES, "preview" or "publish".
+    - cancel_event (threading.Event): Stops the render between two frames when set.
+    - workers (int): Number of processes rendering chunks of the video, 1 to render in this process.
+      Fewer are used while other renders of the process hold the chunk processes.
 
+    Returns:
+    - str: Path of the rendered video.
+    '''
+    plan = plan_render(data, profile)
+    if workers > 1 and len(plan["backgrounds"]) > 1:
+        with reserve_chunk_processes(workers) as granted:
+            if granted > 1:
+                return render_chunked(plan, granted, cancel_event)
+    return render_frames(plan, plan["output_path"], audio_path=plan["audio_path"], cancel_event=cancel_event)
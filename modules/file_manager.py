@@ -1,7 +1,46 @@
+import json
 import os
 import shutil
+import tempfile
 from datetime import datetime
 
+def get_media_folder_path(trend):
+    """
+    Returns the folder path used for the media of a trend on the current date.
+
+    Args:
+        trend (str): The trend or topic name.
+
+    Returns:
+        str: The path of the trend folder (not created).
+    """
+    date_string = datetime.now().strftime("%d-%m-%Y")
+    return os.path.join("media", f"{trend} {date_string}")
+
+def write_json_atomically(path, data, indent=2):
+    """
+    Writes a JSON file atomically, so that a reader sees the old or the new file, never a partial one.
+
+    The data is written to a temp file of its own next to the file, then moved over it,
+    so concurrent writers (threads or processes) never write into the same temp file.
+
+    Args:
+        path (str): Path of the JSON file.
+        data: The data to write.
+        indent (int): Indentation of the JSON, None for a compact file.
+    """
+    folder = os.path.dirname(path) or "."
+    os.makedirs(folder, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=folder, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(handle, "w", encoding="utf-8") as file:
+            json.dump(data, file, ensure_ascii=False, indent=indent)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
 def create_media_folder(trend):
     """
     Creates a folder for media based on the trend name and current date.
@@ -12,8 +51,7 @@ def create_media_folder(trend):
     Returns:
         str: The path to the created folder.
     """
-    date_string = datetime.now().strftime("%d-%m-%Y")
-    folder_path = os.path.join("media", f"{trend} {date_string}")
+    folder_path = get_media_folder_path(trend)
     if not os.path.exists(folder_path):
         os.makedirs(folder_path)
     return folder_path
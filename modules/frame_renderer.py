@@ -0,0 +1,309 @@
+import os
+import subprocess
+import numpy as np
+from PIL import Image
+from imageio_ffmpeg import get_ffmpeg_exe
+
+class RenderCancelled(Exception):
+    pass
+
+POSITIONS = {
+    'center': ('center', 'center'),
+    'left': ('left', 'center'),
+    'right': ('right', 'center'),
+    'top': ('center', 'top'),
+    'bottom': ('center', 'bottom'),
+}
+
+class StaticOverlay:
+    def __init__(self, image_path, size):
+        """
+        Still RGBA overlay, e.g. the frame drawn over the whole video.
+
+        The overlay is premultiplied once as 16-bit integers so that blending it is a few
+        in-place integer operations on a reused scratch buffer.
+
+        Args:
+        - image_path (str): Path of the RGBA image.
+        - size (tuple): Width and height of the video.
+        """
+        with Image.open(image_path) as image:
+            rgba = np.asarray(image.convert('RGBA').resize(size, Image.LANCZOS))
+        alpha = rgba[..., 3:].astype(np.uint16)
+        self.premultiplied = rgba[..., :3] * alpha
+        self.inverse_alpha = 255 - alpha
+        self.scratch = np.empty(self.premultiplied.shape, dtype=np.uint16)
+
+    def blend_into(self, buffer, t):
+        """
+        Blends the overlay into a frame in place.
+
+        Args:
+        - buffer (np.ndarray): The uint8 RGB frame.
+        - t (float): Time of the frame, unused for a still overlay.
+        """
+        np.multiply(buffer, self.inverse_alpha, out=self.scratch)
+        np.add(self.scratch, self.premultiplied, out=self.scratch)
+        # Rounded division by 255 without leaving uint16.
+        np.add(self.scratch, 128, out=self.scratch)
+        np.add(self.scratch, self.scratch >> 8, out=self.scratch)
+        np.right_shift(self.scratch, 8, out=self.scratch)
+        np.copyto(buffer, self.scratch, casting='unsafe')
+
+class ClipOverlay:
+    def __init__(self, clip):
+        """
+        MoviePy clip with a mask blended over the frame, e.g. the subtitles.
+
+        Args:
+        - clip (VideoClip): The clip, positioned with `set_position`.
+        """
+        self.clip = clip
+
+    def get_position(self, t, frame_size, clip_size):
+        """
+        Resolves the position of the clip as MoviePy does for named positions.
+
+        Args:
+        - t (float): Time relative to the clip start.
+        - frame_size (tuple): Height and width of the frame.
+        - clip_size (tuple): Height and width of the clip frame.
+
+        Returns:
+        - tuple: Left and top offsets in pixels.
+        """
+        position = self.clip.pos(t)
+        if isinstance(position, str):
+            position = POSITIONS[position]
+        x, y = position
+        if isinstance(x, str):
+            x = {'left': 0, 'center': (frame_size[1] - clip_size[1]) / 2, 'right': frame_size[1] - clip_size[1]}[x]
+        if isinstance(y, str):
+            y = {'top': 0, 'center': (frame_size[0] - clip_size[0]) / 2, 'bottom': frame_size[0] - clip_size[0]}[y]
+        return int(x), int(y)
+
+    def blend_into(self, buffer, t):
+        """
+        Blends the clip frame into the region of the frame it covers, in place.
+
+        Args:
+        - buffer (np.ndarray): The uint8 RGB frame.
+        - t (float): Time of the frame.
+        """
+        if not self.clip.is_playing(t):
+            return
+        clip_time = t - self.clip.start
+        image = self.clip.get_frame(clip_time)
+        mask = self.clip.mask.get_frame(clip_time) if self.clip.mask else np.ones(image.shape[:2])
+        left, top = self.get_position(clip_time, buffer.shape[:2], image.shape[:2])
+
+        x0, y0 = max(left, 0), max(top, 0)
+        x1 = min(left + image.shape[1], buffer.shape[1])
+        y1 = min(top + image.shape[0], buffer.shape[0])
+        if x1 <= x0 or y1 <= y0:
+            return
+        image = image[y0 - top:y1 - top, x0 - left:x1 - left]
+        mask = mask[y0 - top:y1 - top, x0 - left:x1 - left, None].astype(np.float32)
+        region = buffer[y0:y1, x0:x1]
+        region[:] = region + (image - region.astype(np.float32)) * mask
+
+    def close(self):
+        """
+        Closes the clip and the clips it cached, e.g. the text clip of each subtitle.
+
+        A SubtitlesClip keeps its text clips in a dict referenced from its own frame
+        function; the cycle would hold their frames until the garbage collector runs.
+        """
+        cached_clips = getattr(self.clip, "textclips", None)
+        if cached_clips:
+            for text_clip in cached_clips.values():
+                text_clip.close()
+            cached_clips.clear()
+        self.clip.close()
+
+class FrameCompositor:
+    def __init__(self, size, backgrounds, overlays):
+        """
+        Composites the frames of the video into one preallocated buffer reused for every frame.
+
+        Backgrounds are opaque full-frame clips, so only the topmost playing one is drawn;
+        a background is closed as soon as the render has gone past its end so that its
+        source memory is released. Used as a context manager, the compositor closes every
+        clip it holds when the block exits, whether the render succeeded or not.
+
+        Args:
+        - size (tuple): Width and height of the video.
+        - backgrounds (list): Full-frame clips with their start times, later ones on top.
+        - overlays (list): StaticOverlay or ClipOverlay objects, drawn in order.
+        """
+        self.size = size
+        self.backgrounds = list(backgrounds)
+        self.overlays = overlays
+        self.buffer = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+        self.released = set()
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def render(self, t):
+        """
+        Renders the frame at a time into the shared buffer.
+
+        Args:
+        - t (float): Time of the frame; the render is expected to move forward.
+
+        Returns:
+        - np.ndarray: The buffer, valid until the next call.
+        """
+        background = None
+        for index, clip in enumerate(self.backgrounds):
+            if clip.end is not None and clip.end <= t:
+                if index not in self.released:
+                    clip.close()
+                    self.released.add(index)
+            elif clip.is_playing(t):
+                background = clip
+        if background is None:
+            self.buffer.fill(0)
+        else:
+            np.copyto(self.buffer, background.get_frame(t - background.start), casting='unsafe')
+        for overlay in self.overlays:
+            overlay.blend_into(self.buffer, t)
+        return self.buffer
+
+    def close(self):
+        """
+        Closes every background still open and the overlays, and drops the frame buffer,
+        so that a compositor kept alive (e.g. by the traceback of a failed render) holds no
+        memory. Closing twice does nothing.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        for index, clip in enumerate(self.backgrounds):
+            if index not in self.released:
+                clip.close()
+                self.released.add(index)
+        for overlay in self.overlays:
+            if hasattr(overlay, "close"):
+                overlay.close()
+        self.backgrounds = []
+        self.overlays = []
+        self.buffer = None
+
+def write_video(compositor, duration, fps, output_path, audio_path=None, preset="medium", ffmpeg_params=None, cancel_event=None,
+                start_frame=0, end_frame=None):
+    """
+    Encodes the frames of a compositor with ffmpeg, muxing the audio track.
+
+    Each frame is written to the encoder pipe straight from the compositor buffer
+    through a memoryview, without converting or copying it. The compositor is closed and
+    the encoder is reaped with its pipes closed on success, failure and cancellation;
+    a failed or cancelled render removes the file it started.
+
+    Args:
+        compositor (FrameCompositor): The compositor producing the frames.
+        duration (float): Duration of the video in seconds.
+        fps (int): Frame rate of the video.
+        output_path (str): Path of the mp4 to write.
+        audio_path (str): Path of the audio track, None for a silent video.
+        preset (str): x264 preset.
+        ffmpeg_params (list): Extra ffmpeg output parameters, e.g. ["-crf", "23"].
+        cancel_event (threading.Event): Stops the render between two frames when set.
+        start_frame (int): First frame to encode, to render a chunk of the video.
+        end_frame (int): Frame after the last one to encode, the end of the video by default.
+
+    Returns:
+        str: The path of the video.
+    """
+    if end_frame is None:
+        end_frame = int(duration * fps + 1e-6)
+    width, height = compositor.size
+    command = [
+        get_ffmpeg_exe(), "-v", "error", "-y",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+    ]
+    if audio_path:
+        command += ["-i", audio_path, "-c:a", "aac", "-b:a", "192k"]
+    command += ["-c:v", "libx264", "-preset", preset, "-pix_fmt", "yuv420p", "-movflags", "+faststart"] + list(ffmpeg_params or []) + [output_path]
+
+    written = False
+    with compositor, subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE) as process:
+        try:
+            for index in range(start_frame, end_frame):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise RenderCancelled(f"Render of {output_path} cancelled at frame {index}")
+                process.stdin.write(memoryview(compositor.render(index / fps)))
+            process.stdin.close()
+            error = process.stderr.read()
+            if process.wait() != 0:
+                raise IOError(f"ffmpeg failed to write {output_path}: {error.decode(errors='ignore').strip()}")
+            written = True
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            try:
+                process.stdin.close()
+            except OSError:
+                # The encoder is gone with frames still buffered for it; closing drops them.
+                pass
+            # An interrupted or failed render leaves a truncated file behind.
+            if not written and os.path.exists(output_path):
+                os.remove(output_path)
+    return output_path
+
+def plan_chunks(total_frames, boundaries, chunks):
+    """
+    Splits the frames of a video into contiguous chunks of similar length, cutting only at boundaries.
+
+    Args:
+        total_frames (int): Number of frames of the video.
+        boundaries (list): Frames where a cut is allowed, e.g. where an image starts.
+        chunks (int): Number of chunks wanted.
+
+    Returns:
+        list: The (start, end) frame ranges, at most `chunks` of them.
+    """
+    candidates = sorted({boundary for boundary in boundaries if 0 < boundary < total_frames})
+    cuts = set()
+    for index in range(1, chunks):
+        if not candidates:
+            break
+        target = total_frames * index / chunks
+        cuts.add(min(candidates, key=lambda boundary: abs(boundary - target)))
+    edges = [0] + sorted(cuts) + [total_frames]
+    return list(zip(edges[:-1], edges[1:]))
+
+def concat_videos(chunk_paths, output_path, audio_path=None):
+    """
+    Joins videos encoded with identical parameters without re-encoding them, muxing an audio track.
+
+    Args:
+        chunk_paths (list): Paths of the videos, in order.
+        output_path (str): Path of the mp4 to write.
+        audio_path (str): Path of the audio track, None for a silent video.
+
+    Returns:
+        str: The path of the video.
+    """
+    list_path = output_path + ".concat.txt"
+    with open(list_path, "w", encoding="utf-8") as file:
+        for chunk_path in chunk_paths:
+            escaped_path = os.path.abspath(chunk_path).replace("'", "'\\''")
+            file.write(f"file '{escaped_path}'\n")
+    command = [get_ffmpeg_exe(), "-v", "error", "-y", "-f", "concat", "-safe", "0", "-i", list_path]
+    if audio_path:
+        command += ["-i", audio_path, "-map", "0:v:0", "-map", "1:a:0", "-c:a", "aac", "-b:a", "192k"]
+    command += ["-c:v", "copy", "-movflags", "+faststart", output_path]
+    try:
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    finally:
+        os.remove(list_path)
+    if result.returncode != 0:
+        raise IOError(f"ffmpeg failed to join {output_path}: {result.stderr.decode(errors='ignore').strip()}")
+    return output_path
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import time
+from modules.file_manager import write_json_atomically
+
+MANIFEST_NAME = "manifest.json"
+
+def hash_file(file_path, chunk_size=65536):
+    """
+    Computes the SHA-256 hash of a file, reading it in chunks.
+
+    Args:
+        file_path (str): Path of the file to hash.
+        chunk_size (int): Number of bytes read at a time.
+
+    Returns:
+        str or None: The hex digest of the file, or None if the file does not exist.
+    """
+    if not os.path.isfile(file_path):
+        return None
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class JobManifest:
+    def __init__(self, directory):
+        """
+        Loads (or starts) the manifest of completed stages stored in a trend directory.
+
+        Args:
+        - directory (str): The trend directory the manifest belongs to.
+        """
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self.stages = {}
+        self.load()
+
+    def load(self):
+        """
+        Reads the manifest from disk. A missing or corrupted manifest is treated as empty.
+        """
+        if not os.path.exists(self.path):
+            self.stages = {}
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                self.stages = json.load(file).get("stages", {})
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable manifest {self.path}: {e}")
+            self.stages = {}
+
+    def save(self):
+        """
+        Writes the manifest atomically so that a crash never leaves a half-written file.
+        """
+        write_json_atomically(self.path, {"stages": self.stages})
+
+    def inputs_digest(self, stages):
+        """
+        Hashes the recorded outputs of the stages another stage depends on.
+
+        The digest covers the values and artifact hashes, not the completion times, so
+        an upstream stage rerun with identical results keeps its downstream stages valid.
+
+        Args:
+        - stages (list): Names of the upstream stages.
+
+        Returns:
+        - str: Hex digest of their outputs.
+        """
+        entries = [[stage, self.stages.get(stage, {}).get("value"), self.stages.get(stage, {}).get("artifacts")] for stage in stages]
+        return hashlib.sha256(json.dumps(entries, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def is_complete(self, stage, inputs=None):
+        """
+        Checks whether a stage was completed from the same inputs and all of its artifacts are still intact.
+
+        Args:
+        - stage (str): Name of the stage.
+        - inputs (str): Digest of the upstream outputs, see `inputs_digest`; None to ignore the inputs.
+
+        Returns:
+        - bool: True if the stage can be skipped on a rerun.
+        """
+        entry = self.stages.get(stage)
+        if entry is None:
+            return False
+        if inputs is not None and entry.get("inputs") != inputs:
+            return False
+        for artifact_path, artifact_hash in entry.get("artifacts", {}).items():
+            if hash_file(artifact_path) != artifact_hash:
+                return False
+        return True
+
+    def get(self, stage):
+        """
+        Returns the value recorded for a completed stage.
+
+        Args:
+        - stage (str): Name of the stage.
+
+        Returns:
+        - The JSON-serializable value recorded by `record`, or None.
+        """
+        entry = self.stages.get(stage)
+        return entry["value"] if entry else None
+
+    def record(self, stage, value, artifacts=(), seconds=None, inputs=None):
+        """
+        Marks a stage as completed, storing its value and the hashes of its artifacts.
+
+        Args:
+        - stage (str): Name of the stage.
+        - value: JSON-serializable output of the stage.
+        - artifacts (iterable): Paths of the files produced by the stage.
+        - seconds (float): Time the stage took, if measured.
+        - inputs (str): Digest of the upstream outputs the stage was computed from.
+        """
+        self.stages[stage] = {
+            "value": value,
+            "artifacts": {path: hash_file(path) for path in artifacts},
+            "completed_at": time.time(),
+            "seconds": seconds,
+            "inputs": inputs,
+        }
+        self.save()
+
+    def invalidate(self, stage):
+        """
+        Forgets a stage so that it is executed again on the next run.
+
+        Args:
+        - stage (str): Name of the stage.
+        """
+        if self.stages.pop(stage, None) is not None:
+            self.save()
+
+    def stage_seconds(self):
+        """
+        Returns the measured duration of every completed stage.
+
+        Returns:
+        - dict: Stage names mapped to seconds, for the stages that were timed.
+        """
+        return {stage: entry["seconds"] for stage, entry in self.stages.items() if entry.get("seconds") is not None}
@@ -0,0 +1,140 @@
+import bisect
+import re
+
+WORD_BOUNDARY = re.compile(r"\b")
+
+def build_trie(keywords):
+    """
+    Builds a character trie of the keywords.
+
+    Args:
+        keywords (iterable): The keywords, already lowercased.
+
+    Returns:
+        dict: Nested dicts keyed by character; the key "" marks the end of a keyword and holds it.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = keyword
+    return trie
+
+def build_trie_pattern(keywords):
+    """
+    Builds a regular expression matching any of the keywords, factored as a trie.
+
+    Sharing the prefixes keeps the alternation cheap to evaluate even with thousands
+    of keywords, since the regex engine never retries a prefix it already matched.
+
+    Args:
+        keywords (iterable): The keywords, already lowercased.
+
+    Returns:
+        str: The pattern, without groups other than non-capturing ones.
+    """
+    trie = build_trie(keywords)
+
+    def to_pattern(node):
+        is_end = "" in node
+        branches = [re.escape(char) + to_pattern(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if is_end:
+            return "(?:" + body + ")?" if len(branches) == 1 else body + "?"
+        return body
+
+    return to_pattern(trie)
+
+class KeywordMatcher:
+    def __init__(self, keywords, whole_words=True):
+        """
+        Compiles a list of keywords into a single case-insensitive matcher.
+
+        Args:
+        - keywords (iterable): The keywords; their order is their priority in `first_keyword`.
+        - whole_words (bool): Whether keywords must match whole words or any substring.
+        """
+        self.keywords = list(keywords)
+        self.whole_words = whole_words
+        self.priorities = {}
+        for index, keyword in enumerate(self.keywords):
+            self.priorities.setdefault(keyword.lower(), index)
+        self.trie = build_trie(self.priorities)
+        pattern = build_trie_pattern(self.priorities)
+        if whole_words:
+            pattern = r"\b" + pattern + r"\b"
+        # The lookahead finds every offset where a keyword starts, overlapping ones included.
+        self.regex = re.compile("(?=" + pattern + ")", re.IGNORECASE)
+
+    def finditer(self, text):
+        """
+        Scans a text once, yielding every keyword occurrence, as a substring scan over each keyword would.
+
+        The regex only finds the offsets where some keyword starts; from each of them the
+        trie is walked to report every keyword ending on the path, so that a keyword which
+        is a prefix of a longer one (e.g. "sub" and "subscription") is reported as well.
+
+        Args:
+        - text (str): The text to scan.
+
+        Yields:
+        - tuple: Start offset, end offset and index of the keyword found, shortest first at each offset.
+        """
+        for match in self.regex.finditer(text):
+            start = match.start()
+            node = self.trie
+            position = start
+            while node:
+                if "" in node and (not self.whole_words or WORD_BOUNDARY.match(text, position)):
+                    yield start, position, self.priorities[node[""]]
+                if position == len(text):
+                    break
+                node = node.get(text[position].lower())
+                position += 1
+
+    def search(self, text):
+        """
+        Checks whether a text contains any keyword.
+
+        Args:
+        - text (str): The text to scan.
+
+        Returns:
+        - bool: True if at least one keyword occurs.
+        """
+        return self.regex.search(text) is not None
+
+    def first_keyword(self, text):
+        """
+        Returns the keyword with the highest priority occurring in a text.
+
+        Args:
+        - text (str): The text to scan.
+
+        Returns:
+        - str or None: The keyword, None if no keyword occurs.
+        """
+        indexes = [index for _, _, index in self.finditer(text)]
+        return self.keywords[min(indexes)] if indexes else None
+
+    def filter_spans(self, text, spans):
+        """
+        Finds which spans of a text contain no keyword, scanning the text only once.
+
+        Args:
+        - text (str): The text to scan.
+        - spans (list): Sorted, non-overlapping (start, end) offsets, e.g. of sentences.
+
+        Returns:
+        - list: The spans without any keyword occurrence.
+        """
+        starts = [start for start, _ in spans]
+        flagged = set()
+        for start, end, _ in self.finditer(text):
+            position = bisect.bisect_right(starts, start) - 1
+            if position >= 0 and end <= spans[position][1]:
+                flagged.add(position)
+        return [span for position, span in enumerate(spans) if position not in flagged]
@@ -0,0 +1,253 @@
+import io
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+import numpy as np
+import requests
+from PIL import Image
+from modules.file_manager import write_json_atomically
+
+HASH_INDEX_PATH = os.path.join("media", "store", "media_hashes.json")
+COMMONS_UPLOAD_PREFIX = "https://upload.wikimedia.org/wikipedia/commons/"
+THUMBNAIL_WIDTH = 120
+# Hamming distance between two 64-bit dHashes below which two images are considered the same visual.
+MAX_DISTANCE = 10
+# Number of candidates searched per wanted image, so that enough remain once near-duplicates are dropped.
+CANDIDATE_FACTOR = 2
+# Number of thumbnails downloaded at once by `deduplicate_media`.
+THUMBNAIL_WORKERS = 8
+
+def get_thumbnail_url(url, width=THUMBNAIL_WIDTH):
+    """
+    Builds the URL of a Wikimedia Commons thumbnail from the URL of the original file.
+
+    Args:
+        url (str): URL of the original file, e.g. https://upload.wikimedia.org/wikipedia/commons/a/ab/Name.jpg.
+        width (int): Width of the thumbnail.
+
+    Returns:
+        str or None: The thumbnail URL, None if the URL is not a Commons upload.
+    """
+    if not url.startswith(COMMONS_UPLOAD_PREFIX):
+        return None
+    path = url[len(COMMONS_UPLOAD_PREFIX):]
+    if path.startswith("thumb/") or path.count("/") != 2:
+        return None
+    file_name = path.rsplit("/", 1)[1]
+    return f"{COMMONS_UPLOAD_PREFIX}thumb/{path}/{width}px-{file_name}"
+
+def dhash_pixels(pixels):
+    """
+    Computes the difference hashes of grayscale images.
+
+    Args:
+        pixels (numpy.ndarray): Images of shape (n, 8, 9), one row of 9 pixels per hash row.
+
+    Returns:
+        numpy.ndarray: One 64-bit hash per image, as uint64.
+    """
+    bits = pixels[:, :, 1:] > pixels[:, :, :-1]
+    packed = np.packbits(bits.reshape(len(pixels), 64), axis=1)
+    return packed.view(">u8").reshape(-1).astype(np.uint64)
+
+def dhash_image(data):
+    """
+    Computes the difference hash of an encoded image.
+
+    Args:
+        data (bytes): The encoded image, e.g. a JPEG thumbnail.
+
+    Returns:
+        int or None: The 64-bit hash, None if the image cannot be decoded.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.draft("L", (18, 16))
+            pixels = np.asarray(image.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    except (OSError, ValueError) as e:
+        print(f"Unable to hash a thumbnail: {e}")
+        return None
+    return int(dhash_pixels(pixels[np.newaxis])[0])
+
+def hamming_distances(hashes, value):
+    """
+    Counts the differing bits between a hash and many others.
+
+    Args:
+        hashes (numpy.ndarray): The hashes, as uint64.
+        value (int): The hash to compare.
+
+    Returns:
+        numpy.ndarray: The Hamming distance to each hash.
+    """
+    differences = np.bitwise_xor(hashes, np.uint64(value))
+    return np.unpackbits(differences.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+def fetch_thumbnail(url, timeout=10):
+    """
+    Downloads the thumbnail of a Commons file.
+
+    Args:
+        url (str): URL of the original file.
+        timeout (float): Timeout of the request in seconds.
+
+    Returns:
+        bytes or None: The thumbnail, None if it could not be downloaded.
+    """
+    thumbnail_url = get_thumbnail_url(url)
+    if not thumbnail_url:
+        return None
+    try:
+        response = requests.get(thumbnail_url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=timeout)
+        response.raise_for_status()
+        return response.content
+    except requests.exceptions.RequestException as e:
+        print(f"Unable to download the thumbnail of {unquote(url)}: {e}")
+        return None
+
+class MediaHashIndex:
+    def __init__(self, path=HASH_INDEX_PATH, max_entries=20000, max_distance=MAX_DISTANCE):
+        """
+        Perceptual hashes of the Commons files seen by previous jobs, keyed by file URL.
+
+        The index is shared by the jobs of the process and kept on disk, so that the
+        thumbnail of a file is downloaded and hashed only once.
+
+        Args:
+        - path (str): Path of the JSON index.
+        - max_entries (int): Number of hashes kept, the oldest are dropped first.
+        - max_distance (int): Hamming distance up to which two images are duplicates.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.hashes = None
+        self.lock = threading.Lock()
+
+    def read(self):
+        """
+        Reads the index as it is on disk. A missing or corrupted index is treated as empty.
+
+        Returns:
+        - dict: The hashes keyed by file URL.
+        """
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                return {url: int(value, 16) for url, value in json.load(file).items()}
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Ignoring unreadable media hash index {self.path}: {e}")
+            return {}
+
+    def load(self):
+        """
+        Reads the index from disk once.
+        """
+        if self.hashes is None:
+            self.hashes = self.read()
+
+    def save(self):
+        """
+        Writes the index atomically, dropping the oldest hashes beyond `max_entries`.
+
+        The hashes written since this index was loaded, e.g. by another process, are read
+        again and kept alongside the ones of this index, so that neither writer loses the other's.
+        The index is only a cache: a failed write is reported and does not fail the job.
+        """
+        with self.lock:
+            self.load()
+            hashes = self.read()
+            hashes.update(self.hashes)
+            while len(hashes) > self.max_entries:
+                del hashes[next(iter(hashes))]
+            self.hashes = hashes
+            data = {url: f"{value:016x}" for url, value in hashes.items()}
+        try:
+            write_json_atomically(self.path, data, indent=None)
+        except OSError as e:
+            print(f"Error writing the media hash index {self.path}: {e}")
+
+    def missing(self, urls):
+        """
+        Lists the URLs whose hash is unknown and can be computed from a thumbnail.
+
+        Args:
+        - urls (list): URLs of candidate files.
+
+        Returns:
+        - list: The URLs to hash, without repetitions.
+        """
+        with self.lock:
+            self.load()
+            return [url for url in dict.fromkeys(urls) if url not in self.hashes and get_thumbnail_url(url)]
+
+    def add_thumbnails(self, urls, thumbnails):
+        """
+        Hashes downloaded thumbnails into the index.
+
+        Args:
+        - urls (list): URLs of the original files.
+        - thumbnails (list): Their thumbnails, None where the download failed.
+        """
+        hashes = {url: dhash_image(data) for url, data in zip(urls, thumbnails) if data}
+        with self.lock:
+            self.load()
+            self.hashes.update({url: value for url, value in hashes.items() if value is not None})
+
+    def select_distinct(self, urls, number):
+        """
+        Keeps the first candidates that are not near-duplicates of an earlier one.
+
+        Candidates without a hash are kept, as nothing is known about them.
+
+        Args:
+        - urls (list): URLs of candidate files, best first.
+        - number (int): Number of files wanted.
+
+        Returns:
+        - list: Up to `number` URLs of distinct visuals.
+        """
+        with self.lock:
+            self.load()
+            hashes = [self.hashes.get(url) for url in urls]
+        selected = []
+        kept = np.empty(0, dtype=np.uint64)
+        for url, value in zip(urls, hashes):
+            if len(selected) >= number:
+                break
+            if url in selected:
+                continue
+            if value is not None:
+                if len(kept) and hamming_distances(kept, value).min() <= self.max_distance:
+                    continue
+                kept = np.append(kept, np.uint64(value))
+            selected.append(url)
+        return selected
+
+def deduplicate_media(urls, number, index=None):
+    """
+    Drops near-duplicate images before they are downloaded, hashing their thumbnails.
+
+    The thumbnails of the files not in the index yet are downloaded by a few threads at once.
+
+    Args:
+        urls (list): URLs of candidate Commons files, best first.
+        number (int): Number of files wanted.
+        index (MediaHashIndex): The hash index, the process-wide one by default.
+
+    Returns:
+        list: Up to `number` URLs of distinct visuals.
+    """
+    index = index or default_index
+    missing = index.missing(urls)
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(THUMBNAIL_WORKERS, len(missing))) as executor:
+            thumbnails = list(executor.map(fetch_thumbnail, missing))
+        index.add_thumbnails(missing, thumbnails)
+        index.save()
+    return index.select_distinct(urls, number)
+
+default_index = MediaHashIndex()
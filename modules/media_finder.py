@@ -2,6 +2,9 @@ import requests
 import os
 import random
 import modules.file_manager
+import modules.media_dedup
+import modules.music_catalog
+import modules.video_ingest
 from nltk.tokenize import word_tokenize
 from nltk import pos_tag
 from nltk.corpus import wordnet as wn
@@ -97,23 +100,19 @@ def main_noun_from_sentence(sentence):
     else:
         return "No dominant noun found"
 
-def get_wiki_commons_media_url(search_term, text, num_media, min_height, type = "imageinfo"):
+COMMONS_API_ENDPOINT = "https://commons.wikimedia.org/w/api.php"
+
+def build_media_query(search_term, type = "imageinfo"):
     """
-    Retrieves media URLs from Wikimedia Commons based on a search_term and a type of media.
+    Builds the Wikimedia Commons query searching files of a type of media.
 
     Args:
-        search_term (str): The text context associated with the trend.
-        text (str): The text where the trend_name is found.
-        num_media (int): The number of media requested.
-        min_height (int): The minimum height of the media.
+        search_term (str): The term to search.
         type (str): The text of the type of media imageinfo or video.
     Returns:
-        list: A list of URLs of the retrieved media.
+        dict: The query parameters.
     """
-    API_ENDPOINT = "https://commons.wikimedia.org/w/api.php"
-    urls = []
-    mime_type_r = "image/jpeg" if type == "imageinfo" else "video/mp4"
-    params = {
+    return {
         "action": "query",
         "format": "json",
         "generator": "search",
@@ -123,8 +122,21 @@ def get_wiki_commons_media_url(search_term, text, num_media, min_height, type =
         "prop": type,
         "iiprop": "url|size|mime", 
     }
-    response = requests.get(API_ENDPOINT, params=params)
-    data = response.json()
+
+def parse_media_urls(data, num_media, min_height, type = "imageinfo"):
+    """
+    Extracts the URLs of the large enough files from a Wikimedia Commons media query.
+
+    Args:
+        data (dict): The decoded response of the query.
+        num_media (int): The number of media requested.
+        min_height (int): The minimum height of the media.
+        type (str): The text of the type of media imageinfo or video.
+    Returns:
+        list: A list of URLs of the retrieved media.
+    """
+    urls = []
+    mime_type_r = "image/jpeg" if type == "imageinfo" else "video/mp4"
     if "query" in data:
         pages = data["query"]["pages"]
         for index, element in enumerate(pages):
@@ -137,6 +149,22 @@ def get_wiki_commons_media_url(search_term, text, num_media, min_height, type =
                     break
     return urls
 
+def get_wiki_commons_media_url(search_term, text, num_media, min_height, type = "imageinfo"):
+    """
+    Retrieves media URLs from Wikimedia Commons based on a search_term and a type of media.
+
+    Args:
+        search_term (str): The text context associated with the trend.
+        text (str): The text where the trend_name is found.
+        num_media (int): The number of media requested.
+        min_height (int): The minimum height of the media.
+        type (str): The text of the type of media imageinfo or video.
+    Returns:
+        list: A list of URLs of the retrieved media.
+    """
+    response = requests.get(COMMONS_API_ENDPOINT, params=build_media_query(search_term, type))
+    return parse_media_urls(response.json(), num_media, min_height, type)
+
 def get_search_term(trend_name, text):
     """
     Retrieves the search term based on the trend name thanks to lesk implementation.
@@ -188,10 +216,28 @@ def get_wiki_commons_video_url(trend_name, text, min_height=720, num_videos=5, l
     Returns:
         list: A list of URLs of the retrieved videos.
     """
-    API_ENDPOINT = "https://commons.wikimedia.org/w/api.php"
-
     search_term = get_search_term(trend_name, text)
-    params = {
+    response = requests.get(COMMONS_API_ENDPOINT, params=build_video_search_query(search_term, limit))
+    video_titles = parse_video_titles(response.json())
+    urls = []
+    for title in video_titles:
+        response = requests.get(COMMONS_API_ENDPOINT, params=build_file_url_query(title))
+        urls.extend(parse_file_urls(response.json()))
+
+    return urls
+
+def build_video_search_query(search_term, limit = 10):
+    """
+    Builds the Wikimedia Commons full text search of files.
+
+    Args:
+        search_term (str): The term to search.
+        limit (int): Maximum number of files returned.
+
+    Returns:
+        dict: The query parameters.
+    """
+    return {
     "action": "query",
     "format": "json",
     "list": "search",
@@ -205,9 +251,16 @@ def get_wiki_commons_video_url(trend_name, text, min_height=720, num_videos=5, l
     "srwhat": "text",
     }
 
-    response = requests.get(API_ENDPOINT, params=params)
-    data = response.json()
+def parse_video_titles(data):
+    """
+    Extracts the titles of the mp4 files from a Wikimedia Commons full text search.
+
+    Args:
+        data (dict): The decoded response of the search.
 
+    Returns:
+        list: The file titles.
+    """
     videos = []
     if "query" in data:
         for result in data["query"]["search"]:
@@ -216,26 +269,42 @@ def get_wiki_commons_video_url(trend_name, text, min_height=720, num_videos=5, l
                     "title": result["title"],
                     "snippet": result["snippet"],
                 })
-    video_titles = [video['title'] for video in videos]
-    urls = []
-    for title in video_titles:
-        params = {
-            "action": "query",
-            "format": "json",
-            "prop": "imageinfo",
-            "titles": title,
-            "iiprop": "url",
-        }
-
-        response = requests.get(API_ENDPOINT, params=params)
-        data = response.json()
-
-        pages = data.get("query", {}).get("pages", {})
-        for page_id, page_data in pages.items():
-            if "imageinfo" in page_data:
-                for image_info in page_data["imageinfo"]:
-                    urls.append(image_info["url"])
+    return [video['title'] for video in videos]
+
+def build_file_url_query(title):
+    """
+    Builds the Wikimedia Commons query returning the URL of a file.
+
+    Args:
+        title (str): The file title.
 
+    Returns:
+        dict: The query parameters.
+    """
+    return {
+        "action": "query",
+        "format": "json",
+        "prop": "imageinfo",
+        "titles": title,
+        "iiprop": "url",
+    }
+
+def parse_file_urls(data):
+    """
+    Extracts the file URLs from a Wikimedia Commons imageinfo query.
+
+    Args:
+        data (dict): The decoded response of the query.
+
+    Returns:
+        list: The URLs.
+    """
+    urls = []
+    pages = data.get("query", {}).get("pages", {})
+    for page_id, page_data in pages.items():
+        if "imageinfo" in page_data:
+            for image_info in page_data["imageinfo"]:
+                urls.append(image_info["url"])
     return urls
 
 
@@ -303,7 +372,9 @@ def search_and_download_media(trend, text, min_height=1080, number_of_media=16):
     """
 
     num_videos = number_of_media // 8
-    urls = search_media_with_synonyms(trend, text, min_height, number_of_media - num_videos, get_wiki_commons_image_url)
+    num_images = number_of_media - num_videos
+    candidate_factor = modules.media_dedup.CANDIDATE_FACTOR
+    urls = search_media_with_synonyms(trend, text, min_height, num_images * candidate_factor, get_wiki_commons_image_url)
     #urls = search_media_with_synonyms(trend, text, min_height, number_of_media, get_wiki_commons_image_url)
 
     extension = ".jpg"
@@ -316,8 +387,11 @@ def search_and_download_media(trend, text, min_height=1080, number_of_media=16):
     if not urls2:
         print("Unable to find videos for the given trend and its synonyms.")
 
-        urls.extend(search_media_with_synonyms(trend, text, min_height, num_videos, get_wiki_commons_image_url))
-    
+        num_images = number_of_media
+        urls.extend(search_media_with_synonyms(trend, text, min_height, num_videos * candidate_factor, get_wiki_commons_image_url))
+
+    # Crops and re-uploads of the same photo are dropped before the full download.
+    urls = modules.media_dedup.deduplicate_media(urls, num_images)
     if not urls:
         print("Unable to find media for the given trend and its synonyms.")
         return None
@@ -326,50 +400,42 @@ def search_and_download_media(trend, text, min_height=1080, number_of_media=16):
 
     output = []
     for index, url in enumerate(urls2):
-        download_media(url, folder_path, f"media_{index + 1}", extension2)
-        output.append(os.path.join(folder_path, f"media_{index + 1}{extension2}"))
+        # Only the segment shown in the video is fetched, already scaled to the render width.
+        segment_path = modules.video_ingest.fetch_segment(url, os.path.join(folder_path, f"media_{index + 1}{extension2}"))
+        if segment_path:
+            output.append(segment_path)
     for index, url in enumerate(urls):
         download_media(url, folder_path, f"media_{index + 1}")
         output.append(os.path.join(folder_path, f"media_{index + 1}{extension}"))
 
     return output
 
-def selectMusicByEmotion(emotion, folder_path):
+def selectMusicByEmotion(emotion, folder_path, min_duration=0):
     """
     Selects a random music file based on the provided emotion.
 
     Args:
         emotion (str): The emotion to select music for.
+        folder_path (str): The music folder, containing one folder per emotion and CC.txt.
+        min_duration (float): Minimum duration of the music, e.g. the narration length.
 
     Returns:
         dict or None: Dictionary containing the path of the selected music file
                         and associated Creative Commons (CC) license information.
                         Returns None if no suitable music files are found.
     """
-    if emotion == "0":
+    # A neutral text has no music folder of its own.
+    if str(emotion) == "0":
         emotion = random.choice([-1, 1])
-        
-    music_folder = os.path.join(folder_path, str(emotion))
 
-    files = [f for f in os.listdir(music_folder) if f.endswith('.mp3')]
+    track = modules.music_catalog.get_catalog(folder_path).select(emotion, min_duration)
 
-    if not files:
+    if not track:
         return None 
 
-    selected_file = random.choice(files)
-    cc_info = ""
-
-    with open(os.path.join(folder_path, "CC.txt"), "r") as cc_file:
-        cc_list = [line for line in cc_file]
-        for index, line in enumerate(cc_list):
-            file_identifier = selected_file.rsplit('.', 1)[0].rsplit("[",1)[0]  
-            if file_identifier in line:  
-                cc_info += f"{line}{cc_list[index + 1]}{cc_list[index + 2]}{cc_list[index + 3]}"
-
-
     result = {
-        "path": os.path.join(folder_path, str(emotion), selected_file),
-        "cc": cc_info.strip()
+        "path": track["path"],
+        "cc": track["cc"].strip()
     }
 
-    return result
\ No newline at end of file
+    return result
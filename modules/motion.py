@@ -0,0 +1,144 @@
+import math
+import numpy as np
+from PIL import Image
+from moviepy.editor import VideoClip
+
+def ken_burns_rectangles(source_size, output_size, number_of_frames, zoom=1.15, zoom_in=True, pan=0.5):
+    """
+    Precomputes the crop rectangle of every frame of a pan and zoom.
+
+    The first rectangle is the largest one with the output aspect ratio, the last one is
+    `zoom` times smaller and shifted horizontally by `pan` times the free space; the
+    rectangles in between follow a smoothstep so that the motion eases in and out.
+
+    Args:
+        source_size (tuple): Width and height of the (pre-scaled) source.
+        output_size (tuple): Width and height of the output frames.
+        number_of_frames (int): Number of frames of the motion.
+        zoom (float): Zoom factor between the first and the last frame.
+        zoom_in (bool): Whether to zoom in (True) or out (False).
+        pan (float): Horizontal shift at the end, from -1 (left) to 1 (right).
+
+    Returns:
+        np.ndarray: Array of shape (number_of_frames, 4) with (left, top, right, bottom) boxes.
+    """
+    source_width, source_height = source_size
+    output_width, output_height = output_size
+    largest = min(source_width / output_width, source_height / output_height)
+    progress = np.linspace(0.0, 1.0, max(number_of_frames, 1))
+    progress = progress * progress * (3 - 2 * progress)
+    if not zoom_in:
+        progress = progress[::-1]
+
+    scales = largest / (1 + (zoom - 1) * progress)
+    widths = output_width * scales
+    heights = output_height * scales
+    free_space = (source_width - widths) / 2
+    centers_x = source_width / 2 + pan * free_space * progress
+    centers_y = np.full_like(centers_x, source_height / 2)
+    return np.stack([centers_x - widths / 2, centers_y - heights / 2,
+                     centers_x + widths / 2, centers_y + heights / 2], axis=1)
+
+def make_ken_burns_clip(image, output_size, duration, fps, zoom=1.15, zoom_in=True, pan=0.5, resample=Image.NEAREST):
+    """
+    Creates a clip showing a still image with a pan and zoom motion.
+
+    Each frame is a single resize of the precomputed crop box of the pre-scaled source.
+    A source array, or a .npy path memory-mapped on the first frame and released when the
+    clip is closed, is never copied whole. With the default nearest filter, a frame gathers
+    its rows then its columns straight from the array; the source is prepared at about the
+    output size times `zoom` and blurred, so a source pixel maps to one or two output pixels
+    and interpolating them changes nothing visible. With another filter, each frame slices
+    its crop box (plus the margin the filter reads around it) and resamples only that.
+
+    Args:
+        image (np.ndarray, PIL.Image.Image or str): The pre-scaled source, at least `zoom` times the output size.
+        output_size (tuple): Width and height of the clip.
+        duration (float): Duration of the clip in seconds.
+        fps (int): Frame rate the rectangles are computed for.
+        zoom (float): Zoom factor between the first and the last frame.
+        zoom_in (bool): Whether to zoom in (True) or out (False).
+        pan (float): Horizontal shift at the end, from -1 (left) to 1 (right).
+        resample (int): PIL resampling filter.
+
+    Returns:
+        VideoClip: The animated clip.
+    """
+    if isinstance(image, str):
+        height, width = np.load(image, mmap_mode="r").shape[:2]
+        loaded = {"source": None}
+    elif isinstance(image, Image.Image):
+        loaded = {"source": image}
+        width, height = image.size
+    else:
+        loaded = {"source": image}
+        height, width = image.shape[:2]
+    number_of_frames = max(1, math.ceil(duration * fps))
+    rectangles = ken_burns_rectangles((width, height), output_size, number_of_frames, zoom, zoom_in, pan)
+    # Centers of the output pixels, in output pixels.
+    column_centers = np.arange(output_size[0]) + 0.5
+    row_centers = np.arange(output_size[1]) + 0.5
+
+    def make_frame(t):
+        if loaded["source"] is None:
+            loaded["source"] = np.load(image, mmap_mode="r")
+        index = min(max(int(t * fps), 0), number_of_frames - 1)
+        box = rectangles[index]
+        source = loaded["source"]
+        if isinstance(source, Image.Image):
+            return np.asarray(source.resize(output_size, resample, box=tuple(box)))
+        if resample == Image.NEAREST:
+            columns = np.minimum((box[0] + column_centers * ((box[2] - box[0]) / output_size[0])).astype(np.intp), width - 1)
+            rows = np.minimum((box[1] + row_centers * ((box[3] - box[1]) / output_size[1])).astype(np.intp), height - 1)
+            return np.take(np.take(source, rows, axis=0), columns, axis=1)
+        # Pixels around the box within the filter support, 3 for Lanczos, widened when downscaling.
+        margin = math.ceil(3 * max(1.0, (box[2] - box[0]) / output_size[0])) + 1
+        left, top = max(int(box[0]) - margin, 0), max(int(box[1]) - margin, 0)
+        right, bottom = min(math.ceil(box[2]) + margin, width), min(math.ceil(box[3]) + margin, height)
+        crop = Image.fromarray(np.ascontiguousarray(source[top:bottom, left:right]))
+        return np.asarray(crop.resize(output_size, resample, box=(box[0] - left, box[1] - top, box[2] - left, box[3] - top)))
+
+    def close():
+        if isinstance(image, str):
+            loaded["source"] = None
+
+    clip = VideoClip(make_frame, duration=duration)
+    clip.close = close
+    return clip
+
+def make_shrinking_clip(frame, mask, duration, fps, resample=Image.BILINEAR):
+    """
+    Creates a clip where a still frame shrinks around its center until it disappears.
+
+    The scale of every frame is precomputed; each frame resizes the small source once
+    and pastes it into a canvas of the original size.
+
+    Args:
+        frame (np.ndarray): RGB frame to shrink.
+        mask (np.ndarray): Opacity of the frame, between 0 and 1, with the same height and width.
+        duration (float): Time until the frame disappears.
+        fps (int): Frame rate the scales are computed for.
+        resample (int): PIL resampling filter.
+
+    Returns:
+        VideoClip: The animated clip, with its mask.
+    """
+    height, width = frame.shape[:2]
+    number_of_frames = max(1, math.ceil(duration * fps))
+    factors = np.maximum(0.0, 1.0 - np.arange(number_of_frames) / (duration * fps))
+    sizes = np.stack([np.floor(width * factors), np.floor(height * factors)], axis=1).astype(int)
+    source = Image.fromarray(frame.astype(np.uint8))
+    source_mask = Image.fromarray((mask * 255).astype(np.uint8))
+
+    def shrink(image, t, channels):
+        index = min(max(int(t * fps), 0), number_of_frames - 1)
+        size = tuple(sizes[index])
+        canvas = np.zeros((height, width) + channels, dtype=np.uint8)
+        if size[0] > 0 and size[1] > 0:
+            left, top = (width - size[0]) // 2, (height - size[1]) // 2
+            canvas[top:top + size[1], left:left + size[0]] = np.asarray(image.resize(size, resample))
+        return canvas
+
+    clip = VideoClip(lambda t: shrink(source, t, (3,)), duration=duration)
+    clip.mask = VideoClip(lambda t: shrink(source_mask, t, ()) / 255.0, ismask=True, duration=duration)
+    return clip
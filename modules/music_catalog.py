@@ -0,0 +1,215 @@
+import json
+import os
+import random
+import numpy as np
+from modules.file_manager import write_json_atomically
+from modules.audio_mixer import open_audio_stream, read_block, close_stream, SAMPLE_RATE, CHANNELS
+
+CATALOG_NAME = "catalog.json"
+CC_NAME = "CC.txt"
+
+_catalogs = {}
+
+def parse_cc_file(cc_path):
+    """
+    Parses the Creative Commons attributions file into blocks, one per song.
+
+    Blocks are separated by lines containing only "-", and start with a "Song:" line.
+
+    Args:
+        cc_path (str): Path of the CC.txt file.
+
+    Returns:
+        list: Attribution blocks as strings, without trailing whitespace.
+    """
+    if not os.path.exists(cc_path):
+        return []
+    blocks = []
+    current = []
+    with open(cc_path, "r", encoding="utf-8", errors="replace") as cc_file:
+        for line in cc_file:
+            if line.strip() == "-":
+                if current:
+                    blocks.append("\n".join(current))
+                current = []
+            elif line.strip():
+                current.append(line.rstrip())
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+def find_attribution(file_name, blocks):
+    """
+    Finds the attribution block of a music file.
+
+    Args:
+        file_name (str): Name of the music file, e.g. "Wiguez - Marcheur [NCS Release].mp3".
+        blocks (list): Blocks returned by `parse_cc_file`.
+
+    Returns:
+        str: The matching attribution, or an empty string.
+    """
+    file_identifier = file_name.rsplit('.', 1)[0].rsplit("[", 1)[0].strip()
+    for block in blocks:
+        if file_identifier and file_identifier in block.split("\n", 1)[0]:
+            return block
+    return ""
+
+def measure_track(track_path):
+    """
+    Decodes a track to measure its duration and loudness.
+
+    Args:
+        track_path (str): Path of the music file.
+
+    Returns:
+        tuple: Duration in seconds and RMS loudness in dBFS.
+    """
+    stream = open_audio_stream(track_path)
+    frames = 0
+    energy = 0.0
+    try:
+        while True:
+            block = read_block(stream, SAMPLE_RATE * 10)
+            if not len(block):
+                break
+            frames += len(block)
+            energy += float(np.sum(np.square(block, dtype=np.float64)))
+    finally:
+        close_stream(stream)
+    if not frames:
+        return 0.0, None
+    rms = np.sqrt(energy / (frames * CHANNELS))
+    loudness = float(20 * np.log10(rms)) if rms > 0 else None
+    return frames / SAMPLE_RATE, loudness
+
+def get_folder_signature(folder_path):
+    """
+    Computes a cheap signature of the music library, changing whenever a track is added, removed,
+    renamed or overwritten, or CC.txt is edited.
+
+    A track overwritten in place leaves the modification time of its folder unchanged,
+    so the size and modification time of every track are part of the signature.
+
+    Args:
+        folder_path (str): Path of the music folder.
+
+    Returns:
+        dict: For each emotion folder, the [size, mtime] of its tracks by name; the modification time of CC.txt.
+    """
+    signature = {}
+    for entry in os.scandir(folder_path):
+        if entry.is_dir():
+            signature[entry.name] = {}
+            for track in os.scandir(entry.path):
+                if track.name.endswith('.mp3'):
+                    stat = track.stat()
+                    signature[entry.name][track.name] = [stat.st_size, stat.st_mtime_ns]
+        elif entry.name == CC_NAME:
+            signature[entry.name] = entry.stat().st_mtime_ns
+    return signature
+
+class MusicCatalog:
+    def __init__(self, folder_path, signature, tracks):
+        """
+        Initializes the catalog of the music library.
+
+        Args:
+        - folder_path (str): Path of the music folder.
+        - signature (dict): Signature of the folder the catalog was built from.
+        - tracks (list): Track entries with path, emotion, duration, loudness, cc, size and mtime.
+        """
+        self.folder_path = folder_path
+        self.signature = signature
+        self.tracks = tracks
+        self.by_emotion = {}
+        for track in tracks:
+            self.by_emotion.setdefault(track["emotion"], []).append(track)
+
+    def to_dict(self):
+        return {"signature": self.signature, "tracks": self.tracks}
+
+    def select(self, emotion, min_duration=0):
+        """
+        Selects a random track for an emotion, long enough to cover the narration.
+
+        Args:
+        - emotion (str): The emotion folder name, e.g. "1" or "-1".
+        - min_duration (float): Minimum duration of the track in seconds.
+
+        Returns:
+        - dict or None: The selected track, the longest one if none is long enough,
+          None if the emotion has no track.
+        """
+        tracks = self.by_emotion.get(str(emotion), [])
+        if not tracks:
+            return None
+        long_enough = [track for track in tracks if track["duration"] >= min_duration]
+        if not long_enough:
+            return max(tracks, key=lambda track: track["duration"])
+        return random.choice(long_enough)
+
+def build_catalog(folder_path, previous=None):
+    """
+    Scans the music library, measuring only the tracks that changed since the previous catalog.
+
+    Args:
+        folder_path (str): Path of the music folder.
+        previous (MusicCatalog): Catalog to reuse measurements from.
+
+    Returns:
+        MusicCatalog: The new catalog, also written to catalog.json.
+    """
+    signature = get_folder_signature(folder_path)
+    known = {track["path"]: track for track in previous.tracks} if previous else {}
+    blocks = parse_cc_file(os.path.join(folder_path, CC_NAME))
+    tracks = []
+    for emotion in sorted(name for name in signature if name != CC_NAME):
+        emotion_folder = os.path.join(folder_path, emotion)
+        for entry in sorted(os.scandir(emotion_folder), key=lambda entry: entry.name):
+            if not entry.name.endswith('.mp3'):
+                continue
+            stat = entry.stat()
+            track = known.get(entry.path)
+            if not track or track["size"] != stat.st_size or track["mtime"] != stat.st_mtime_ns:
+                duration, loudness = measure_track(entry.path)
+                track = {
+                    "path": entry.path,
+                    "emotion": emotion,
+                    "duration": duration,
+                    "loudness": loudness,
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime_ns,
+                }
+            track["cc"] = find_attribution(entry.name, blocks)
+            tracks.append(track)
+
+    catalog = MusicCatalog(folder_path, signature, tracks)
+    write_json_atomically(os.path.join(folder_path, CATALOG_NAME), catalog.to_dict())
+    return catalog
+
+def get_catalog(folder_path):
+    """
+    Returns the catalog of a music library, loading it once per process and rebuilding it when the files change.
+
+    Args:
+        folder_path (str): Path of the music folder.
+
+    Returns:
+        MusicCatalog: The up to date catalog.
+    """
+    signature = get_folder_signature(folder_path)
+    catalog = _catalogs.get(folder_path)
+    if catalog is None:
+        catalog_path = os.path.join(folder_path, CATALOG_NAME)
+        if os.path.exists(catalog_path):
+            try:
+                with open(catalog_path, "r", encoding="utf-8") as file:
+                    data = json.load(file)
+                catalog = MusicCatalog(folder_path, data["signature"], data["tracks"])
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Ignoring unreadable music catalog {catalog_path}: {e}")
+    if catalog is None or catalog.signature != signature:
+        catalog = build_catalog(folder_path, catalog)
+    _catalogs[folder_path] = catalog
+    return catalog
@@ -0,0 +1,5 @@
+# Imported by the forkserver of the worker pools (see modules.warmup): the models are
+# loaded once in the server, and every worker forked from it shares them.
+from modules.warmup import warm_up
+
+warm_up()
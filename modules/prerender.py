@@ -0,0 +1,106 @@
+import asyncio
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from modules.web_scraper import get_trends
+
+def get_cpu_load():
+    """
+    Returns the one-minute load average divided by the number of CPUs.
+
+    Returns:
+        float: The normalized load, 0 when the platform does not expose it.
+    """
+    if not hasattr(os, "getloadavg"):
+        return 0.0
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except OSError:
+        return 0.0
+
+class PreRenderer:
+    def __init__(self, video_store, make_job, top_n=5, max_concurrency=1, max_pending=5, cpu_budget=0.75, idle_check_seconds=5):
+        """
+        Initializes the scheduler that renders the top trends in the background.
+
+        Args:
+        - video_store (VideoStore): Store where the rendered videos are published.
+        - make_job (callable): Function taking (trend_number, trend, date_string) and returning
+          the video key and the coroutine function rendering it.
+        - top_n (int): Number of top trends kept warm.
+        - max_concurrency (int): Maximum number of background renders running at once.
+        - max_pending (int): Maximum number of background renders queued, beyond which polls are skipped.
+        - cpu_budget (float): Normalized load above which no new background render starts.
+        - idle_check_seconds (float): Interval at which a queued render checks whether the node became idle.
+        """
+        self.video_store = video_store
+        self.make_job = make_job
+        self.top_n = top_n
+        self.max_pending = max_pending
+        self.cpu_budget = cpu_budget
+        self.idle_check_seconds = idle_check_seconds
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.pending = {}
+        self.interactive_requests = 0
+
+    @contextmanager
+    def interactive(self):
+        """
+        Marks the scope of an interactive request, during which background renders do not start.
+        """
+        self.interactive_requests += 1
+        try:
+            yield
+        finally:
+            self.interactive_requests -= 1
+
+    def is_idle(self):
+        """
+        Checks whether there is room for a background render.
+
+        Returns:
+        - bool: True if no interactive request is running and the CPU load is within the budget.
+        """
+        return self.interactive_requests == 0 and get_cpu_load() < self.cpu_budget
+
+    async def poll(self, context=None):
+        """
+        Job queue callback: schedules a render for every top trend that is not stored nor in flight.
+
+        Args:
+        - context: The job queue context (unused).
+        """
+        if not self.is_idle() or len(self.pending) >= self.max_pending:
+            return
+        try:
+            trends = await asyncio.to_thread(get_trends)
+        except Exception as e:
+            print(f"Pre-render poll failed to retrieve the trends: {e}")
+            return
+        date_string = datetime.now().strftime("%d-%m-%Y")
+
+        for trend_number, trend in enumerate(trends[:self.top_n]):
+            if len(self.pending) >= self.max_pending:
+                break
+            key, create = self.make_job(trend_number, trend, date_string)
+            if key in self.pending or key in self.video_store.in_flight or self.video_store.get(key):
+                continue
+            task = asyncio.create_task(self.render(key, create))
+            self.pending[key] = task
+            task.add_done_callback(lambda _, key=key: self.pending.pop(key, None))
+
+    async def render(self, key, create):
+        """
+        Renders a trend in the background once a concurrency slot is free and the node is idle.
+
+        Args:
+        - key (str): The video key.
+        - create (callable): Coroutine function rendering and storing the video.
+        """
+        async with self.semaphore:
+            while not self.is_idle():
+                await asyncio.sleep(self.idle_check_seconds)
+            try:
+                await self.video_store.get_or_create(key, create)
+            except Exception as e:
+                print(f"Pre-render of {key} failed: {e}")
@@ -0,0 +1,226 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Fraction of the jobs profiled when the caller does not decide, e.g. "0.05" for one job in twenty.
+PROFILE_RATE_ENV = "TRENDS_PROFILE_RATE"
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+def should_profile(profiling=None):
+    """
+    Decides whether a job is profiled.
+
+    Args:
+        profiling (bool): The decision of the caller, None to sample jobs at the rate of the environment.
+
+    Returns:
+        bool: True if the job is profiled.
+    """
+    if profiling is not None:
+        return bool(profiling)
+    try:
+        rate = float(os.getenv(PROFILE_RATE_ENV, "0"))
+    except ValueError:
+        print(f"Ignoring invalid {PROFILE_RATE_ENV}: {os.getenv(PROFILE_RATE_ENV)}")
+        return False
+    return random.random() < rate
+
+def format_frame(frame):
+    """
+    Names the function of a frame, e.g. "resize (moviepy/video/fx/resize.py:120)".
+
+    Args:
+        frame (tuple): Function name, file name and first line of the function.
+
+    Returns:
+        str: The frame name.
+    """
+    name, file_name, line = frame
+    parts = file_name.replace("\\", "/").split("/")
+    # The package part of the path is enough to tell the library and keeps the stacks short.
+    for marker in ("site-packages", "dist-packages"):
+        if marker in parts:
+            parts = parts[parts.index(marker) + 1:]
+            break
+    else:
+        parts = parts[-2:]
+    return f"{name} ({'/'.join(parts)}:{line})"
+
+class SamplingProfiler:
+    def __init__(self, interval=0.01):
+        """
+        Statistical profiler sampling the Python stacks of the tracked threads.
+
+        A background thread reads the stacks every `interval` seconds, so the profiled
+        code runs unmodified; the cost is one stack walk per tracked thread and sample,
+        which keeps the overhead at a few percent at the default interval.
+
+        Args:
+        - interval (float): Seconds between two samples.
+        """
+        self.interval = interval
+        self.thread_ids = Counter()
+        self.samples = Counter()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.started = None
+        self.seconds = 0.0
+
+    def start(self, track_caller=True):
+        """
+        Starts sampling.
+
+        Args:
+        - track_caller (bool): Whether the calling thread is sampled until `stop`.
+        """
+        if track_caller:
+            self.thread_ids[threading.get_ident()] += 1
+        self.stop_event.clear()
+        self.started = time.perf_counter()
+        self.thread = threading.Thread(target=self.run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops sampling and waits for the sampling thread.
+        """
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self.seconds += time.perf_counter() - self.started
+        self.thread_ids.clear()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @contextmanager
+    def track(self):
+        """
+        Samples the calling thread while the block runs, e.g. an executor thread working for the job.
+        """
+        thread_id = threading.get_ident()
+        with self.lock:
+            self.thread_ids[thread_id] += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.thread_ids[thread_id] -= 1
+                if not self.thread_ids[thread_id]:
+                    del self.thread_ids[thread_id]
+
+    def wrap(self, func):
+        """
+        Wraps a function so that the thread running it is sampled.
+
+        Args:
+        - func (callable): The function.
+
+        Returns:
+        - callable: The tracked function.
+        """
+        def tracked(*args, **kwargs):
+            with self.track():
+                return func(*args, **kwargs)
+        return tracked
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        """
+        Records the current stack of every tracked thread.
+        """
+        with self.lock:
+            thread_ids = list(self.thread_ids)
+        frames = sys._current_frames()
+        for thread_id in thread_ids:
+            frame = frames.get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    def write_collapsed(self, path):
+        """
+        Writes the samples in the collapsed stack format read by flamegraph.pl and speedscope.
+
+        Args:
+        - path (str): Path of the output file.
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, count in self.samples.most_common():
+                file.write(";".join(format_frame(frame) for frame in stack) + f" {count}\n")
+
+    def write_speedscope(self, path, name="profile"):
+        """
+        Writes the samples as a speedscope sampled profile, weighted in seconds.
+
+        Args:
+        - path (str): Path of the output file.
+        - name (str): Name of the profile shown by speedscope.
+        """
+        frame_indexes = {}
+        frames = []
+        samples = []
+        weights = []
+        for stack, count in self.samples.most_common():
+            indexes = []
+            for frame in stack:
+                if frame not in frame_indexes:
+                    frame_indexes[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                indexes.append(frame_indexes[frame])
+            samples.append(indexes)
+            weights.append(count * self.interval)
+        profile = {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+            "name": name,
+            "exporter": "trends sampling profiler",
+        }
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(profile, file)
+
+    def save(self, folder, name):
+        """
+        Writes the collapsed and speedscope files of the profile in a folder.
+
+        Args:
+        - folder (str): The output folder, usually the job folder.
+        - name (str): Name of the profiled step, used in the file names.
+
+        Returns:
+        - list: Paths of the written files.
+        """
+        os.makedirs(folder, exist_ok=True)
+        collapsed_path = os.path.join(folder, f"profile-{name}.collapsed.txt")
+        speedscope_path = os.path.join(folder, f"profile-{name}.speedscope.json")
+        self.write_collapsed(collapsed_path)
+        self.write_speedscope(speedscope_path, name)
+        print(f"Profile of {name}: {sum(self.samples.values())} samples over {self.seconds:.1f} s written to {speedscope_path}")
+        return [collapsed_path, speedscope_path]
@@ -0,0 +1,91 @@
+import asyncio
+import random
+import threading
+import time
+
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        """
+        Thread-safe token bucket: requests spend tokens, which refill at a constant rate.
+
+        Args:
+        - rate (float): Tokens added per second.
+        - capacity (float): Maximum number of tokens, i.e. the allowed burst.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, tokens=1):
+        """
+        Spends tokens only if they are available right away.
+
+        Args:
+        - tokens (float): Number of tokens to spend.
+
+        Returns:
+        - bool: Whether the tokens were spent.
+        """
+        with self.lock:
+            self.refill()
+            if self.tokens < tokens:
+                return False
+            self.tokens -= tokens
+            return True
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+        Blocks until tokens are available, then spends them.
+
+        Args:
+        - tokens (float): Number of tokens to spend.
+        - timeout (float): Maximum seconds to wait, None to wait as long as needed.
+
+        Returns:
+        - bool: False if the tokens would not be available before the timeout.
+        """
+        with self.lock:
+            self.refill()
+            wait = max(0.0, (tokens - self.tokens) / self.rate)
+            if timeout is not None and wait > timeout:
+                return False
+            self.tokens -= tokens
+        if wait:
+            time.sleep(wait)
+        return True
+
+    async def acquire_async(self, tokens=1):
+        """
+        Waits without blocking the event loop until tokens are available, then spends them.
+
+        Args:
+        - tokens (float): Number of tokens to spend.
+        """
+        with self.lock:
+            self.refill()
+            wait = max(0.0, (tokens - self.tokens) / self.rate)
+            self.tokens -= tokens
+        if wait:
+            await asyncio.sleep(wait)
+
+def backoff_delay(attempt, base=1.0, maximum=30.0):
+    """
+    Computes a "full jitter" exponential backoff delay, so that clients retrying at the
+    same time spread out instead of hitting the service together again.
+
+    Args:
+        attempt (int): Number of the failed attempt, starting at 0.
+        base (float): Delay cap of the first retry in seconds.
+        maximum (float): Largest delay cap in seconds.
+
+    Returns:
+        float: Seconds to wait before the next attempt.
+    """
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
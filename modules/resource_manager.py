@@ -1,5 +1,7 @@
 import os
-import shutil
+import time
+import json
+import hashlib
 import modules.web_scraper
 import modules.editing
 import modules.sentiment_analysis
@@ -7,9 +9,65 @@ import modules.subtitles
 import modules.text_to_speech
 import modules.summarize
 import modules.media_finder
+import modules.file_manager
+import modules.audio_mixer
+import modules.tag_index
+from modules.job_manifest import JobManifest
+from modules.profiler import SamplingProfiler, should_profile
+
+def no_artifacts(value):
+    return []
+
+def single_artifact(value):
+    return [value]
+
+def existing_paths(value):
+    return [path for path in value if os.path.exists(path)]
+
+# The stages of the resource pipeline, in order, shared by the sync and the async runners.
+# A stage is computed by the `stage_<name>` method of the manager (or `stage_<name>_async`
+# where the async runner has its own), from the outputs of the stages in "inputs"; it is
+# rerun when one of these changed.
+PIPELINE = [
+    {"name": "contents", "inputs": [], "artifacts": no_artifacts,
+     "error": "Unable to retrieve contents for trend {trend_name}."},
+    {"name": "summary", "inputs": ["contents"], "artifacts": no_artifacts,
+     "error": "Summarization failed."},
+    {"name": "media", "inputs": ["summary"], "artifacts": existing_paths,
+     "error": "Image search/download failed."},
+    {"name": "sentiment", "inputs": ["summary"], "artifacts": no_artifacts,
+     "error": "Sentiment analysis failed."},
+    {"name": "speech", "inputs": ["summary"], "artifacts": single_artifact,
+     "error": "Text-to-Speech conversion failed."},
+    {"name": "music", "inputs": ["sentiment", "speech"], "artifacts": no_artifacts,
+     "error": "Music selection failed."},
+    {"name": "subtitles", "inputs": ["speech"], "artifacts": single_artifact,
+     "error": "Subtitle generation failed."},
+]
+STAGE_INPUTS = {stage["name"]: stage["inputs"] for stage in PIPELINE}
+STAGE_INPUTS["video"] = ["summary", "media", "speech", "music", "subtitles"]
+MUSIC_FOLDER = os.path.join("media", "music")
+
+def get_stage_inputs(stage):
+    """
+    Returns the stages a stage depends on, the render stages (e.g. "video_publish") sharing one entry.
+    """
+    return STAGE_INPUTS["video" if stage.startswith("video_") else stage]
+
+def is_stage_output(value):
+    """
+    Tells a stage output from a failure: None and empty outputs are failures, numbers are not.
+
+    Args:
+        value: Output of a stage, e.g. a neutral sentiment of 0.
+
+    Returns:
+        bool: True if the stage succeeded.
+    """
+    return value is not None and (isinstance(value, (int, float)) or bool(value))
 
 class ResourceManager:
-    def __init__(self, trend_number, number_of_articles_to_read=10, text_articles=8, text_length=7, desc_articles=5, desc_length=3, language="English"):
+    def __init__(self, trend_number, number_of_articles_to_read=10, text_articles=8, text_length=7, desc_articles=5, desc_length=3, language="English", render_profile="publish", profiling=None, render_workers=1, trend_name=None):
         """
         Initializes the ResourceManager with parameters for generating resources.
 
@@ -21,32 +79,138 @@ class ResourceManager:
         - desc_articles (int): Number of articles to use for description summarization.
         - desc_length (int): Number of sentences to include in description summarization.
         - language (str): Language for text-to-speech conversion.
+        - render_profile (str): Render profile of the video, "preview" or "publish".
+        - profiling (bool): Whether the job is profiled, None to sample jobs at the rate set in the environment.
+        - render_workers (int): Number of processes rendering chunks of the video. A profiled job renders
+          in a single process, since the sampler only sees the threads of this process.
+        - trend_name (str): Name of the trend to render, e.g. the one a queued job was keyed on, instead of
+          the trend found at `trend_number` when the job starts.
         """
         self.trend_number = trend_number
+        self.trend_name = trend_name
         self.number_of_articles_to_read = number_of_articles_to_read
         self.text_articles = text_articles
         self.text_length = text_length
         self.desc_articles = desc_articles
         self.desc_length = desc_length
         self.language = language
+        self.render_profile = render_profile
+        self.profiling = should_profile(profiling)
+        self.render_workers = 1 if self.profiling else render_workers
+        self.job_dir = None
 
-    def generate_resources(self):
+    def config_hash(self, render_profile=None):
         """
-        Generates resources including text, audio, subtitles, and media for a given trend.
+        Hashes the parameters that influence the rendered video, excluding the trend itself.
+
+        Args:
+        - render_profile (str): Render profile to hash instead of the one of the manager.
 
         Returns:
-        - dict: Dictionary containing generated resources.
+        - str: Hex digest identifying the pipeline configuration.
+        """
+        config = {
+            "number_of_articles_to_read": self.number_of_articles_to_read,
+            "text_articles": self.text_articles,
+            "text_length": self.text_length,
+            "desc_articles": self.desc_articles,
+            "desc_length": self.desc_length,
+            "language": self.language,
+            "render_profile": render_profile or self.render_profile,
+        }
+        return hashlib.sha1(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def run_stage(self, manifest, stage, func, artifacts=lambda value: []):
+        """
+        Runs a pipeline stage unless the manifest says it already completed, from the current
+        outputs of the stages it depends on (STAGE_INPUTS), with intact artifacts.
+
+        Args:
+        - manifest (JobManifest): Manifest of the trend directory.
+        - stage (str): Name of the stage.
+        - func (callable): Function producing the stage output. None or an empty output means failure.
+        - artifacts (callable): Function returning the files produced, given the stage output.
+
+        Returns:
+        - The stage output, either recorded or freshly computed.
+        """
+        inputs = manifest.inputs_digest(get_stage_inputs(stage))
+        if manifest.is_complete(stage, inputs):
+            return manifest.get(stage)
+        started = time.perf_counter()
+        value = func()
+        if is_stage_output(value):
+            manifest.record(stage, value, artifacts(value), time.perf_counter() - started, inputs)
+        return value
+
+    def run_profiled(self, name, func, *args):
+        """
+        Runs a step of the job, under the sampling profiler if the job is profiled.
+
+        The profile is written in the job folder, even when the step fails.
+
+        Args:
+        - name (str): Name of the step, used in the profile file names.
+        - func (callable): The step.
+        - args: Its arguments.
+
+        Returns:
+        - The output of the step.
+        """
+        if not self.profiling:
+            return func(*args)
+        profiler = SamplingProfiler()
+        try:
+            with profiler:
+                return func(*args)
+        finally:
+            self.save_profile(profiler, name)
+
+    def save_profile(self, profiler, name):
+        """
+        Writes a profile of the job in the job folder.
+
+        Args:
+        - profiler (SamplingProfiler): The stopped profiler.
+        - name (str): Name of the profiled step.
         """
-        trend = modules.web_scraper.get_trends()
-        contents = modules.web_scraper.get_trend_contents(self.trend_number, self.number_of_articles_to_read)
-        desc_contents_scrapped = modules.web_scraper.get_trend_contents(self.trend_number, self.desc_articles)
+        if not self.job_dir:
+            print(f"No job folder to write the profile of {name} in.")
+            return
+        try:
+            profiler.save(self.job_dir, name)
+        except OSError as e:
+            print(f"Error writing the profile of {name}: {e}")
+
+    def scrape_contents(self, trend_name):
+        """
+        Scrapes the articles used for the main text and for the description.
+
+        Args:
+        - trend_name (str): The trend.
+
+        Returns:
+        - dict or None: Contents for the text and the description, None if nothing was found.
+        """
+        contents = modules.web_scraper.get_topic_contents(trend_name, self.number_of_articles_to_read)
         if not contents:
-            print(f"Error: Unable to retrieve contents for trend {trend[self.trend_number]}.")
             return None
-        
-        text_script, tags = modules.summarize.apply_summarization_article_on_trend(contents, self.text_length)
-        description, _ = modules.summarize.apply_summarization_article_on_trend(desc_contents_scrapped, self.desc_length)        
-        
+        desc_contents = modules.web_scraper.get_topic_contents(trend_name, self.desc_articles)
+        return {"Text": contents, "Description": desc_contents}
+
+    def summarize_contents(self, contents):
+        """
+        Summarizes the scraped contents into the text script, the description and the tags.
+
+        Args:
+        - contents (dict): Output of `scrape_contents`.
+
+        Returns:
+        - dict or None: Text script, description and tags, None if summarization failed.
+        """
+        text_script, _ = modules.summarize.apply_summarization_article_on_trend(contents["Text"], self.text_length)
+        description, _ = modules.summarize.apply_summarization_article_on_trend(contents["Description"], self.desc_length)
+
         unique_sentences = []
         seen_sentences = set()
         for sentence in text_script.split('.'):
@@ -56,67 +220,184 @@ class ResourceManager:
                 seen_sentences.add(stripped_sentence)
         text_script = '. '.join(unique_sentences) + '.'
         if not text_script or not description:
-            print("Error: Summarization failed.")
             return None
-        
-        media = modules.media_finder.search_and_download_media(trend[self.trend_number], text_script)
+        return {"TextScript": text_script, "Description": description, "Tags": self.extract_tags(contents)}
 
-        if not media:
-            print("Error: Image search/download failed.")
-            return None
-        
-        sentiment_analysis_output = modules.sentiment_analysis.get_summarization_emotion(text_script)
-        
-        if not sentiment_analysis_output:
-            print("Error: Sentiment analysis failed.")
-            return None
+    def extract_tags(self, contents):
+        """
+        Chooses the hashtags of the video by TF-IDF against every article scraped so far.
+
+        Args:
+        - contents (dict): Output of `scrape_contents`.
 
-        part = str(media[0].split("/"))[:-1].split("\\")
-        path = os.path.join(part[0][2:], part[2])
-        music_folder_path = os.path.join(part[0][2:], "music")
-        tags = [f"#{tag}" for index, tag in enumerate(tags) if index < 15]
+        Returns:
+        - list: The tags, best first.
+        """
+        articles = list(dict.fromkeys(contents["Text"] + contents["Description"]))
+        index = modules.tag_index.get_default_index()
+        index.add_documents(articles)
+        return index.top_tags(contents["Text"])
+
+    def generate_resources(self):
+        """
+        Generates resources including text, audio, subtitles, and media for a given trend.
+
+        Every completed stage is recorded in the manifest of the trend directory, so
+        a rerun after a failure resumes from the last good stage.
+
+        Returns:
+        - dict: Dictionary containing generated resources.
+        """
+        return self.run_profiled("resources", self.run_stages)
+
+    def run_stages(self):
+        """
+        Runs the stages of `generate_resources`.
+        """
+        job = self.start_job(self.fetch_trends())
+        manifest = JobManifest(job["path"])
+        for stage in PIPELINE:
+            value = self.run_stage(manifest, stage["name"], lambda: getattr(self, f"stage_{stage['name']}")(job), stage["artifacts"])
+            if not is_stage_output(value):
+                print("Error: " + stage["error"].format(**job))
+                return None
+            job[stage["name"]] = value
+        return self.finish_job(job)
+
+    def fetch_trends(self):
+        """
+        Returns the current trends, only the trend to render when it was given by name.
+        """
+        if self.trend_name is not None:
+            return [self.trend_name]
+        return modules.web_scraper.get_trends()
+
+    def start_job(self, trend):
+        """
+        Creates the trend directory of a job.
+
+        Args:
+        - trend (list): The current trends.
+
+        Returns:
+        - dict: The job, holding the trend, its directory and then the output of each stage.
+        """
+        trend_name = self.trend_name or trend[self.trend_number]
+        path = modules.file_manager.create_media_folder(trend_name)
+        self.job_dir = path
+        return {"trend": trend, "trend_name": trend_name, "path": path}
+
+    def finish_job(self, job):
+        """
+        Builds the resources of a job whose stages all completed.
+        """
+        return self.build_output(job["trend"], job["trend_name"], job["path"], job["summary"], job["media"],
+                                 job["speech"], job["subtitles"], job["music"])
+
+    def stage_contents(self, job):
+        """
+        Stage: scrapes the articles of the trend.
+        """
+        return self.scrape_contents(job["trend_name"])
+
+    def stage_summary(self, job):
+        """
+        Stage: summarizes the articles.
+        """
+        return self.summarize_contents(job["contents"])
+
+    def stage_media(self, job):
+        """
+        Stage: searches and downloads the images and video segments.
+        """
+        return modules.media_finder.search_and_download_media(job["trend_name"], job["summary"]["TextScript"])
+
+    def stage_sentiment(self, job):
+        """
+        Stage: analyzes the sentiment of the text script.
+        """
+        return modules.sentiment_analysis.get_summarization_emotion(job["summary"]["TextScript"])
+
+    def stage_speech(self, job):
+        """
+        Stage: synthesizes the narration.
+        """
+        return modules.text_to_speech.get_text_to_speech(job["summary"]["TextScript"], job["path"], self.language)
+
+    def stage_music(self, job):
+        """
+        Stage: selects music matching the sentiment, long enough for the narration.
+        """
+        narration_duration = modules.audio_mixer.get_wav_duration(job["speech"])
+        return modules.media_finder.selectMusicByEmotion(job["sentiment"], MUSIC_FOLDER, narration_duration)
+
+    def stage_subtitles(self, job):
+        """
+        Stage: transcribes the narration into subtitles.
+        """
+        return modules.subtitles.generate_srt(job["speech"], job["path"])
+
+    def build_output(self, trend, trend_name, path, summary, media, audio_file, srt_file, music_path):
+        """
+        Assembles the resources of a trend into the dictionary used by the render.
+
+        Args:
+        - trend (list): The current trends.
+        - trend_name (str): The name of the trend.
+        - path (str): The trend directory.
+        - summary (dict): Output of `summarize_contents`.
+        - media (list): Paths of the images and video segments.
+        - audio_file (str): Path of the narration.
+        - srt_file (str): Path of the subtitles.
+        - music_path (dict): The selected music and its attribution.
+
+        Returns:
+        - dict: Dictionary containing generated resources.
+        """
+        tags = [f"#{tag}" for index, tag in enumerate(summary["Tags"]) if index < 15]
         tags = " ".join(tags)
-        music_path = modules.media_finder.selectMusicByEmotion(sentiment_analysis_output, music_folder_path)
-        
-        if not music_path:
-            print("Error: Music selection failed.")
-            shutil.rmtree(path)
-            return None
-        
-        audio_file = modules.text_to_speech.get_text_to_speech(text_script, path, self.language)
-        
-        if not audio_file:
-            print("Error: Text-to-Speech conversion failed.")
-            shutil.rmtree(path)
-            return None
-        
-        srt_file = modules.subtitles.generate_srt(audio_file, path)
-        
-        if not srt_file:
-            print("Error: Subtitle generation failed.")
-            shutil.rmtree(path)
-            return None
-        
+
         output = {
             "Trend": trend,
-            "Trend_name": trend[self.trend_number],
-            "TextScript": text_script,
+            "Trend_name": trend_name,
+            "TextScript": summary["TextScript"],
             "Audio": audio_file,
             "Subs": srt_file,
-            "Description": f"{description}",
+            "Description": f"{summary['Description']}",
             "Tags": tags + " #IA",
             "Images": media,
             "MusicPath": music_path,
             "Dir": path
         }
-        
+
         return output
 
+    def render_video(self, output, profile=None):
+        """
+        Renders the video of the generated resources, reusing it if a previous run already rendered it.
+
+        The resources stay in the trend directory, so a preview can later be promoted
+        to a publish render without scraping or synthesizing anything again.
+
+        Args:
+        - output (dict): Resources returned by `generate_resources`.
+        - profile (str): Render profile, the one of the manager by default.
+
+        Returns:
+        - str: Path of the rendered video.
+        """
+        profile = profile or self.render_profile
+        self.job_dir = output["Dir"]
+        manifest = JobManifest(output["Dir"])
+        return self.run_stage(manifest, f"video_{profile}",
+                              lambda: self.run_profiled(f"render_{profile}", modules.editing.create_video_with_data, output, profile, None, self.render_workers),
+                              lambda value: [value])
+
     def main(self):
         output = self.generate_resources()
         
         if output:
-            modules.editing.create_video_with_data(output)
+            self.render_video(output)
             description_text = f"{output['Description']}\n\n🎵 Music: {output['MusicPath']['cc']}\n\n\n{output['Tags']}"
             return description_text
         
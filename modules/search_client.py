@@ -0,0 +1,168 @@
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from duckduckgo_search import DDGS
+from duckduckgo_search.exceptions import RatelimitException
+from modules.rate_limiter import TokenBucket, backoff_delay
+
+class SearchClient:
+    def __init__(self, rate=0.5, burst=2, timeout=10, retries=3, backoff_base=1.0, backoff_max=30.0, cache_seconds=3600):
+        """
+        DuckDuckGo text search shared by the whole process.
+
+        Queries go through a token bucket, failed queries are retried after a jittered
+        exponential backoff, and results are cached by (query, max_results) so that the
+        same search is never sent twice while fresh.
+
+        Args:
+        - rate (float): Queries allowed per second on average.
+        - burst (int): Queries allowed back to back.
+        - timeout (float): Seconds after which a query is abandoned.
+        - retries (int): Number of attempts per query.
+        - backoff_base (float): Delay cap of the first retry in seconds.
+        - backoff_max (float): Largest delay cap in seconds.
+        - cache_seconds (float): Time results stay fresh in the cache.
+        """
+        self.bucket = TokenBucket(rate, burst)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.cache_seconds = cache_seconds
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def query(self, query, max_results, timeout):
+        """
+        Sends one query to DuckDuckGo.
+
+        Args:
+        - query (str): The search query.
+        - max_results (int): Number of results requested.
+        - timeout (float): Timeout of the HTTP requests in seconds.
+
+        Returns:
+        - list: The results, dicts with "title", "href" and "body".
+        """
+        with DDGS(timeout=timeout) as ddgs:
+            return ddgs.text(query, max_results=max_results, safesearch="on") or []
+
+    def start_query(self, query, max_results, timeout):
+        """
+        Sends one query in its own daemon thread.
+
+        A pool would be starved by a few hung queries that were abandoned; a thread per
+        attempt leaves later searches unaffected, and each abandoned thread ends once its
+        HTTP request times out.
+
+        Args:
+        - query (str): The search query.
+        - max_results (int): Number of results requested.
+        - timeout (float): Timeout of the HTTP requests in seconds.
+
+        Returns:
+        - concurrent.futures.Future: The future results.
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+
+        def run():
+            try:
+                future.set_result(self.query(query, max_results, timeout))
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name="search", daemon=True).start()
+        return future
+
+    def get_cached(self, query, max_results):
+        """
+        Looks up fresh results of a query; a cached search with more results also answers smaller ones.
+
+        Args:
+        - query (str): The search query.
+        - max_results (int): Number of results requested.
+
+        Returns:
+        - list or None: The results, None on a cache miss.
+        """
+        now = time.monotonic()
+        with self.lock:
+            for (cached_query, cached_max), (stored_at, results) in list(self.cache.items()):
+                if now - stored_at > self.cache_seconds:
+                    del self.cache[(cached_query, cached_max)]
+                elif cached_query == query and (cached_max >= max_results or len(results) < cached_max):
+                    # A search that returned fewer results than requested has none left to give.
+                    return results[:max_results]
+        return None
+
+    def search(self, query, max_results, timeout=None, retries=None, backoff_base=None):
+        """
+        Returns the results of a query, from the cache or from DuckDuckGo.
+
+        The caller waits at most `timeout` seconds per attempt: a query still running is
+        abandoned rather than joined, and its HTTP request is bounded by the same timeout.
+
+        Args:
+        - query (str): The search query.
+        - max_results (int): Number of results requested.
+        - timeout (float): Overrides the client timeout.
+        - retries (int): Overrides the client number of attempts.
+        - backoff_base (float): Overrides the client delay cap of the first retry.
+
+        Returns:
+        - list: The results, empty if every attempt failed.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        backoff_base = self.backoff_base if backoff_base is None else backoff_base
+        cached = self.get_cached(query, max_results)
+        if cached is not None:
+            return cached
+
+        for attempt in range(retries):
+            self.bucket.acquire()
+            future = self.start_query(query, max_results, timeout)
+            try:
+                results = future.result(timeout=timeout)
+                with self.lock:
+                    self.cache[(query, max_results)] = (time.monotonic(), results)
+                return results
+            except FutureTimeoutError:
+                print(f"Search attempt {attempt + 1} for '{query}' timed out after {timeout} seconds.")
+            except RatelimitException as e:
+                print(f"Search attempt {attempt + 1} for '{query}' was rate limited: {e}")
+                # Slow the whole client down, not only this query.
+                self.bucket.acquire(self.bucket.capacity)
+            except Exception as e:
+                print(f"Exception during search attempt {attempt + 1} for '{query}': {e}")
+            if attempt < retries - 1:
+                time.sleep(backoff_delay(attempt, backoff_base, self.backoff_max))
+
+        print("Max retries reached, returning empty results.")
+        return []
+
+    def iter_results(self, query, page_size=10, max_pages=5):
+        """
+        Yields the results of a query, each result only once, for callers reading until they have enough.
+
+        The backend has no offset to ask for the next page, and asking again with a larger
+        `max_results` would download the earlier results again; so the query is sized for
+        every page up front and sent once.
+
+        Args:
+        - query (str): The search query.
+        - page_size (int): Number of results per page.
+        - max_pages (int): Maximum number of pages.
+
+        Yields:
+        - dict: The next result.
+        """
+        seen = set()
+        for result in self.search(query, page_size * max_pages):
+            href = result.get("href", "")
+            if href not in seen:
+                seen.add(href)
+                yield result
+
+default_client = SearchClient()
@@ -1,8 +1,27 @@
-from textblob import TextBlob
+import numpy as np
+from modules.sentiment_engine import score_texts
+from modules.keyword_matcher import KeywordMatcher
+
+def polarity_to_emotion(polarity):
+    """
+    Maps a polarity to the emotion used to pick the music.
+
+    Args:
+        polarity (float): Sentiment polarity between -1.0 and 1.0.
+
+    Returns:
+        int: 1 if the polarity is positive, -1 if negative, 0 if neutral.
+    """
+    if polarity > 0:
+        return 1
+    elif polarity < 0:
+        return -1
+    else:
+        return 0
 
 def get_summarization_emotion(summarization):
     """
-    Analyzes the sentiment polarity of a summarization using TextBlob.
+    Analyzes the sentiment polarity of a summarization with the TextBlob lexicon.
 
     Args:
         summarization (str): The text summarization to analyze.
@@ -10,52 +29,66 @@ def get_summarization_emotion(summarization):
     Returns:
         int: 1 if the sentiment polarity is positive, -1 if negative, 0 if neutral.
     """
-    blob = TextBlob(summarization)
+    return get_summarization_emotions([summarization])[0]
 
-    sentiment = blob.sentiment
+def get_summarization_emotions(summarizations):
+    """
+    Analyzes the sentiment of many summarizations in one batched call.
 
-    if sentiment.polarity > 0:
-        return 1
-    elif sentiment.polarity < 0:
-        return -1
-    else:
-        return 0
+    Args:
+        summarizations (list): The text summarizations to analyze.
+
+    Returns:
+        list: The emotion (1, -1 or 0) of each summarization.
+    """
+    return [polarity_to_emotion(polarity) for polarity, _ in score_texts(summarizations)]
+
+def get_sentence_emotions(summarization):
+    """
+    Analyzes the sentiment of each sentence, to follow mood changes across the video.
+
+    Args:
+        summarization (str): The text summarization to analyze.
+
+    Returns:
+        np.ndarray: The emotion (1, -1 or 0) of each sentence.
+    """
+    _, sentence_polarities = score_texts([summarization])[0]
+    return np.sign(sentence_polarities).astype(int)
     
     
+EMOJI_DICT = {
+    "love": "❤️",
+    "happy": "😊",
+    "sad": "😢",
+    "excited": "🤩",
+    "angry": "😠",
+    "surprised": "😲",
+    "funny": "😂",
+    "news": "📰",
+    "sports": "⚽",
+    "music": "🎵",
+    "food": "🍔",
+    "travel": "✈️",
+    "fashion": "👗",
+    "technology": "💻",
+    "health": "🏥"
+}
+EMOJI_MATCHER = KeywordMatcher(EMOJI_DICT, whole_words=False)
+
 def select_emoji_based_on_description(description):
     """
-    Applies the summarization pipeline to a list of article contents.
+    Selects an emoji matching the first keyword (in EMOJI_DICT order) found in a description.
 
     Args:
-    contents (list): List of article contents.
-    number_of_sentences (int): Desired number of sentences in the final summarized text.
+    description (str): The description to scan.
 
     Returns:
-    tuple: A tuple containing the summarized text and word frequencies used.
-    """
-    emoji_dict = {
-        "love": "❤️",
-        "happy": "😊",
-        "sad": "😢",
-        "excited": "🤩",
-        "angry": "😠",
-        "surprised": "😲",
-        "funny": "😂",
-        "news": "📰",
-        "sports": "⚽",
-        "music": "🎵",
-        "food": "🍔",
-        "travel": "✈️",
-        "fashion": "👗",
-        "technology": "💻",
-        "health": "🏥"
-    }
-    
-    description_lower = description.lower()
+    str: The emoji of the keyword, or a robot if no keyword is found.
+    """
+    keyword = EMOJI_MATCHER.first_keyword(description)
     
-    for keyword, emoji in emoji_dict.items():
-        if keyword in description_lower:
-            return emoji
+    if keyword:
+        return EMOJI_DICT[keyword]
     
     return "🤖"
-
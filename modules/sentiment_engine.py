@@ -0,0 +1,193 @@
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+from functools import lru_cache
+import numpy as np
+import textblob
+
+LEXICON_PATH = os.path.join(os.path.dirname(textblob.__file__), "en", "en-sentiment.xml")
+NEGATIONS = ("no", "not", "n't", "never")
+
+TOKEN_PATTERN = re.compile(r"n't|[a-z0-9][a-z0-9'\-]*|!")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+
+class Lexicon:
+    def __init__(self, words, polarity, subjectivity, intensity, modifier):
+        """
+        Compact sentiment lexicon: a word to index dict and one NumPy array per score.
+
+        Args:
+        - words (dict): Maps each word to its row in the arrays.
+        - polarity (np.ndarray): Polarity of each word (-1.0 to 1.0).
+        - subjectivity (np.ndarray): Subjectivity of each word (0.0 to 1.0).
+        - intensity (np.ndarray): Intensity each word applies to the following one.
+        - modifier (np.ndarray): Whether each word is an adverb modifying the following one.
+        """
+        self.words = words
+        self.polarity = polarity
+        self.subjectivity = subjectivity
+        self.intensity = intensity
+        self.modifier = modifier
+
+@lru_cache(maxsize=None)
+def load_lexicon(path=LEXICON_PATH):
+    """
+    Loads the pattern sentiment lexicon used by TextBlob once per process.
+
+    Scores of the senses of a word are averaged per part of speech and then across
+    parts of speech, and adjectives are mapped to their adverbs, as TextBlob does.
+
+    Args:
+        path (str): Path of the en-sentiment.xml file.
+
+    Returns:
+        Lexicon: The compact lexicon.
+    """
+    senses = {}
+    for element in ElementTree.parse(path).getroot().iter("word"):
+        word = element.attrib.get("form")
+        if not word:
+            continue
+        scores = (float(element.attrib.get("polarity", 0.0)),
+                  float(element.attrib.get("subjectivity", 0.0)),
+                  float(element.attrib.get("intensity", 1.0)))
+        senses.setdefault(word, {}).setdefault(element.attrib.get("pos"), []).append(scores)
+
+    entries = {}
+    for word, by_pos in senses.items():
+        averaged = {pos: np.mean(scores, axis=0) for pos, scores in by_pos.items()}
+        entries[word] = (np.mean(list(averaged.values()), axis=0), "RB" in averaged)
+    for word, by_pos in senses.items():
+        if "JJ" in by_pos:
+            adverb = word[:-1] + "i" if word.endswith("y") else word
+            adverb = adverb[:-2] if adverb.endswith("le") else adverb
+            entries[adverb + "ly"] = (np.mean(by_pos["JJ"], axis=0), True)
+
+    words = {word: index for index, word in enumerate(entries)}
+    scores = np.array([entry[0] for entry in entries.values()], dtype=np.float64)
+    modifier = np.array([entry[1] for entry in entries.values()], dtype=bool)
+    return Lexicon(words, scores[:, 0], scores[:, 1], scores[:, 2], modifier)
+
+def split_sentences(text):
+    """
+    Splits a text into sentences on end punctuation and paragraph breaks.
+
+    Args:
+        text (str): The text to split.
+
+    Returns:
+        list: The non-empty sentences.
+    """
+    return [sentence for sentence in SENTENCE_PATTERN.split(text) if sentence.strip()]
+
+def score_sentences(sentences, lexicon=None):
+    """
+    Scores a batch of sentences in one vectorized pass.
+
+    Known words are averaged as TextBlob does: an adverb modifier multiplies the next
+    known word by its intensity ("very good"), a preceding negation halves and flips
+    the polarity ("not good"), and an exclamation mark boosts the previous word.
+
+    Args:
+        sentences (list): The sentences to score.
+        lexicon (Lexicon): The lexicon to use, the TextBlob one by default.
+
+    Returns:
+        tuple: NumPy arrays with the polarity of every assessed word and the index of its sentence.
+    """
+    lexicon = lexicon or load_lexicon()
+    tokens = []
+    owners = []
+    for index, sentence in enumerate(sentences):
+        sentence_tokens = TOKEN_PATTERN.findall(sentence.lower().replace("n't", " n't"))
+        tokens.extend(sentence_tokens)
+        owners.extend([index] * len(sentence_tokens))
+    if not tokens:
+        return np.zeros(0), np.zeros(0, dtype=int)
+
+    ids = np.array([lexicon.words.get(token, -1) for token in tokens])
+    owners = np.array(owners)
+    negation = np.array([token in NEGATIONS for token in tokens])
+    exclamation = np.array([token == "!" for token in tokens])
+    short = np.array([len(token.strip("'")) <= 1 for token in tokens])
+    known = ids >= 0
+    safe_ids = np.where(known, ids, 0)
+    polarity = lexicon.polarity[safe_ids]
+    intensity = lexicon.intensity[safe_ids]
+
+    def previous(values, steps=1, fill=False):
+        shifted = np.full_like(values, fill)
+        shifted[steps:] = values[:-steps]
+        same_sentence = np.zeros(len(values), dtype=bool)
+        same_sentence[steps:] = owners[steps:] == owners[:-steps]
+        return np.where(same_sentence, shifted, fill)
+
+    def following(values, fill=False):
+        shifted = np.full_like(values, fill)
+        shifted[:-1] = values[1:]
+        same_sentence = np.zeros(len(values), dtype=bool)
+        same_sentence[:-1] = owners[:-1] == owners[1:]
+        return np.where(same_sentence, shifted, fill)
+
+    modified = known & previous(known & lexicon.modifier[safe_ids])
+    polarity = np.where(modified, np.clip(polarity * previous(intensity, fill=1.0), -1.0, 1.0), polarity)
+    negated = previous(negation) | (previous(negation, 2) & previous(short & ~known))
+    negated = negated | (modified & previous(negated))
+
+    # A modifier followed by a known word is merged into that word's assessment.
+    assessed = known & ~following(modified)
+
+    # Every exclamation mark boosts the last assessed word of its sentence.
+    positions = np.arange(len(tokens))
+    last_assessed = np.maximum.accumulate(np.where(assessed, positions, -1))
+    boosted = exclamation & (last_assessed >= 0)
+    boosted[boosted] = owners[last_assessed[boosted]] == owners[boosted]
+    boosts = np.bincount(last_assessed[boosted], minlength=len(tokens))
+    polarity = np.clip(polarity * 1.25 ** boosts, -1.0, 1.0)
+    polarity = np.where(negated, polarity * -0.5, polarity)
+
+    return polarity[assessed], owners[assessed]
+
+def score_texts(texts, lexicon=None):
+    """
+    Scores many texts in one batched call.
+
+    Args:
+        texts (list): The texts to score.
+        lexicon (Lexicon): The lexicon to use, the TextBlob one by default.
+
+    Returns:
+        list: For each text, a tuple with its overall polarity and the NumPy array of its per-sentence polarities.
+    """
+    sentences_per_text = [split_sentences(text) for text in texts]
+    sentences = [sentence for text_sentences in sentences_per_text for sentence in text_sentences]
+    sentence_texts = np.repeat(np.arange(len(texts)), [len(text_sentences) for text_sentences in sentences_per_text])
+    polarities, owners = score_sentences(sentences, lexicon)
+
+    def average(groups, count):
+        sums = np.bincount(groups, weights=polarities, minlength=count).astype(np.float64)
+        counts = np.bincount(groups, minlength=count)
+        return np.divide(sums, counts, out=np.zeros(count), where=counts > 0)
+
+    sentence_polarities = average(owners, len(sentences))
+    text_polarities = average(sentence_texts[owners], len(texts))
+
+    results = []
+    start = 0
+    for index, text_sentences in enumerate(sentences_per_text):
+        end = start + len(text_sentences)
+        results.append((float(text_polarities[index]), sentence_polarities[start:end]))
+        start = end
+    return results
+
+def get_polarity(text):
+    """
+    Computes the overall polarity of a single text.
+
+    Args:
+        text (str): The text to score.
+
+    Returns:
+        float: The polarity, between -1.0 and 1.0.
+    """
+    return score_texts([text])[0][0]
@@ -0,0 +1,172 @@
+import asyncio
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from modules.job_manifest import MANIFEST_NAME, JobManifest
+
+MEDIA_FOLDER = "media"
+# Folders of the media root that are not trend job folders.
+PROTECTED_FOLDERS = ("music", "props", "store", "results")
+
+def get_folder_usage(folder_path):
+    """
+    Measures a folder with a single walk.
+
+    Args:
+        folder_path (str): The folder.
+
+    Returns:
+        tuple: Total size in bytes and modification time of the most recently written file.
+    """
+    size = 0
+    last_modified = os.path.getmtime(folder_path)
+    for root, dirs, files in os.walk(folder_path):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            size += stat.st_size
+            last_modified = max(last_modified, stat.st_mtime)
+    return size, last_modified
+
+class StorageManager:
+    def __init__(self, root=MEDIA_FOLDER, quota_bytes=5 * 1024 ** 3, stale_hours=24, orphan_minutes=30):
+        """
+        Keeps the disk usage of the trend job folders under a quota.
+
+        A job folder is collected when it is an orphan (not in use, no rendered video and
+        not written for `orphan_minutes`, i.e. its job crashed or timed out), when it is
+        stale (not written for `stale_hours`), or, least recently written first, while the
+        folders exceed the quota. Folders marked in use are never collected.
+
+        Args:
+        - root (str): The media folder containing the job folders.
+        - quota_bytes (int): Maximum total size of the job folders.
+        - stale_hours (float): Idle time after which a job folder is collected.
+        - orphan_minutes (float): Idle time after which an unfinished job folder is collected.
+        """
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.stale_seconds = stale_hours * 3600
+        self.orphan_seconds = orphan_minutes * 60
+        self.in_use_folders = {}
+        self.deletions = set()
+
+    @contextmanager
+    def in_use(self, folder_path):
+        """
+        Protects a job folder from collection while a job works in it.
+
+        Args:
+        - folder_path (str): The job folder.
+        """
+        key = os.path.normpath(folder_path)
+        self.in_use_folders[key] = self.in_use_folders.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            self.in_use_folders[key] -= 1
+            if not self.in_use_folders[key]:
+                del self.in_use_folders[key]
+
+    def scan(self):
+        """
+        Lists the job folders with their size and last write.
+
+        Returns:
+        - list: Dicts with "path", "size", "last_modified", "finished" and "in_use".
+        """
+        folders = []
+        if not os.path.isdir(self.root):
+            return folders
+        for entry in os.scandir(self.root):
+            if not entry.is_dir() or entry.name in PROTECTED_FOLDERS:
+                continue
+            size, last_modified = get_folder_usage(entry.path)
+            manifest_exists = os.path.exists(os.path.join(entry.path, MANIFEST_NAME))
+            finished = manifest_exists and any(stage.startswith("video_") for stage in JobManifest(entry.path).stages)
+            folders.append({
+                "path": entry.path,
+                "size": size,
+                "last_modified": last_modified,
+                "finished": finished,
+                "in_use": os.path.normpath(entry.path) in self.in_use_folders,
+            })
+        return folders
+
+    def plan(self, folders, now=None):
+        """
+        Chooses the job folders to delete.
+
+        Args:
+        - folders (list): Output of `scan`.
+        - now (float): Current time, `time.time()` by default.
+
+        Returns:
+        - list: The folders to delete, with the reason in "reason".
+        """
+        now = now or time.time()
+        candidates = [folder for folder in folders if not folder["in_use"]]
+        selected = []
+        for folder in candidates:
+            idle = now - folder["last_modified"]
+            if idle > self.stale_seconds:
+                selected.append(dict(folder, reason="stale"))
+            elif not folder["finished"] and idle > self.orphan_seconds:
+                selected.append(dict(folder, reason="orphan"))
+
+        selected_paths = {folder["path"] for folder in selected}
+        usage = sum(folder["size"] for folder in folders) - sum(folder["size"] for folder in selected)
+        for folder in sorted(candidates, key=lambda folder: folder["last_modified"]):
+            if usage <= self.quota_bytes:
+                break
+            if folder["path"] not in selected_paths:
+                selected.append(dict(folder, reason="quota"))
+                usage -= folder["size"]
+        return selected
+
+    def collect(self):
+        """
+        Scans the job folders and deletes the ones selected by `plan`.
+
+        Returns:
+        - int: Number of bytes freed.
+        """
+        freed = 0
+        for folder in self.plan(self.scan()):
+            # A job may have started using the folder since the scan.
+            if os.path.normpath(folder["path"]) in self.in_use_folders:
+                continue
+            print(f"Deleting {folder['reason']} job folder {folder['path']} ({folder['size'] / 1024 ** 2:.1f} MB)")
+            shutil.rmtree(folder["path"], ignore_errors=True)
+            freed += folder["size"]
+        return freed
+
+    async def poll(self, context=None):
+        """
+        Job queue callback: collects the job folders in a thread, off the event loop.
+
+        Args:
+        - context: The job queue context (unused).
+        """
+        try:
+            await asyncio.to_thread(self.collect)
+        except Exception as e:
+            print(f"Storage collection failed: {e}")
+
+    def delete_later(self, folder_path):
+        """
+        Deletes a folder in a background thread, without making the caller wait.
+
+        Args:
+        - folder_path (str): The folder to delete.
+
+        Returns:
+        - asyncio.Task: The deletion, kept referenced until it finishes.
+        """
+        task = asyncio.ensure_future(asyncio.to_thread(shutil.rmtree, folder_path, ignore_errors=True))
+        self.deletions.add(task)
+        task.add_done_callback(self.deletions.discard)
+        return task
@@ -1,6 +1,7 @@
 import re
 import nltk
 import heapq
+from modules.keyword_matcher import KeywordMatcher
 
 def preprocess_article(article_content):
     """
@@ -19,6 +20,30 @@ def preprocess_article(article_content):
 
     return article_content, formatted_article_content
 
+PROMO_KEYWORDS = ['compensated', 'promotional', 'sponsored', 'on this site', 'on this website', 'subscription']
+PROMO_MATCHER = KeywordMatcher(PROMO_KEYWORDS)
+
+def get_sentence_spans(text, sentences):
+    """
+    Locates the tokenized sentences in the original text.
+
+    Args:
+        text (str): The original text.
+        sentences (list): The sentences, in order, as returned by the tokenizer.
+
+    Returns:
+        list: The (start, end) offsets of each sentence.
+    """
+    spans = []
+    position = 0
+    for sentence in sentences:
+        start = text.find(sentence, position)
+        if start < 0:
+            start = position
+        position = start + len(sentence)
+        spans.append((start, position))
+    return spans
+
 def filter_promotional_sentences(text):
     """
     Filters out sentences containing promotional or commercial content.
@@ -29,14 +54,10 @@ def filter_promotional_sentences(text):
     Returns:
         str: The filtered text without promotional sentences.
     """
-    promo_keywords = [ 'compensated', 'promotional', 'sponsored', 'on this site', 'on this website', 'subscription']
-
-    promo_pattern = r'\b(?:{})\b'.format('|'.join(promo_keywords))
-
-    filtered_sentences = []
-    for sentence in nltk.sent_tokenize(text):
-        if not re.search(promo_pattern, sentence, flags=re.IGNORECASE):
-            filtered_sentences.append(sentence)
+    sentences = nltk.sent_tokenize(text)
+    spans = get_sentence_spans(text, sentences)
+    kept = set(PROMO_MATCHER.filter_spans(text, spans))
+    filtered_sentences = [sentence for sentence, span in zip(sentences, spans) if span in kept]
 
     return ' '.join(filtered_sentences)
 
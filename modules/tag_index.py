@@ -0,0 +1,153 @@
+import hashlib
+import heapq
+import math
+import os
+import re
+import sqlite3
+from collections import Counter
+from contextlib import contextmanager
+
+TAG_INDEX_PATH = os.path.join("media", "tags.db")
+# SQLite limits the number of parameters of a statement.
+QUERY_CHUNK = 500
+
+def extract_terms(text, stopwords):
+    """
+    Splits a text into candidate tag terms.
+
+    Args:
+        text (str): The text.
+        stopwords (set): Words never used as tags.
+
+    Returns:
+        collections.Counter: Number of occurrences of each term.
+    """
+    words = re.findall(r"[a-z]+", text.lower())
+    return Counter(word for word in words if len(word) > 2 and word not in stopwords)
+
+class TagIndex:
+    def __init__(self, path=TAG_INDEX_PATH, stopwords=None):
+        """
+        Document frequencies of the terms of every scraped article, stored in a SQLite file.
+
+        The index grows with each job: adding an article only touches the rows of its own
+        terms, and an article already indexed is recognized by its hash and skipped.
+
+        Args:
+        - path (str): Path of the SQLite database.
+        - stopwords (set): Words never used as tags, the NLTK English stopwords by default.
+        """
+        self.path = path
+        self.stopwords = stopwords
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with self.connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS documents (hash TEXT PRIMARY KEY)")
+            connection.execute("CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            connection.execute("INSERT OR IGNORE INTO stats VALUES ('documents', 0)")
+
+    @contextmanager
+    def connect(self):
+        """
+        Opens an autocommit connection to the database, closed when the block exits.
+        """
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def get_stopwords(self):
+        """
+        Returns the stopwords, loading the NLTK ones on first use.
+        """
+        if self.stopwords is None:
+            import nltk
+            self.stopwords = set(nltk.corpus.stopwords.words('english'))
+        return self.stopwords
+
+    def add_documents(self, texts):
+        """
+        Adds articles to the index, in one transaction.
+
+        Args:
+        - texts (list): The articles.
+
+        Returns:
+        - int: Number of articles that were not indexed yet.
+        """
+        added = 0
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for text in texts:
+                    document_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+                    if not connection.execute("INSERT OR IGNORE INTO documents VALUES (?)", (document_hash,)).rowcount:
+                        continue
+                    connection.executemany(
+                        "INSERT INTO terms VALUES (?, 1) ON CONFLICT (term) DO UPDATE SET df = df + 1",
+                        ((term,) for term in extract_terms(text, self.get_stopwords())))
+                    added += 1
+                connection.execute("UPDATE stats SET value = value + ? WHERE name = 'documents'", (added,))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return added
+
+    def get_document_frequencies(self, terms):
+        """
+        Looks up the document frequencies of some terms.
+
+        Args:
+        - terms (list): The terms.
+
+        Returns:
+        - tuple: The number of indexed documents, and a dict of the frequencies of the known terms.
+        """
+        frequencies = {}
+        with self.connect() as connection:
+            documents = connection.execute("SELECT value FROM stats WHERE name = 'documents'").fetchone()[0]
+            for start in range(0, len(terms), QUERY_CHUNK):
+                chunk = terms[start:start + QUERY_CHUNK]
+                rows = connection.execute(
+                    f"SELECT term, df FROM terms WHERE term IN ({','.join('?' * len(chunk))})", chunk)
+                frequencies.update(rows)
+        return documents, frequencies
+
+    def top_tags(self, texts, number_of_tags=15):
+        """
+        Chooses the terms of a job with the highest TF-IDF, the term frequencies summed over the job articles.
+
+        Args:
+        - texts (list): The articles of the job, already added to the index.
+        - number_of_tags (int): Number of tags.
+
+        Returns:
+        - list: The tags, best first.
+        """
+        term_counts = Counter()
+        for text in texts:
+            term_counts.update(extract_terms(text, self.get_stopwords()))
+        if not term_counts:
+            return []
+        documents, frequencies = self.get_document_frequencies(list(term_counts))
+        scores = {term: count * (math.log((1 + documents) / (1 + frequencies.get(term, 0))) + 1)
+                  for term, count in term_counts.items()}
+        return heapq.nlargest(number_of_tags, scores, key=scores.get)
+
+_default_index = None
+
+def get_default_index():
+    """
+    Returns the tag index of the process, opened on first use.
+
+    Returns:
+        TagIndex: The index stored at TAG_INDEX_PATH.
+    """
+    global _default_index
+    if _default_index is None:
+        _default_index = TagIndex()
+    return _default_index
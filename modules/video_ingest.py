@@ -0,0 +1,253 @@
+import re
+import subprocess
+import numpy as np
+from imageio_ffmpeg import get_ffmpeg_exe
+from moviepy.editor import VideoClip
+
+SEGMENT_SECONDS = 8
+SEGMENT_WIDTH = 1080
+USER_AGENT = "Mozilla/5.0"
+
+DURATION_PATTERN = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+
+def get_input_options(source):
+    """
+    Returns the ffmpeg options placed before the input, the HTTP ones only for a URL.
+
+    Args:
+        source (str): Path or URL of the video.
+
+    Returns:
+        list: The options.
+    """
+    if source.startswith(("http://", "https://")):
+        return ["-user_agent", USER_AGENT]
+    return []
+
+def build_probe_command(source):
+    """
+    Builds the ffmpeg command printing the container header of a video.
+
+    Args:
+        source (str): Path or URL of the video.
+
+    Returns:
+        list: The command.
+    """
+    return [get_ffmpeg_exe(), "-hide_banner"] + get_input_options(source) + ["-i", source]
+
+def parse_duration(probe_output):
+    """
+    Reads the duration from the header printed by ffmpeg.
+
+    Args:
+        probe_output (str): The stderr of the probe command.
+
+    Returns:
+        float or None: Duration in seconds, None if it is not printed.
+    """
+    match = DURATION_PATTERN.search(probe_output)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+def probe_duration(source):
+    """
+    Reads the duration of a local or remote video from its container header.
+
+    For a URL, ffmpeg only fetches the header through HTTP Range requests, not the whole file.
+
+    Args:
+        source (str): Path or URL of the video.
+
+    Returns:
+        float or None: Duration in seconds, None if it cannot be read.
+    """
+    try:
+        result = subprocess.run(build_probe_command(source), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=60)
+    except subprocess.TimeoutExpired:
+        print(f"Timed out while probing {source}")
+        return None
+    return parse_duration(result.stderr.decode(errors="ignore"))
+
+def choose_segment_start(duration, segment_seconds=SEGMENT_SECONDS, skip_ratio=0.1):
+    """
+    Chooses where the segment starts, skipping the intro of the clip when it is long enough.
+
+    Args:
+        duration (float or None): Duration of the clip in seconds.
+        segment_seconds (float): Duration of the segment to fetch.
+        skip_ratio (float): Fraction of the clip skipped at its start.
+
+    Returns:
+        float: Start of the segment in seconds.
+    """
+    if not duration:
+        return 0.0
+    return max(0.0, min(duration * skip_ratio, duration - segment_seconds))
+
+def build_segment_command(source, output_path, start, segment_seconds=SEGMENT_SECONDS, width=SEGMENT_WIDTH):
+    """
+    Builds the ffmpeg command fetching a segment of a video and transcoding it to the render width.
+
+    Args:
+        source (str): Path or URL of the video.
+        output_path (str): Path of the mp4 segment to write.
+        start (float): Start of the segment in seconds.
+        segment_seconds (float): Duration of the segment.
+        width (int): Width of the segment, the height keeps the aspect ratio.
+
+    Returns:
+        list: The command.
+    """
+    return [
+        get_ffmpeg_exe(), "-v", "error", "-y"
+    ] + get_input_options(source) + [
+        "-ss", f"{start:.3f}", "-t", f"{segment_seconds:.3f}", "-i", source,
+        "-an", "-vf", f"scale={width}:-2", "-c:v", "libx264", "-preset", "veryfast", "-crf", "20",
+        "-pix_fmt", "yuv420p", "-movflags", "+faststart", output_path
+    ]
+
+def fetch_segment(source, output_path, start=None, segment_seconds=SEGMENT_SECONDS, width=SEGMENT_WIDTH, timeout=300):
+    """
+    Fetches only a segment of a video and transcodes it once to the render width.
+
+    The seek is done by ffmpeg on the input, so for a URL only the byte ranges of the
+    segment are downloaded; the audio is dropped since the narration replaces it.
+
+    Args:
+        source (str): Path or URL of the video.
+        output_path (str): Path of the mp4 segment to write.
+        start (float): Start of the segment in seconds, chosen from the duration by default.
+        segment_seconds (float): Duration of the segment.
+        width (int): Width of the segment, the height keeps the aspect ratio.
+        timeout (float): Seconds after which the transfer is abandoned.
+
+    Returns:
+        str or None: The path of the segment, None if it could not be fetched.
+    """
+    if start is None:
+        start = choose_segment_start(probe_duration(source), segment_seconds)
+    command = build_segment_command(source, output_path, start, segment_seconds, width)
+    try:
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        print(f"Timed out while fetching a segment of {source}")
+        return None
+    if result.returncode != 0:
+        print(f"An error occurred while fetching a segment of {source}: {result.stderr.decode(errors='ignore').strip()}")
+        return None
+    return output_path
+
+class FrameStream:
+    def __init__(self, path, size, fps, loop=False):
+        """
+        Decodes a video sequentially through an ffmpeg pipe, one frame in memory at a time.
+
+        ffmpeg resamples the frame rate and scales and crops the frames to cover `size`, so
+        the frames arrive ready to composite. The decoder only starts on the first frame asked for.
+
+        Args:
+        - path (str): Path of the video.
+        - size (tuple): Width and height of the frames.
+        - fps (int): Frame rate of the frames.
+        - loop (bool): Whether to restart the video at its end, instead of holding its last frame.
+        """
+        self.path = path
+        self.size = size
+        self.fps = fps
+        self.loop = loop
+        self.frame_bytes = size[0] * size[1] * 3
+        self.process = None
+        self.index = -1
+        # Number of frames of the video, known once it was decoded to its end.
+        self.length = None
+        self.frame = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+
+    def open(self):
+        """
+        Starts the decoding from the first frame.
+        """
+        self.close()
+        width, height = self.size
+        command = [
+            get_ffmpeg_exe(), "-v", "error", "-i", self.path, "-an",
+            "-vf", f"fps={self.fps},scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height}",
+            "-f", "rawvideo", "-pix_fmt", "rgb24", "-"
+        ]
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=self.frame_bytes)
+        self.index = -1
+
+    def read(self):
+        """
+        Decodes the next frame; at the end of the video the last frame is kept.
+
+        Returns:
+        - bool: False if the video has no more frames.
+        """
+        data = self.process.stdout.read(self.frame_bytes) if self.process else b""
+        if len(data) < self.frame_bytes:
+            return False
+        self.frame = np.frombuffer(data, dtype=np.uint8).reshape(self.size[1], self.size[0], 3)
+        self.index += 1
+        return True
+
+    def get_frame(self, t):
+        """
+        Returns the frame shown at a time, decoding forward and restarting only on a backward seek
+        (or, for a looping video, at its end).
+
+        Args:
+        - t (float): Time in seconds.
+
+        Returns:
+        - np.ndarray: The RGB frame.
+        """
+        index = max(int(t * self.fps + 1e-6), 0)
+        if self.loop and self.length:
+            index %= self.length
+        if self.process is None or index < self.index:
+            self.open()
+        while self.index < index:
+            if not self.read():
+                if self.loop and self.length is None and self.index >= 0:
+                    self.length = self.index + 1
+                    return self.get_frame(t)
+                break
+        return self.frame
+
+    def close(self):
+        """
+        Stops the decoding process.
+        """
+        if self.process is None:
+            return
+        self.process.stdout.close()
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        self.process = None
+
+def make_video_clip(path, size, duration, fps):
+    """
+    Creates a clip streaming the frames of a video segment, looping it if it is shorter than the clip.
+
+    The decoder starts when the clip first plays, not when it is created, so that only the
+    backgrounds on screen hold an ffmpeg process.
+
+    Args:
+        path (str): Path of the video segment.
+        size (tuple): Width and height of the clip.
+        duration (float): Duration of the clip in seconds.
+        fps (int): Frame rate of the render.
+
+    Returns:
+        VideoClip: The clip; closing it stops the decoder.
+    """
+    stream = FrameStream(path, size, fps, loop=True)
+    # VideoClip reads a frame to learn its size: the blank frame, without starting the decoder.
+    clip = VideoClip(lambda t: stream.frame, duration=duration)
+    clip.make_frame = stream.get_frame
+    clip.close = stream.close
+    return clip
@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+from modules.file_manager import write_json_atomically
+
+STORE_FOLDER = os.path.join("media", "store")
+INDEX_NAME = "index.json"
+
+def make_key(trend, date, config_hash):
+    """
+    Builds the key identifying a rendered video.
+
+    Args:
+        trend (str): The trend name.
+        date (str): The date the trend refers to.
+        config_hash (str): Hash of the pipeline configuration used to render it.
+
+    Returns:
+        str: A filesystem safe key.
+    """
+    raw_key = json.dumps([trend, date, config_hash], ensure_ascii=False)
+    return hashlib.sha1(raw_key.encode("utf-8")).hexdigest()
+
+class VideoStore:
+    def __init__(self, folder_path=STORE_FOLDER, ttl_hours=6):
+        """
+        Initializes the store of rendered videos shared by every chat.
+
+        Args:
+        - folder_path (str): Folder where videos and their index are kept.
+        - ttl_hours (float): Hours after which a stored video is evicted.
+        """
+        self.folder_path = folder_path
+        self.index_path = os.path.join(folder_path, INDEX_NAME)
+        self.ttl_seconds = ttl_hours * 3600
+        self.in_flight = {}
+        self.entries = self.load_index()
+
+    def load_index(self):
+        """
+        Reads the index of stored videos, treating a missing or corrupted one as empty.
+
+        Returns:
+        - dict: Entries of the store, keyed by video key.
+        """
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable video store index {self.index_path}: {e}")
+            return {}
+
+    def save_index(self):
+        """
+        Writes the index atomically.
+        """
+        write_json_atomically(self.index_path, self.entries)
+
+    def evict_expired(self):
+        """
+        Removes the videos older than the TTL or whose file disappeared.
+        """
+        now = time.time()
+        expired = [key for key, entry in self.entries.items()
+                   if now - entry["created_at"] > self.ttl_seconds or not os.path.exists(entry["path"])]
+        for key in expired:
+            entry = self.entries.pop(key)
+            if os.path.exists(entry["path"]):
+                os.remove(entry["path"])
+        if expired:
+            self.save_index()
+
+    def get(self, key):
+        """
+        Returns the stored video for a key, if it is still valid.
+
+        Args:
+        - key (str): The video key.
+
+        Returns:
+        - dict or None: Entry with "path", "caption", "file_id" and "created_at".
+        """
+        self.evict_expired()
+        return self.entries.get(key)
+
+    def put(self, key, video_path, caption):
+        """
+        Moves a rendered video into the store.
+
+        Args:
+        - key (str): The video key.
+        - video_path (str): Path of the rendered video, moved into the store.
+        - caption (str): Caption sent along with the video.
+
+        Returns:
+        - dict: The stored entry.
+        """
+        self.evict_expired()
+        os.makedirs(self.folder_path, exist_ok=True)
+        stored_path = os.path.join(self.folder_path, f"{key}.mp4")
+        shutil.move(video_path, stored_path)
+        self.entries[key] = {
+            "path": stored_path,
+            "caption": caption,
+            "file_id": None,
+            "created_at": time.time(),
+        }
+        self.save_index()
+        return self.entries[key]
+
+    def set_file_id(self, key, file_id):
+        """
+        Remembers the Telegram file_id of an uploaded video, so later sends skip the upload.
+
+        Args:
+        - key (str): The video key.
+        - file_id (str): The file_id returned by Telegram.
+        """
+        if key in self.entries and file_id:
+            self.entries[key]["file_id"] = file_id
+            self.save_index()
+
+    async def get_or_create(self, key, create):
+        """
+        Returns the stored video for a key, rendering it only once even if many callers ask at the same time.
+
+        Args:
+        - key (str): The video key.
+        - create (callable): Coroutine function rendering the video, storing it with `put`
+          and returning the entry, or None on failure.
+
+        Returns:
+        - dict or None: The stored entry, None if the render failed.
+        """
+        entry = self.get(key)
+        if entry:
+            return entry
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(create())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        # Shielded so that a caller giving up does not cancel the render for the others.
+        return await asyncio.shield(task)
+
@@ -0,0 +1,98 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+def load_nltk_models():
+    """
+    Loads punkt, the stopwords, WordNet and the POS tagger.
+    """
+    import nltk
+    from nltk.corpus import wordnet as wn
+    nltk.sent_tokenize("Warm up the tokenizer. It loads punkt.")
+    nltk.word_tokenize("Warm up the word tokenizer.")
+    nltk.corpus.stopwords.words('english')
+    # WordNet loads lazily on the first lookup, the whole corpus at once.
+    wn.ensure_loaded()
+    wn.synsets("trend")
+    nltk.pos_tag(["warm", "up", "the", "tagger"])
+
+def load_sentiment_lexicon():
+    """
+    Parses the TextBlob sentiment lexicon.
+    """
+    import modules.sentiment_engine
+    modules.sentiment_engine.load_lexicon()
+
+def load_render_modules():
+    """
+    Imports MoviePy and configures ImageMagick, through the editing module.
+    """
+    import modules.editing
+
+WARM_UP_STEPS = [
+    ("nltk", load_nltk_models),
+    ("sentiment", load_sentiment_lexicon),
+    ("render", load_render_modules),
+]
+
+def warm_up():
+    """
+    Loads the models and libraries a job uses, so that the jobs of this process do not pay for it.
+
+    A missing model is reported and skipped; the job needing it fails later as it would have.
+
+    Returns:
+        dict: The seconds taken by each step.
+    """
+    timings = {}
+    for name, step in WARM_UP_STEPS:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            print(f"Warm-up step {name} failed: {e}")
+        timings[name] = time.perf_counter() - started
+    return timings
+
+def warm_up_and_initialize(initializer=None, *initargs):
+    """
+    Initializer of spawned workers: warms the worker up, then runs the initializer of the pool.
+    """
+    warm_up()
+    if initializer is not None:
+        initializer(*initargs)
+
+def get_worker_context():
+    """
+    Returns the multiprocessing context of the worker pools.
+
+    With forkserver, the server process imports `modules.preload` once, which warms it
+    up, and every worker is forked from it: the models are shared copy-on-write and a
+    new worker starts warm in milliseconds. Without forkserver (e.g. on Windows), the
+    workers are spawned and warmed up one by one.
+
+    Returns:
+        multiprocessing.context.BaseContext: The context.
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["modules.preload"])
+    return context
+
+def make_worker_pool(workers, initializer=None, initargs=()):
+    """
+    Creates a pool of warm worker processes.
+
+    Args:
+        workers (int): Number of processes.
+        initializer (callable): Function run in each worker when it starts.
+        initargs (tuple): Arguments of the initializer.
+
+    Returns:
+        ProcessPoolExecutor: The pool.
+    """
+    context = get_worker_context()
+    if context.get_start_method() != "forkserver":
+        initializer, initargs = warm_up_and_initialize, (initializer,) + tuple(initargs)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=initializer, initargs=initargs)
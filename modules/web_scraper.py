@@ -1,13 +1,10 @@
 from bs4 import BeautifulSoup
 from pytrends.request import TrendReq
-from duckduckgo_search import DDGS
 import requests
 from requests.exceptions import RequestException
-import threading
-import time
+from modules.search_client import default_client
 
-class TimeoutException(Exception):
-    pass
+BLACK_LIST = ["https://en.wikipedia.org", "https://www.wikipedia.org"]
 
 def get_trends():
     """
@@ -19,9 +16,25 @@ def get_trends():
     pytrend = TrendReq()
     return pytrend.trending_searches().iloc[:, 0].tolist()
 
+def is_blacklisted(result, blacklist):
+    """
+    Checks whether a search result points to a blacklisted site.
+
+    Args:
+        result (dict): The search result.
+        blacklist (list): List of URLs to exclude from search results.
+
+    Returns:
+        bool: True if the result is empty or blacklisted.
+    """
+    return not result or any(blacklisted in result.get("href", "") for blacklisted in blacklist)
+
 def search(topic, max_searches, blacklist, timeout=10, retries=3, backoff_factor=2):
     """
-    Searches for articles related to a given topic while excluding URLs in the blacklist, with retry logic.
+    Searches for articles related to a given topic while excluding URLs in the blacklist.
+
+    Queries go through the shared search client, which rate-limits, retries with a
+    jittered backoff and caches the results.
 
     Args:
         topic (str): The topic of interest for article searches.
@@ -29,39 +42,13 @@ def search(topic, max_searches, blacklist, timeout=10, retries=3, backoff_factor
         blacklist (list): List of URLs to exclude from search results.
         timeout (int): Timeout in seconds for the search.
         retries (int): Number of retry attempts.
-        backoff_factor (int): Backoff factor for retries.
+        backoff_factor (int): Delay cap in seconds of the first retry.
 
     Returns:
         list: List of filtered search results (articles), or empty list if timeout.
     """
-    def search_attempt():
-        with DDGS() as ddgs:
-            results = ddgs.text(topic, max_results=max_searches, safesearch="on")
-            filtered_results = [result for result in results if result and not any(blacklisted in result.get("href", "") for blacklisted in blacklist)]
-            return filtered_results
-
-    for attempt in range(retries):
-        try:
-            search_thread = threading.Thread(target=search_attempt)
-            search_thread.start()
-            search_thread.join(timeout=timeout)
-
-            if search_thread.is_alive():
-                print(f"Search attempt {attempt + 1} timed out after {timeout} seconds.")
-                search_thread.join()
-                continue
-            
-            return search_attempt()
-        
-        except Exception as e:
-            print(f"Exception during search attempt {attempt + 1}: {e}")
-            if attempt < retries - 1:
-                time.sleep(backoff_factor ** attempt)
-            else:
-                print("Max retries reached, returning empty results.")
-                return []
-
-    return []
+    results = default_client.search(topic, max_searches, timeout, retries, backoff_factor)
+    return [result for result in results if not is_blacklisted(result, blacklist)]
 
 def get_articles_on_topic_excluding_blacklist(topic, max_searches, blacklist, timeout=10):
     """
@@ -82,17 +69,28 @@ def get_site_content(url):
     try:
         response = requests.get(url, timeout=10)
         response.raise_for_status()
-
-        soup = BeautifulSoup(response.text, 'html.parser')
-        article_content = soup.find_all('p')
-        output = "\n\n".join(part.get_text() for part in article_content[1:-1])
-        if not output.strip():
-            return None
-        return output
+        return extract_article_text(response.text)
 
     except RequestException as e:
         return None
 
+def extract_article_text(html):
+    """
+    Extracts the paragraphs of an article page, without the first and the last one.
+
+    Args:
+        html (str): The HTML of the page.
+
+    Returns:
+        str or None: The text of the article, None if the page has no text.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    article_content = soup.find_all('p')
+    output = "\n\n".join(part.get_text() for part in article_content[1:-1])
+    if not output.strip():
+        return None
+    return output
+
 def get_trend_contents(trend_number, number_of_articles_to_read):
     """
     Retrieves the contents of articles related to a specific trending topic.
@@ -104,24 +102,29 @@ def get_trend_contents(trend_number, number_of_articles_to_read):
     Returns:
         list: List of article contents fetched for the trending topic.
     """
-    black_list = ["https://en.wikipedia.org", "https://www.wikipedia.org"]
-    trends = get_trends()
-    trend = trends[trend_number]
-
-    articles = []
-    contents = []
+    return get_topic_contents(get_trends()[trend_number], number_of_articles_to_read)
 
-    while len(contents) < number_of_articles_to_read:
-        remaining_articles_to_fetch = number_of_articles_to_read - len(contents)
-        new_articles = get_articles_on_topic_excluding_blacklist(trend, remaining_articles_to_fetch, black_list)
+def get_topic_contents(trend, number_of_articles_to_read):
+    """
+    Retrieves the contents of articles related to a topic.
 
-        for article in new_articles:
-            content = get_site_content(article.get("href", ""))
-            if content:
-                articles.append(article)
-                contents.append(content)
+    Args:
+        trend (str): The topic, e.g. the name of a trend.
+        number_of_articles_to_read (int): Desired number of articles to fetch.
 
-        if not new_articles:
-            break
+    Returns:
+        list: List of article contents fetched for the topic.
+    """
+    contents = []
 
-    return contents[:number_of_articles_to_read]
+    # The results are searched once, then read until enough articles were fetched.
+    for article in default_client.iter_results(trend, page_size=number_of_articles_to_read):
+        if is_blacklisted(article, BLACK_LIST):
+            continue
+        content = get_site_content(article.get("href", ""))
+        if content:
+            contents.append(content)
+            if len(contents) >= number_of_articles_to_read:
+                break
+
+    return contents
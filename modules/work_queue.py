@@ -0,0 +1,234 @@
+import json
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+QUEUE_PATH = os.path.join("media", "queue.db")
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+class WorkQueue(ABC):
+    """
+    Interface of the queue the render workers pull trend jobs from.
+
+    A job is leased by one worker at a time; the worker renews the lease with heartbeats,
+    and a lease that expires (e.g. because the worker crashed) makes the job available
+    again until it runs out of attempts.
+    """
+
+    @abstractmethod
+    def enqueue(self, payload, key=None):
+        """
+        Adds a job, once per deduplication key, and returns its id.
+        """
+
+    @abstractmethod
+    def claim(self, worker_id):
+        """
+        Leases an available job to a worker, None if there is none.
+        """
+
+    @abstractmethod
+    def heartbeat(self, job_id, worker_id):
+        """
+        Renews the lease of a job, False if the worker lost it.
+        """
+
+    @abstractmethod
+    def complete(self, job_id, worker_id, result):
+        """
+        Publishes the result of a leased job.
+        """
+
+    @abstractmethod
+    def fail(self, job_id, worker_id, error):
+        """
+        Reports a failed attempt at a leased job.
+        """
+
+    @abstractmethod
+    def get(self, job_id):
+        """
+        Returns a job, None if it does not exist.
+        """
+
+class SQLiteWorkQueue(WorkQueue):
+    def __init__(self, path=QUEUE_PATH, lease_seconds=300, max_attempts=3):
+        """
+        Initializes a work queue stored in a SQLite file, shared by the worker processes of one host.
+
+        SQLite locking is not reliable over network filesystems (NFS, SMB), so workers on
+        several machines need a queue served by a database server instead.
+
+        Args:
+        - path (str): Path of the SQLite database.
+        - lease_seconds (float): Time a worker owns a job without sending a heartbeat.
+        - max_attempts (int): Number of times a job is tried before being marked as failed.
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with self.connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    key TEXT UNIQUE,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    worker TEXT,
+                    lease_expires REAL,
+                    heartbeat_at REAL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )""")
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_expires)")
+
+    @contextmanager
+    def connect(self):
+        """
+        Opens an autocommit connection to the database, closed when the block exits.
+        """
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def enqueue(self, payload, key=None):
+        """
+        Adds a job to the queue. A job with the same key is only added once.
+
+        Args:
+        - payload (dict): JSON-serializable description of the job.
+        - key (str): Optional deduplication key, e.g. the video key.
+
+        Returns:
+        - int: The id of the new or existing job.
+        """
+        now = time.time()
+        with self.connect() as connection:
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO jobs (key, payload, status, max_attempts, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(payload), PENDING, self.max_attempts, now, now))
+            if cursor.rowcount:
+                return cursor.lastrowid
+            return connection.execute("SELECT id FROM jobs WHERE key = ?", (key,)).fetchone()["id"]
+
+    def claim(self, worker_id):
+        """
+        Leases the oldest available job: pending, or leased by a worker whose lease expired.
+
+        Args:
+        - worker_id (str): Identifier of the claiming worker.
+
+        Returns:
+        - dict or None: The job with its decoded payload, None if the queue is empty.
+        """
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute(
+                    "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+                    (FAILED, "Lease expired too many times", now, LEASED, now))
+                row = connection.execute(
+                    "SELECT id FROM jobs WHERE status = ? OR (status = ? AND lease_expires < ?) ORDER BY id LIMIT 1",
+                    (PENDING, LEASED, now)).fetchone()
+                if row is not None:
+                    connection.execute(
+                        "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, lease_expires = ?, heartbeat_at = ?, updated_at = ? WHERE id = ?",
+                        (LEASED, worker_id, now + self.lease_seconds, now, now, row["id"]))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return self.get(row["id"])
+
+    def heartbeat(self, job_id, worker_id):
+        """
+        Renews the lease of a job.
+
+        Args:
+        - job_id (int): The job id.
+        - worker_id (str): The worker owning the lease.
+
+        Returns:
+        - bool: False if the worker lost the lease (it expired and another worker claimed the job).
+        """
+        now = time.time()
+        with self.connect() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET lease_expires = ?, heartbeat_at = ?, updated_at = ? WHERE id = ? AND worker = ? AND status = ?",
+                (now + self.lease_seconds, now, now, job_id, worker_id, LEASED))
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, result):
+        """
+        Publishes the result of a job and marks it as done.
+
+        Args:
+        - job_id (int): The job id.
+        - worker_id (str): The worker owning the lease.
+        - result (dict): JSON-serializable result of the job.
+
+        Returns:
+        - bool: False if the worker no longer owned the job.
+        """
+        with self.connect() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, updated_at = ? WHERE id = ? AND worker = ? AND status = ?",
+                (DONE, json.dumps(result), time.time(), job_id, worker_id, LEASED))
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, worker_id, error):
+        """
+        Reports a failed attempt: the job is retried until it runs out of attempts.
+
+        Args:
+        - job_id (int): The job id.
+        - worker_id (str): The worker owning the lease.
+        - error (str): Description of the failure.
+
+        Returns:
+        - bool: False if the worker no longer owned the job.
+        """
+        with self.connect() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END, error = ?, worker = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND status = ?",
+                (FAILED, PENDING, str(error), time.time(), job_id, worker_id, LEASED))
+            return cursor.rowcount == 1
+
+    def get(self, job_id):
+        """
+        Returns a job.
+
+        Args:
+        - job_id (int): The job id.
+
+        Returns:
+        - dict or None: The job, with decoded payload and result.
+        """
+        with self.connect() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
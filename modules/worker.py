@@ -0,0 +1,166 @@
+import argparse
+import os
+import shutil
+import socket
+import threading
+import time
+from datetime import datetime
+from modules.job_manifest import JobManifest
+from modules.resource_manager import ResourceManager
+from modules.video_store import make_key
+from modules.warmup import warm_up
+from modules.web_scraper import get_trends
+from modules.work_queue import SQLiteWorkQueue, QUEUE_PATH
+
+RESULTS_FOLDER = os.path.join("media", "results")
+
+def make_worker_id():
+    """
+    Builds an identifier unique across the processes sharing the queue, and across hosts in the logs.
+
+    Returns:
+        str: The worker identifier.
+    """
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def enqueue_trends(queue, number_of_trends, **resource_manager_options):
+    """
+    Adds one render job per top trend to the queue.
+
+    The jobs are keyed like the stored videos, on the trend, the day and the pipeline
+    configuration, so that enqueuing again the same day does not duplicate them.
+
+    Args:
+        queue (WorkQueue): The queue to fill.
+        number_of_trends (int): Number of top trends to render.
+        resource_manager_options: Extra ResourceManager parameters shared by every job.
+
+    Returns:
+        list: The ids of the jobs.
+    """
+    trends = get_trends()
+    date_string = datetime.now().strftime("%d-%m-%Y")
+    job_ids = []
+    for trend_number, trend in enumerate(trends[:number_of_trends]):
+        config_hash = ResourceManager(trend_number, **resource_manager_options).config_hash()
+        job_ids.append(queue.enqueue({"trend_number": trend_number, "trend": trend, "options": resource_manager_options},
+                                     key=make_key(trend, date_string, config_hash)))
+    return job_ids
+
+def process_job(payload, results_folder=RESULTS_FOLDER):
+    """
+    Runs the resource pipeline and the render of a job.
+
+    Args:
+        payload (dict): The job payload, with "trend_number", optionally the "trend" name it was keyed on,
+            and ResourceManager "options". The named trend is rendered even if its rank changed since.
+        results_folder (str): Shared folder where the finished video is published.
+
+    Returns:
+        dict: The published video, its description, the trend name, the seconds of each stage and the published profiles.
+    """
+    resource_manager = ResourceManager(payload["trend_number"], trend_name=payload.get("trend"), **payload.get("options", {}))
+    output = resource_manager.generate_resources()
+    if not output:
+        raise RuntimeError(f"Resource generation failed for trend {payload['trend_number']}")
+    video_path = resource_manager.render_video(output)
+    if not video_path:
+        raise RuntimeError(f"Render failed for trend {output['Trend_name']}")
+
+    os.makedirs(results_folder, exist_ok=True)
+    published_path = os.path.join(results_folder, f"{os.path.basename(output['Dir'])}.mp4")
+    shutil.move(video_path, published_path)
+    # Profiles of profiled jobs are published next to the video.
+    profiles = []
+    for file_name in sorted(os.listdir(output['Dir'])):
+        if file_name.startswith("profile-"):
+            profiles.append(os.path.join(results_folder, f"{os.path.basename(output['Dir'])}.{file_name}"))
+            shutil.move(os.path.join(output['Dir'], file_name), profiles[-1])
+    stages = JobManifest(output['Dir']).stage_seconds()
+    shutil.rmtree(output['Dir'], ignore_errors=True)
+    return {
+        "video": published_path,
+        "trend": output["Trend_name"],
+        "description": f"{output['Description']}\n\n🎵 Music: {output['MusicPath']['cc']}\n\n\n{output['Tags']}",
+        "stages": stages,
+        "profiles": profiles,
+    }
+
+def keep_lease(queue, job_id, worker_id, stop_event, lease_lost):
+    """
+    Sends heartbeats for a job until the stop event is set or the lease is lost.
+
+    Args:
+        queue (WorkQueue): The queue owning the job.
+        job_id (int): The job id.
+        worker_id (str): The worker owning the lease.
+        stop_event (threading.Event): Set when the job is finished.
+        lease_lost (threading.Event): Set when the lease expired, the job may then belong to another worker.
+    """
+    interval = queue.lease_seconds / 3
+    while not stop_event.wait(interval):
+        if not queue.heartbeat(job_id, worker_id):
+            print(f"Worker {worker_id} lost the lease of job {job_id}.")
+            lease_lost.set()
+            return
+
+def run_worker(queue, worker_id=None, poll_interval=5, stop_event=None, exit_when_empty=False):
+    """
+    Pulls jobs from the queue and processes them until stopped.
+
+    Args:
+        queue (WorkQueue): The queue to pull jobs from.
+        worker_id (str): The worker identifier, derived from the host and the pid by default.
+        poll_interval (float): Seconds to wait when the queue is empty.
+        stop_event (threading.Event): Stops the worker when set.
+        exit_when_empty (bool): Whether to return as soon as the queue is empty.
+    """
+    worker_id = worker_id or make_worker_id()
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        job = queue.claim(worker_id)
+        if job is None:
+            if exit_when_empty:
+                return
+            stop_event.wait(poll_interval)
+            continue
+
+        heartbeat_stop = threading.Event()
+        lease_lost = threading.Event()
+        heartbeat = threading.Thread(target=keep_lease, args=(queue, job["id"], worker_id, heartbeat_stop, lease_lost), daemon=True)
+        heartbeat.start()
+        started = time.perf_counter()
+        try:
+            result = process_job(job["payload"])
+            result["seconds"] = time.perf_counter() - started
+            if lease_lost.is_set():
+                # The job may have been claimed again: its new owner reports it.
+                print(f"Worker {worker_id} dropped the result of job {job['id']}, whose lease it lost.")
+            elif queue.complete(job["id"], worker_id, result):
+                print(f"Worker {worker_id} finished job {job['id']} in {result['seconds']:.1f} s.")
+            else:
+                print(f"Worker {worker_id} finished job {job['id']}, which it no longer owned.")
+        except Exception as e:
+            print(f"Worker {worker_id} failed job {job['id']} (attempt {job['attempts']}): {e}")
+            if not lease_lost.is_set():
+                queue.fail(job["id"], worker_id, repr(e))
+        finally:
+            heartbeat_stop.set()
+            heartbeat.join()
+
+def main():
+    parser = argparse.ArgumentParser(description="Render worker pulling trend jobs from a shared queue.")
+    parser.add_argument("--queue", default=QUEUE_PATH, help="Path of the SQLite queue shared by the workers.")
+    parser.add_argument("--enqueue", type=int, default=0, help="Enqueue this many top trends before working.")
+    parser.add_argument("--exit-when-empty", action="store_true", help="Stop once the queue is empty.")
+    args = parser.parse_args()
+
+    queue = SQLiteWorkQueue(args.queue)
+    # The models are loaded before the first claim, so the lease of a job is not spent loading them.
+    warm_up()
+    if args.enqueue:
+        enqueue_trends(queue, args.enqueue)
+    run_worker(queue, exit_when_empty=args.exit_when_empty)
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,52 @@
+import asyncio
+import gc
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+import wave
+import httpx
+import numpy as np
+from imageio_ffmpeg import get_ffmpeg_exe
+from moviepy.editor import ColorClip
+from PIL import Image
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
 import modules.summarize as summarize
 import modules.web_scraper as web_scraper
 import modules.sentiment_analysis as sentiment_analysis
 import modules.media_finder as media_finder
+import modules.job_manifest as job_manifest
+import modules.resource_manager as resource_manager
+import modules.video_store as video_store
+import modules.music_catalog as music_catalog
+import modules.audio_mixer as audio_mixer
+import modules.keyword_matcher as keyword_matcher
+import modules.work_queue as work_queue
+import modules.worker as worker
+import modules.file_manager as file_manager
+import modules.video_ingest as video_ingest
+import modules.frame_renderer as frame_renderer
+import modules.motion as motion
+import modules.editing as editing
+import modules.search_client as search_client
+import modules.rate_limiter as rate_limiter
+import modules.async_pipeline as async_pipeline
+import modules.delivery as delivery
+import modules.prerender as prerender
+import modules.storage_manager as storage_manager
+import modules.profiler as profiler
+import modules.media_dedup as media_dedup
+import modules.tag_index as tag_index
+import modules.deadline as deadline
+import modules.warmup as warmup
+import batch
+import loadtest
 class TestWebScraper(unittest.TestCase):
 
     def test_get_trends(self):
@@ -20,6 +64,432 @@ class TestWebScraper(unittest.TestCase):
         content = web_scraper.get_site_content(url)
         self.assertTrue(len(content) > 0)
 
+class FakeSearchClient(search_client.SearchClient):
+
+    def __init__(self, available, delay=0, **options):
+        super().__init__(rate=1000, burst=1000, backoff_base=0.01, **options)
+        self.available = available
+        self.delay = delay
+        self.queries = []
+
+    def query(self, query, max_results, timeout):
+        self.queries.append(max_results)
+        time.sleep(self.delay)
+        return [{"href": f"https://example.com/{index}"} for index in range(min(max_results, self.available))]
+
+class TestSearchClient(unittest.TestCase):
+
+    def test_results_are_reused_from_cache(self):
+        client = FakeSearchClient(available=20)
+        self.assertEqual(len(client.search("topic", 10)), 10)
+        self.assertEqual(len(client.search("topic", 5)), 5)
+        self.assertEqual(client.queries, [10])
+
+    def test_pages_yield_each_result_once(self):
+        client = FakeSearchClient(available=7)
+        hrefs = [result["href"] for result in client.iter_results("topic", page_size=3)]
+        self.assertEqual(len(hrefs), len(set(hrefs)))
+        self.assertEqual(len(hrefs), 7)
+        # One query sized for every page, so no result is downloaded twice.
+        self.assertEqual(client.queries, [15])
+
+    def test_explicit_zero_overrides_are_kept(self):
+        client = FakeSearchClient(available=5)
+        self.assertEqual(client.search("topic", 5, retries=0), [])
+        self.assertEqual(client.queries, [])
+
+    def test_hung_queries_do_not_starve_later_searches(self):
+        client = FakeSearchClient(available=5, delay=1, timeout=0.05, retries=1)
+        for index in range(3):
+            client.search(f"hung {index}", 5)
+        client.delay = 0
+        self.assertEqual(len(client.search("topic", 5, timeout=0.5)), 5)
+
+    def test_timeout_does_not_wait_for_the_query(self):
+        client = FakeSearchClient(available=5, delay=1, timeout=0.1, retries=1)
+        started = time.perf_counter()
+        self.assertEqual(client.search("topic", 5), [])
+        self.assertLess(time.perf_counter() - started, 0.5)
+
+    def test_token_bucket_limits_bursts(self):
+        bucket = rate_limiter.TokenBucket(rate=1, capacity=2)
+        self.assertTrue(bucket.try_acquire())
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+        self.assertFalse(bucket.acquire(timeout=0.1))
+
+class TestAsyncPipeline(unittest.TestCase):
+
+    def test_contents_are_downloaded_once_per_result(self):
+        requested = []
+
+        def handler(request):
+            requested.append(str(request.url))
+            return httpx.Response(200, text="<p>intro</p><p>Body of the article.</p><p>footer</p>")
+
+        async def scrape():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                manager = async_pipeline.AsyncResourceManager(0, client=client, search_client=FakeSearchClient(available=3))
+                return await manager.get_trend_contents_async("topic", 5)
+
+        contents = asyncio.run(scrape())
+        self.assertEqual(contents, ["Body of the article."] * 3)
+        self.assertEqual(len(requested), len(set(requested)))
+
+    def test_cancellation_kills_subprocess_and_stops_stages(self):
+        async def cancel():
+            manager = async_pipeline.AsyncResourceManager(0)
+            task = asyncio.ensure_future(manager.run_subprocess([sys.executable, "-c", "import time; time.sleep(30)"], 60))
+            await asyncio.sleep(0.5)
+            started = time.perf_counter()
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            stopped_in = time.perf_counter() - started
+            blocking = asyncio.ensure_future(manager.run_blocking(time.sleep, 0.2))
+            await asyncio.sleep(0)
+            blocking.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await blocking
+            with self.assertRaises(asyncio.CancelledError):
+                await manager.run_blocking(print, "never runs")
+            return stopped_in, manager.cancel_event.is_set()
+
+        stopped_in, cancelled = asyncio.run(cancel())
+        self.assertLess(stopped_in, 5)
+        self.assertTrue(cancelled)
+
+class TestDeliveryQueue(unittest.TestCase):
+
+    def deliver_all(self, failures):
+        attempts = []
+
+        async def send(bot, chat_id, key, entry):
+            attempts.append(key)
+            if failures.get(key):
+                raise failures[key].pop(0)
+
+        async def run():
+            queue = delivery.DeliveryQueue(send, global_rate=1000, chat_rate=1000, backoff_base=0.01)
+            results = await asyncio.gather(*(queue.submit(None, 1, key, {}) for key in ("a", "b", "c")))
+            await queue.stop()
+            return results
+
+        return asyncio.run(run()), attempts
+
+    def test_transient_errors_are_retried(self):
+        results, attempts = self.deliver_all({"a": [NetworkError("reset"), RetryAfter(0)], "b": []})
+        self.assertEqual(results, [True, True, True])
+        self.assertEqual(attempts.count("a"), 3)
+
+    def test_bad_request_is_not_retried(self):
+        results, attempts = self.deliver_all({"b": [BadRequest("caption too long")]})
+        self.assertEqual(results, [True, False, True])
+        self.assertEqual(attempts.count("b"), 1)
+
+    def test_timed_out_upload_is_not_sent_again(self):
+        results, attempts = self.deliver_all({"c": [TimedOut()]})
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(attempts.count("c"), 1)
+
+class TestBatch(unittest.TestCase):
+
+    def test_trend_selection(self):
+        self.assertEqual(batch.parse_arguments(["--trends", "2", "4"]).trends, [2, 4])
+        self.assertEqual(batch.parse_arguments(["--count", "3", "--profile", "preview"]).count, 3)
+        with self.assertRaises(SystemExit):
+            batch.parse_arguments(["--trends", "0"])
+
+    def test_report_is_written_atomically(self):
+        with tempfile.TemporaryDirectory() as directory:
+            report_path = os.path.join(directory, "nightly", "report.json")
+            batch.write_report(report_path, {"failed": 0, "results": []})
+            with open(report_path, encoding="utf-8") as file:
+                self.assertEqual(json.load(file)["failed"], 0)
+            self.assertEqual(os.listdir(os.path.dirname(report_path)), ["report.json"])
+
+class TestStorageManager(unittest.TestCase):
+
+    def test_plan_reasons(self):
+        manager = storage_manager.StorageManager("media", quota_bytes=100, stale_hours=24, orphan_minutes=30)
+        now = 100000
+        folders = [
+            {"path": "media/stale", "size": 10, "last_modified": now - 25 * 3600, "finished": True, "in_use": False},
+            {"path": "media/orphan", "size": 10, "last_modified": now - 3600, "finished": False, "in_use": False},
+            {"path": "media/old", "size": 60, "last_modified": now - 120, "finished": True, "in_use": False},
+            {"path": "media/new", "size": 60, "last_modified": now - 60, "finished": True, "in_use": False},
+            {"path": "media/busy", "size": 20, "last_modified": now - 48 * 3600, "finished": False, "in_use": True},
+        ]
+        reasons = {folder["path"]: folder["reason"] for folder in manager.plan(folders, now)}
+        self.assertEqual(reasons, {"media/stale": "stale", "media/orphan": "orphan", "media/old": "quota"})
+
+    def test_collect_skips_folders_in_use(self):
+        with tempfile.TemporaryDirectory() as root:
+            for name in ("music", "crashed", "running"):
+                os.makedirs(os.path.join(root, name))
+                with open(os.path.join(root, name, "data"), "wb") as file:
+                    file.write(b"x" * 10)
+                os.utime(os.path.join(root, name, "data"), (0, 0))
+                os.utime(os.path.join(root, name), (0, 0))
+            manager = storage_manager.StorageManager(root, orphan_minutes=1)
+            with manager.in_use(os.path.join(root, "running")):
+                self.assertEqual(manager.collect(), 10)
+            self.assertEqual(sorted(os.listdir(root)), ["music", "running"])
+
+def busy_loop(seconds):
+    deadline = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(range(100))
+    return total
+
+class TestProfiler(unittest.TestCase):
+
+    def test_should_profile(self):
+        self.assertTrue(profiler.should_profile(True))
+        os.environ[profiler.PROFILE_RATE_ENV] = "0"
+        try:
+            self.assertFalse(profiler.should_profile())
+            os.environ[profiler.PROFILE_RATE_ENV] = "1"
+            self.assertTrue(profiler.should_profile())
+        finally:
+            del os.environ[profiler.PROFILE_RATE_ENV]
+
+    def test_profile_files(self):
+        sampler = profiler.SamplingProfiler(interval=0.002)
+        with sampler:
+            busy_loop(0.2)
+        with tempfile.TemporaryDirectory() as directory:
+            collapsed_path, speedscope_path = sampler.save(directory, "resources")
+            with open(collapsed_path, encoding="utf-8") as file:
+                self.assertIn("busy_loop (", file.read())
+            with open(speedscope_path, encoding="utf-8") as file:
+                speedscope = json.load(file)
+        samples = speedscope["profiles"][0]["samples"]
+        self.assertEqual(len(samples), len(speedscope["profiles"][0]["weights"]))
+        self.assertIn("busy_loop", [speedscope["shared"]["frames"][index]["name"] for index in samples[0]])
+
+    def test_profiled_job_renders_in_one_process(self):
+        self.assertEqual(resource_manager.ResourceManager(0, profiling=True, render_workers=4).render_workers, 1)
+        self.assertEqual(resource_manager.ResourceManager(0, profiling=False, render_workers=4).render_workers, 4)
+
+def encode_jpeg(image):
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG")
+    return buffer.getvalue()
+
+class TestMediaDedup(unittest.TestCase):
+
+    def setUp(self):
+        random_pixels = np.random.default_rng(0).integers(0, 256, (90, 160, 3), dtype=np.uint8)
+        self.photo = Image.fromarray(random_pixels).resize((640, 360), Image.BILINEAR)
+        other_pixels = np.random.default_rng(1).integers(0, 256, (90, 160, 3), dtype=np.uint8)
+        self.other = Image.fromarray(other_pixels).resize((640, 360), Image.BILINEAR)
+
+    def test_thumbnail_url(self):
+        url = "https://upload.wikimedia.org/wikipedia/commons/a/ab/Rome_Colosseum.jpg"
+        self.assertEqual(media_dedup.get_thumbnail_url(url),
+                         "https://upload.wikimedia.org/wikipedia/commons/thumb/a/ab/Rome_Colosseum.jpg/120px-Rome_Colosseum.jpg")
+        self.assertIsNone(media_dedup.get_thumbnail_url("https://example.com/photo.jpg"))
+
+    def test_near_duplicates_are_close(self):
+        photo_hash = media_dedup.dhash_image(encode_jpeg(self.photo))
+        resized_hash = media_dedup.dhash_image(encode_jpeg(self.photo.resize((120, 68))))
+        other_hash = media_dedup.dhash_image(encode_jpeg(self.other))
+        hashes = np.array([resized_hash, other_hash], dtype=np.uint64)
+        distances = media_dedup.hamming_distances(hashes, photo_hash)
+        self.assertLessEqual(distances[0], media_dedup.MAX_DISTANCE)
+        self.assertGreater(distances[1], media_dedup.MAX_DISTANCE)
+
+    def test_select_distinct_with_persistent_index(self):
+        with tempfile.TemporaryDirectory() as directory:
+            index_path = os.path.join(directory, "media_hashes.json")
+            index = media_dedup.MediaHashIndex(index_path)
+            urls = [f"{media_dedup.COMMONS_UPLOAD_PREFIX}a/ab/{name}.jpg" for name in ("photo", "upload", "other")]
+            self.assertEqual(index.missing(urls + ["https://example.com/x.jpg"]), urls)
+            index.add_thumbnails(urls, [encode_jpeg(self.photo), encode_jpeg(self.photo.resize((320, 180))), encode_jpeg(self.other)])
+            index.save()
+            reloaded = media_dedup.MediaHashIndex(index_path)
+            self.assertEqual(reloaded.missing(urls), [])
+            self.assertEqual(reloaded.select_distinct(urls + ["https://example.com/x.jpg"], 3),
+                             [urls[0], urls[2], "https://example.com/x.jpg"])
+
+    def test_failed_save_does_not_raise_or_leave_temp_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # A directory in place of the index makes the final rename fail.
+            index_path = os.path.join(directory, "media_hashes.json")
+            os.mkdir(index_path)
+            index = media_dedup.MediaHashIndex(index_path)
+            index.add_thumbnails([f"{media_dedup.COMMONS_UPLOAD_PREFIX}a/ab/photo.jpg"], [encode_jpeg(self.photo)])
+            index.save()
+            self.assertEqual(os.listdir(directory), ["media_hashes.json"])
+
+    def test_saves_of_two_indexes_are_merged(self):
+        with tempfile.TemporaryDirectory() as directory:
+            index_path = os.path.join(directory, "media_hashes.json")
+            first, second = media_dedup.MediaHashIndex(index_path), media_dedup.MediaHashIndex(index_path)
+            urls = [f"{media_dedup.COMMONS_UPLOAD_PREFIX}a/ab/{name}.jpg" for name in ("photo", "other")]
+            self.assertEqual(first.missing(urls), urls)
+            self.assertEqual(second.missing(urls), urls)
+            first.add_thumbnails(urls[:1], [encode_jpeg(self.photo)])
+            second.add_thumbnails(urls[1:], [encode_jpeg(self.other)])
+            first.save()
+            second.save()
+            self.assertEqual(media_dedup.MediaHashIndex(index_path).missing(urls), [])
+
+    def test_thumbnails_download_concurrently(self):
+        thumbnails = {f"{media_dedup.COMMONS_UPLOAD_PREFIX}a/ab/{name}.jpg": encode_jpeg(image)
+                      for name, image in (("photo", self.photo), ("upload", self.photo.resize((320, 180))), ("other", self.other))}
+        downloading = []
+        most_at_once = [0]
+        lock = threading.Lock()
+
+        def fetch_thumbnail(url):
+            with lock:
+                downloading.append(url)
+                most_at_once[0] = max(most_at_once[0], len(downloading))
+            time.sleep(0.1)
+            with lock:
+                downloading.remove(url)
+            return thumbnails[url]
+
+        original = media_dedup.fetch_thumbnail
+        media_dedup.fetch_thumbnail = fetch_thumbnail
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                index = media_dedup.MediaHashIndex(os.path.join(directory, "media_hashes.json"))
+                urls = list(thumbnails)
+                self.assertEqual(media_dedup.deduplicate_media(urls, 3, index), [urls[0], urls[2]])
+        finally:
+            media_dedup.fetch_thumbnail = original
+        self.assertGreater(most_at_once[0], 1)
+
+class TestTagIndex(unittest.TestCase):
+
+    def test_tags_favour_rare_terms(self):
+        with tempfile.TemporaryDirectory() as directory:
+            index = tag_index.TagIndex(os.path.join(directory, "tags.db"), stopwords={"the", "and"})
+            background = [f"The government said the economy and the election matter. Story {number}." for number in range(20)]
+            self.assertEqual(index.add_documents(background), 20)
+            article = "The election of the new pope: the conclave and the cardinals. The economy."
+            self.assertEqual(index.add_documents([article, article]), 1)
+            self.assertEqual(index.add_documents([article]), 0)
+            tags = index.top_tags([article], 4)
+            self.assertEqual(len(tags), 4)
+            self.assertNotIn("economy", tags)
+            self.assertNotIn("the", tags)
+            self.assertIn("cardinals", tags)
+            documents, frequencies = index.get_document_frequencies(["economy", "pope", "unknown"])
+            self.assertEqual((documents, frequencies), (21, {"economy": 21, "pope": 1}))
+
+class TestLoadTest(unittest.TestCase):
+
+    def test_fake_bot_api_answers(self):
+        api = loadtest.FakeBotAPI(flood_every=2)
+        api.server.server_close()
+        status, answer = api.answer("sendVideo", {"chat_id": "42"})
+        self.assertEqual((status, answer["result"]["chat"]["id"]), (200, 42))
+        self.assertIn("file_id", answer["result"]["video"])
+        status, answer = api.answer("sendVideo", {"chat_id": "42"})
+        self.assertEqual((status, answer["parameters"]["retry_after"]), (429, 1))
+        self.assertEqual(api.calls["floodControl"], 1)
+
+    def test_summarize_values(self):
+        summary = loadtest.summarize_values([float(value) for value in range(1, 101)])
+        self.assertEqual((summary["p50"], summary["p95"], summary["max"]), (50.5, 96.0, 100.0))
+        self.assertIsNone(loadtest.summarize_values([])["p50"])
+
+class TestDeadline(unittest.TestCase):
+
+    def test_budget_degrades_with_slow_stages(self):
+        now = [0.0]
+        budget = deadline.DeadlineBudget(300, clock=lambda: now[0])
+        self.assertEqual(budget.plan_media(16), (16, True))
+        self.assertEqual(budget.choose_render_profile("publish"), "publish")
+        # Scraping took three times its estimate: the rest of the run is expected to be slow too.
+        now[0] = 90.0
+        budget.record("contents", 90.0)
+        budget.skip("summary")
+        self.assertEqual(budget.slowness, 3.0)
+        number_of_media, videos = budget.plan_media(16)
+        self.assertFalse(videos)
+        self.assertLess(number_of_media, 16)
+        self.assertGreaterEqual(number_of_media, deadline.MIN_MEDIA)
+        self.assertEqual(budget.choose_render_profile("publish"), "preview")
+
+    def test_gather_until_keeps_ready_results(self):
+        async def value_after(value, seconds):
+            await asyncio.sleep(seconds)
+            return value
+
+        async def scenario():
+            quick = await deadline.gather_until([value_after("a", 0), value_after("b", 5)], 0.05)
+            late = await deadline.gather_until([value_after(None, 0), value_after("c", 0.1)], 0.01)
+            return quick, late
+
+        started = time.perf_counter()
+        quick, late = asyncio.run(scenario())
+        self.assertEqual(quick, ["a", None])
+        self.assertEqual(late, [None, "c"])
+        self.assertLess(time.perf_counter() - started, 2)
+
+    def test_degraded_stages_are_not_recorded(self):
+        async def media(trend_name, text, folder_path, number_of_media=16, videos=True, timeout=None):
+            return [os.path.join(folder_path, f"media_{index + 1}.jpg") for index in range(number_of_media)]
+
+        async def scenario(manager, manifest, job):
+            for stage, value in (("contents", {"Text": ["Article."]}), ("summary", {"TextScript": "Article."})):
+                await manager.run_stage_async(manifest, stage, lambda: asyncio.sleep(0, value))
+            await manager.run_stage_async(manifest, "media", lambda: manager.stage_media_async(job))
+            return await manager.run_stage_async(manifest, "sentiment", lambda: asyncio.sleep(0, 1))
+
+        with tempfile.TemporaryDirectory() as directory:
+            manager = async_pipeline.AsyncResourceManager(0)
+            # Too little time left for video clips and 16 media.
+            manager.budget = deadline.DeadlineBudget(40)
+            manager.search_and_download_media_async = media
+            manifest = job_manifest.JobManifest(directory)
+            job = {"trend_name": "Apollo", "path": directory, "summary": {"TextScript": "Article."}}
+            self.assertEqual(asyncio.run(scenario(manager, manifest, job)), 1)
+            self.assertEqual(manager.degraded, {"media"})
+            self.assertTrue(manifest.is_complete("summary"))
+            self.assertFalse(manifest.is_complete("media"))
+            self.assertFalse(manifest.is_complete("sentiment"))
+
+    def test_stages_after_a_degraded_one_are_not_reused(self):
+        with tempfile.TemporaryDirectory() as directory:
+            manifest = job_manifest.JobManifest(directory)
+            manifest.record("media", ["full.jpg"])
+            manifest.record("video_publish", "full.mp4", inputs=manifest.inputs_digest(resource_manager.get_stage_inputs("video_publish")))
+            manager = async_pipeline.AsyncResourceManager(0)
+            manager.degraded.add("media")
+            video = asyncio.run(manager.run_stage_async(manifest, "video_publish", lambda: asyncio.sleep(0, "degraded.mp4")))
+            self.assertEqual(video, "degraded.mp4")
+            self.assertEqual(manifest.get("video_publish"), "full.mp4")
+
+class TestWarmup(unittest.TestCase):
+
+    def test_failed_step_does_not_stop_the_others(self):
+        calls = []
+
+        def missing_model():
+            raise LookupError("Resource punkt not found.")
+
+        steps = [("nltk", missing_model), ("render", lambda: calls.append("render"))]
+        original_steps = warmup.WARM_UP_STEPS
+        warmup.WARM_UP_STEPS = steps
+        try:
+            timings = warmup.warm_up()
+        finally:
+            warmup.WARM_UP_STEPS = original_steps
+        self.assertEqual(set(timings), {"nltk", "render"})
+        self.assertEqual(calls, ["render"])
+
+    def test_pool_runs_initializer(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with warmup.make_worker_pool(1, os.chdir, (directory,)) as executor:
+                self.assertEqual(os.path.realpath(executor.submit(os.getcwd).result()), os.path.realpath(directory))
+
 class TestSummarization(unittest.TestCase):
 
     def test_preprocess_article(self):
@@ -72,6 +542,48 @@ class TestSentimentAnalysis(unittest.TestCase):
         emotion = sentiment_analysis.get_summarization_emotion(summarization)
         self.assertEqual(emotion, -1)
 
+    def test_sentence_emotions(self):
+        summarization = "The festival was wonderful. The last night was terrible."
+        emotions = sentiment_analysis.get_sentence_emotions(summarization)
+        self.assertEqual(list(emotions), [1, -1])
+
+    def test_batched_emotions_match_single_calls(self):
+        summarizations = [
+            "I really enjoyed reading this article. It was very informative and well-written.",
+            "This article was poorly written and lacked useful information.",
+            "It is not a bad idea!",
+        ]
+        emotions = sentiment_analysis.get_summarization_emotions(summarizations)
+        self.assertEqual(emotions, [sentiment_analysis.get_summarization_emotion(text) for text in summarizations])
+        self.assertEqual(emotions, [1, -1, 1])
+
+    def test_select_emoji_follows_keyword_order(self):
+        self.assertEqual(sentiment_analysis.select_emoji_based_on_description("Technology NEWS of the day"), "📰")
+        self.assertEqual(sentiment_analysis.select_emoji_based_on_description("A foodie trip"), "🍔")
+        self.assertEqual(sentiment_analysis.select_emoji_based_on_description("Nothing here"), "🤖")
+
+class TestKeywordMatcher(unittest.TestCase):
+
+    def test_matches_like_an_alternation(self):
+        keywords = ["on this site", "on this website", "sponsored", "sub", "subscription"]
+        matcher = keyword_matcher.KeywordMatcher(keywords)
+        pattern = re.compile(r'\b(?:{})\b'.format('|'.join(keywords)), flags=re.IGNORECASE)
+        for text in ["Read more ON THIS WEBSITE.", "A subway ride.", "Get a subscription", "sub", "Unsponsored content"]:
+            self.assertEqual(matcher.search(text), pattern.search(text) is not None)
+
+    def test_reports_keywords_that_prefix_longer_ones(self):
+        self.assertEqual(keyword_matcher.KeywordMatcher(["c", "ca"], whole_words=False).first_keyword("ca"), "c")
+        self.assertEqual(keyword_matcher.KeywordMatcher(["b", "bc"], whole_words=False).first_keyword("c aabca"), "b")
+        matcher = keyword_matcher.KeywordMatcher(["subscription", "sub"])
+        self.assertEqual(list(matcher.finditer("A Subscription, sub")), [(2, 14, 0), (16, 19, 1)])
+        self.assertEqual(matcher.first_keyword("sub or subscription"), "subscription")
+
+    def test_filter_spans(self):
+        text = "Hello world. This post is sponsored. Bye."
+        spans = [(0, 12), (13, 36), (37, 41)]
+        matcher = keyword_matcher.KeywordMatcher(["sponsored"])
+        self.assertEqual(matcher.filter_spans(text, spans), [(0, 12), (37, 41)])
+
 class TestMediaFinder(unittest.TestCase):
     def test_searchAndDownloadImage(self):
         trend = "Apollo"
@@ -81,6 +593,699 @@ class TestMediaFinder(unittest.TestCase):
         self.assertIsInstance(images, list)
         self.assertTrue(all(isinstance(img, str) for img in images))
 
+def write_wav(path, samples, sample_rate=audio_mixer.SAMPLE_RATE):
+    with wave.open(path, "wb") as output:
+        output.setnchannels(2)
+        output.setsampwidth(2)
+        output.setframerate(sample_rate)
+        output.writeframes((np.repeat(samples[:, None], 2, axis=1) * 32767).astype("<i2").tobytes())
+
+def read_wav(path):
+    with wave.open(path, "rb") as wav_file:
+        data = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype="<i2")
+    return data.reshape(-1, 2)[:, 0] / 32767
+
+class TestAudioMixer(unittest.TestCase):
+
+    def test_ducking_envelope_follows_the_narration(self):
+        narration = np.zeros((8192, 2), dtype=np.float32)
+        narration[:4096] = 0.5
+        envelope = audio_mixer.ducking_envelope(narration, 1.0, 0.2)
+        self.assertEqual(envelope.shape, (8192,))
+        self.assertAlmostEqual(float(envelope[2048]), 0.2, places=3)
+        self.assertAlmostEqual(float(envelope[-1]), 1.0, places=3)
+        self.assertTrue(((envelope >= 0.2 - 1e-6) & (envelope <= 1.0 + 1e-6)).all())
+
+    def test_mix_keeps_narration_length_and_ducks_music(self):
+        with tempfile.TemporaryDirectory() as directory:
+            rate = audio_mixer.SAMPLE_RATE
+            t = np.arange(2 * rate) / rate
+            # One second of speech, then one second of silence.
+            narration = np.where(t < 1, 0.3 * np.sin(2 * np.pi * 220 * t), 0.0)
+            music = 0.5 * np.sin(2 * np.pi * 440 * np.arange(3 * rate) / rate)
+            narration_path = os.path.join(directory, "speech.wav")
+            music_path = os.path.join(directory, "music.wav")
+            write_wav(narration_path, narration)
+            write_wav(music_path, music)
+
+            output_path = audio_mixer.mix_narration_with_music(narration_path, music_path, os.path.join(directory, "mixed.wav"),
+                                                               music_gain=0.5, duck_gain=0.2, block_seconds=0.5)
+            self.assertAlmostEqual(audio_mixer.get_wav_duration(output_path), 2.0, places=2)
+            music_part = read_wav(output_path) - narration
+            under_speech = np.sqrt(np.mean(music_part[int(0.2 * rate):int(0.8 * rate)] ** 2))
+            in_silence = np.sqrt(np.mean(music_part[int(1.2 * rate):int(1.8 * rate)] ** 2))
+            self.assertAlmostEqual(in_silence, 0.5 * 0.5 / np.sqrt(2), delta=0.02)
+            self.assertLess(under_speech, 0.3 * in_silence)
+
+class TestMusicCatalog(unittest.TestCase):
+
+    def test_parse_cc_attribution(self):
+        blocks = music_catalog.parse_cc_file(os.path.join("media", "music", "CC.txt"))
+        self.assertTrue(len(blocks) > 0)
+        self.assertTrue(all(block.startswith("Song:") for block in blocks))
+        attribution = music_catalog.find_attribution("Wiguez - Marcheur [NCS Release].mp3", blocks)
+        self.assertIn("http://ncs.io/Marcheur", attribution)
+
+    def test_select_by_minimum_duration(self):
+        tracks = [
+            {"path": "short.mp3", "emotion": "1", "duration": 10.0},
+            {"path": "long.mp3", "emotion": "1", "duration": 120.0},
+        ]
+        catalog = music_catalog.MusicCatalog("music", {}, tracks)
+        self.assertEqual(catalog.select(1, 60)["path"], "long.mp3")
+        self.assertEqual(catalog.select("1", 600)["path"], "long.mp3")
+        self.assertIsNone(catalog.select(-1))
+
+    def test_track_overwritten_in_place_is_measured_again(self):
+        with tempfile.TemporaryDirectory() as directory:
+            emotion_folder = os.path.join(directory, "1")
+            os.mkdir(emotion_folder)
+            track_path = os.path.join(emotion_folder, "track.mp3")
+
+            def write_track(seconds):
+                folder_times = os.stat(emotion_folder)
+                subprocess.run([get_ffmpeg_exe(), "-v", "error", "-y", "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+                                track_path], check=True)
+                # Overwriting a file in place leaves the times of its folder as they were.
+                os.utime(emotion_folder, ns=(folder_times.st_atime_ns, folder_times.st_mtime_ns))
+
+            write_track(1)
+            self.assertAlmostEqual(music_catalog.get_catalog(directory).select(1)["duration"], 1.0, delta=0.1)
+            write_track(2)
+            self.assertAlmostEqual(music_catalog.get_catalog(directory).select(1)["duration"], 2.0, delta=0.1)
+            self.assertEqual(sorted(os.listdir(directory)), ["1", music_catalog.CATALOG_NAME])
+
+class TestVideoIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.child_processes = loadtest.count_child_processes()
+
+    def make_source(self, directory, seconds=4):
+        source = os.path.join(directory, "source.mp4")
+        subprocess.run([get_ffmpeg_exe(), "-v", "error", "-f", "lavfi", "-i", f"testsrc=size=320x240:rate=10:duration={seconds}",
+                        "-pix_fmt", "yuv420p", source], check=True)
+        return source
+
+    def test_fetch_segment_trims_and_scales(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = self.make_source(directory)
+            self.assertAlmostEqual(video_ingest.probe_duration(source), 4.0, places=1)
+            segment = video_ingest.fetch_segment(source, os.path.join(directory, "segment.mp4"), segment_seconds=2, width=160)
+            self.assertAlmostEqual(video_ingest.probe_duration(segment), 2.0, delta=0.2)
+            stream = video_ingest.FrameStream(segment, (160, 120), 10)
+            self.assertEqual(stream.get_frame(0).shape, (120, 160, 3))
+            stream.close()
+
+    def test_clip_loops_short_segment_and_seeks_back(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = self.make_source(directory, seconds=1)
+            clip = video_ingest.make_video_clip(source, (90, 160), 3, 10)
+            first = clip.get_frame(0).copy()
+            middle = clip.get_frame(0.5).copy()
+            self.assertFalse((middle == first).all())
+            self.assertTrue((clip.get_frame(2.5) == middle).all())
+            self.assertTrue((clip.get_frame(0) == first).all())
+            clip.close()
+
+    def test_decoder_starts_when_the_clip_plays(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = self.make_source(directory, seconds=1)
+            clip = video_ingest.make_video_clip(source, (90, 160), 1, 10).set_start(2)
+            self.assertEqual(loadtest.count_child_processes(), self.child_processes)
+            compositor = frame_renderer.FrameCompositor((90, 160), [clip], [])
+            compositor.render(1)
+            self.assertEqual(loadtest.count_child_processes(), self.child_processes)
+            compositor.render(2.5)
+            self.assertEqual(loadtest.count_child_processes(), self.child_processes + 1)
+            compositor.close()
+            self.assertEqual(loadtest.count_child_processes(), self.child_processes)
+
+class TestMotion(unittest.TestCase):
+
+    def test_ken_burns_rectangles_stay_in_bounds_and_zoom_monotonically(self):
+        source_size, output_size = (1600, 1200), (540, 960)
+        for zoom_in in (True, False):
+            boxes = motion.ken_burns_rectangles(source_size, output_size, 48, zoom=1.2, zoom_in=zoom_in, pan=1.0)
+            self.assertEqual(boxes.shape, (48, 4))
+            self.assertTrue((boxes[:, :2] >= -1e-6).all())
+            self.assertTrue((boxes[:, 2] <= source_size[0] + 1e-6).all() and (boxes[:, 3] <= source_size[1] + 1e-6).all())
+            widths = boxes[:, 2] - boxes[:, 0]
+            heights = boxes[:, 3] - boxes[:, 1]
+            np.testing.assert_allclose(widths / heights, output_size[0] / output_size[1])
+            steps = np.diff(widths)
+            self.assertTrue((steps <= 1e-9).all() if zoom_in else (steps >= -1e-9).all())
+            self.assertAlmostEqual(widths.max() / widths.min(), 1.2)
+        # The largest box covers the source height, the smallest is panned to the right edge.
+        boxes = motion.ken_burns_rectangles(source_size, output_size, 48, zoom=1.2, pan=1.0)
+        self.assertAlmostEqual(boxes[0, 3] - boxes[0, 1], source_size[1])
+        self.assertAlmostEqual(boxes[-1, 2], source_size[0])
+
+    def test_ken_burns_crops_the_memory_map_like_a_full_resize(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = np.random.default_rng(1).integers(0, 256, (700, 500, 3), dtype=np.uint8)
+            path = os.path.join(directory, "background.npy")
+            np.save(path, source)
+            for resample in (Image.NEAREST, Image.BILINEAR, Image.LANCZOS):
+                cropped = motion.make_ken_burns_clip(path, (270, 480), 1, 12, pan=1.0, resample=resample)
+                full = motion.make_ken_burns_clip(Image.fromarray(source), (270, 480), 1, 12, pan=1.0, resample=resample)
+                for t in (0, 0.5, 11 / 12):
+                    difference = np.abs(cropped.get_frame(t).astype(int) - full.get_frame(t).astype(int))
+                    self.assertLessEqual(difference.max(), 2)
+                cropped.close()
+
+    def test_shrinking_clip_shrinks_to_nothing(self):
+        frame = np.full((40, 60, 3), 200, dtype=np.uint8)
+        clip = motion.make_shrinking_clip(frame, np.ones((40, 60)), 1.0, 10)
+        self.assertTrue((clip.get_frame(0) == frame).all())
+        self.assertEqual(clip.mask.get_frame(0).min(), 1.0)
+        covered = [int((clip.mask.get_frame(index / 10) > 0).sum()) for index in range(10)]
+        self.assertEqual(covered, sorted(covered, reverse=True))
+        half = clip.get_frame(0.5)
+        self.assertEqual(half[20, 30].tolist(), [200, 200, 200])
+        self.assertEqual(half[0, 0].tolist(), [0, 0, 0])
+        self.assertLess(covered[-1], covered[0] * 0.05)
+
+class TestFrameRenderer(unittest.TestCase):
+
+    def test_static_overlay_matches_alpha_blending(self):
+        with tempfile.TemporaryDirectory() as directory:
+            rgba = np.random.default_rng(0).integers(0, 256, (8, 6, 4), dtype=np.uint8)
+            path = os.path.join(directory, "overlay.png")
+            Image.fromarray(rgba, "RGBA").save(path)
+            overlay = frame_renderer.StaticOverlay(path, (6, 8))
+            buffer = np.full((8, 6, 3), 100, dtype=np.uint8)
+            alpha = rgba[..., 3:] / 255
+            expected = np.round(100 * (1 - alpha) + rgba[..., :3] * alpha)
+            overlay.blend_into(buffer, 0)
+            self.assertTrue(np.abs(buffer - expected).max() <= 1)
+
+    def test_compositor_reuses_buffer_and_releases_backgrounds(self):
+        closed = []
+        first = ColorClip((4, 4), color=(255, 0, 0), duration=1).set_start(0)
+        second = ColorClip((4, 4), color=(0, 255, 0), duration=1).set_start(1)
+        first.close = lambda: closed.append("first")
+        compositor = frame_renderer.FrameCompositor((4, 4), [first, second], [])
+        frame = compositor.render(0.5)
+        self.assertEqual(tuple(frame[0, 0]), (255, 0, 0))
+        self.assertIs(compositor.render(1.5), frame)
+        self.assertEqual(tuple(frame[0, 0]), (0, 255, 0))
+        self.assertEqual(closed, ["first"])
+        self.assertEqual(compositor.render(2.5).max(), 0)
+
+    def test_plan_chunks_cuts_at_boundaries(self):
+        self.assertEqual(frame_renderer.plan_chunks(100, [30, 45, 60, 90], 2), [(0, 45), (45, 100)])
+        self.assertEqual(frame_renderer.plan_chunks(100, [10, 20], 4), [(0, 20), (20, 100)])
+        self.assertEqual(frame_renderer.plan_chunks(100, [], 4), [(0, 100)])
+
+    def test_concurrent_renders_share_the_chunk_processes(self):
+        limit = editing.CHUNK_PROCESS_LIMIT
+        editing.CHUNK_PROCESS_LIMIT = 4
+        try:
+            with editing.reserve_chunk_processes(3) as first:
+                with editing.reserve_chunk_processes(3) as second:
+                    # One process left is no better than rendering in the calling one.
+                    self.assertEqual((first, second), (3, 1))
+                with editing.reserve_chunk_processes(2) as third:
+                    self.assertEqual(third, 1)
+            with editing.reserve_chunk_processes(8) as fourth:
+                self.assertEqual(fourth, 4)
+            self.assertEqual(editing.chunk_processes_running, 0)
+        finally:
+            editing.CHUNK_PROCESS_LIMIT = limit
+
+    def test_chunks_are_joined_without_reencoding(self):
+        with tempfile.TemporaryDirectory() as directory:
+            chunk_paths = []
+            for index, (start, end) in enumerate([(0, 12), (12, 24)]):
+                clip = ColorClip((32, 32), color=(index * 200, 0, 0), duration=2).set_start(0)
+                compositor = frame_renderer.FrameCompositor((32, 32), [clip], [])
+                chunk_paths.append(frame_renderer.write_video(compositor, 2, 12, os.path.join(directory, f"chunk_{index}.mp4"),
+                                                              preset="ultrafast", start_frame=start, end_frame=end))
+            output_path = frame_renderer.concat_videos(chunk_paths, os.path.join(directory, "video.mp4"))
+            probe = subprocess.run([get_ffmpeg_exe(), "-i", output_path, "-f", "null", "-"], capture_output=True, text=True)
+            frames = int(re.findall(r"frame=\s*(\d+)", probe.stderr)[-1])
+            self.assertEqual(frames, 24)
+            self.assertFalse(os.path.exists(output_path + ".concat.txt"))
+
+def make_stub_caption(txt, scale=1.0):
+    # Stands in for the ImageMagick caption: a white box with a mask, of the size of a caption line.
+    return ColorClip((int(980 * scale), int(120 * scale)), color=(255, 255, 255)).add_mask()
+
+class TestRenderSoak(unittest.TestCase):
+
+    def setUp(self):
+        self.edit_caption = editing.edit_caption
+        try:
+            editing.edit_caption("Caption").close()
+        except Exception:
+            editing.edit_caption = make_stub_caption
+
+    def tearDown(self):
+        editing.edit_caption = self.edit_caption
+
+    def make_plan(self, directory, size=(270, 480), fps=12):
+        image_path = os.path.join(directory, "image.png")
+        Image.fromarray(np.random.default_rng(0).integers(0, 256, (300, 200, 3), dtype=np.uint8)).save(image_path)
+        video_path = os.path.join(directory, "segment.mp4")
+        subprocess.run([get_ffmpeg_exe(), "-v", "error", "-f", "lavfi", "-i", "testsrc=size=320x240:rate=10:duration=1",
+                        "-pix_fmt", "yuv420p", video_path], check=True)
+        srt_path = os.path.join(directory, "subtitles.srt")
+        with open(srt_path, "w", encoding="utf-8") as file:
+            file.write("1\n00:00:00,000 --> 00:00:00,500\nFirst words\n\n2\n00:00:00,500 --> 00:00:01,000\nLast words\n")
+        times = np.arange(audio_mixer.SAMPLE_RATE) / audio_mixer.SAMPLE_RATE
+        write_wav(os.path.join(directory, "speech.wav"), 0.5 * np.sin(2 * np.pi * 220 * times))
+        write_wav(os.path.join(directory, "music.wav"), 0.5 * np.sin(2 * np.pi * 440 * np.arange(2 * audio_mixer.SAMPLE_RATE) / audio_mixer.SAMPLE_RATE))
+        audio_path = audio_mixer.mix_narration_with_music(os.path.join(directory, "speech.wav"), os.path.join(directory, "music.wav"),
+                                                          os.path.join(directory, "mixed.wav"))
+        return {
+            "size": size, "fps": fps, "preset": "ultrafast", "ffmpeg_params": None, "duration": 1.0,
+            "backgrounds": [{"path": editing.cache_background(image_path, size[1], size[0]), "start": 0, "duration": 0.5},
+                            {"path": video_path, "start": 0.5, "duration": 0.5}],
+            "subtitles": srt_path, "frame_path": 'media/props/frame.png', "audio_path": audio_path,
+            "output_path": os.path.join(directory, "video.mp4"),
+        }
+
+    def render_round(self, plan, errors):
+        editing.render_frames(plan, plan["output_path"], audio_path=plan["audio_path"])
+        cancelled = threading.Event()
+        cancelled.set()
+        # The errors are kept with their tracebacks, as a job log would, so they keep the frames of the render alive.
+        for render_plan, cancel_event in [(plan, cancelled), (dict(plan, ffmpeg_params=["-crf", "invalid"]), None)]:
+            try:
+                editing.render_frames(render_plan, plan["output_path"], audio_path=plan["audio_path"], cancel_event=cancel_event)
+            except (frame_renderer.RenderCancelled, IOError) as e:
+                errors.append(e)
+            else:
+                self.fail("The render should have failed")
+            # No truncated video is left for a later step to pick up.
+            self.assertFalse(os.path.exists(plan["output_path"]))
+
+    def test_many_renders_keep_memory_and_descriptors_flat(self):
+        with tempfile.TemporaryDirectory() as directory:
+            plan = self.make_plan(directory)
+            editing.render_frames(plan, plan["output_path"], audio_path=plan["audio_path"])
+            probe = subprocess.run([get_ffmpeg_exe(), "-i", plan["output_path"]], capture_output=True, text=True)
+            self.assertIn("Audio:", probe.stderr)
+            errors = []
+            for _ in range(2):
+                self.render_round(plan, errors)
+            open_files = loadtest.count_open_files()
+            rss_mb = loadtest.get_rss_megabytes()
+            # Long-lived children of earlier tests, e.g. the forkserver of the worker pools, are not counted.
+            child_processes = loadtest.count_child_processes()
+            # Every reader and encoder must be released by its scope, not by the cycle collector.
+            gc.disable()
+            try:
+                for _ in range(10):
+                    self.render_round(plan, errors)
+                    self.assertEqual(loadtest.count_child_processes(), child_processes)
+            finally:
+                gc.enable()
+            self.assertEqual(loadtest.count_open_files(), open_files)
+            self.assertLess(loadtest.get_rss_megabytes() - rss_mb, 20)
+            self.assertEqual(len(errors), 24)
+
+    def test_clip_overlay_closes_cached_clips(self):
+        closed = []
+
+        class FakeClip:
+            def __init__(self, name):
+                self.name = name
+                self.textclips = {}
+
+            def close(self):
+                closed.append(self.name)
+
+        subtitles = FakeClip("subtitles")
+        subtitles.textclips = {"first": FakeClip("first"), "second": FakeClip("second")}
+        frame_renderer.ClipOverlay(subtitles).close()
+        self.assertEqual(closed, ["first", "second", "subtitles"])
+        self.assertEqual(subtitles.textclips, {})
+
+class TestJobManifest(unittest.TestCase):
+
+    def test_record_and_resume(self):
+        with tempfile.TemporaryDirectory() as directory:
+            artifact = os.path.join(directory, "speech.wav")
+            with open(artifact, "wb") as file:
+                file.write(b"speech")
+            manifest = job_manifest.JobManifest(directory)
+            manifest.record("speech", artifact, [artifact])
+
+            reloaded = job_manifest.JobManifest(directory)
+            self.assertTrue(reloaded.is_complete("speech"))
+            self.assertEqual(reloaded.get("speech"), artifact)
+
+    def test_modified_artifact_invalidates_stage(self):
+        with tempfile.TemporaryDirectory() as directory:
+            artifact = os.path.join(directory, "sub.srt")
+            with open(artifact, "w") as file:
+                file.write("1")
+            manifest = job_manifest.JobManifest(directory)
+            manifest.record("subtitles", artifact, [artifact])
+            with open(artifact, "w") as file:
+                file.write("2")
+            self.assertFalse(manifest.is_complete("subtitles"))
+            self.assertFalse(manifest.is_complete("video"))
+
+    def test_concurrent_saves_do_not_collide(self):
+        with tempfile.TemporaryDirectory() as directory:
+            errors = []
+
+            def save_many(stage):
+                manifest = job_manifest.JobManifest(directory)
+                for index in range(50):
+                    try:
+                        manifest.record(stage, index)
+                    except OSError as e:
+                        errors.append(e)
+
+            threads = [threading.Thread(target=save_many, args=(stage,)) for stage in ("summary", "media", "speech", "music")]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(errors, [])
+            self.assertEqual(os.listdir(directory), [job_manifest.MANIFEST_NAME])
+            stages = set(job_manifest.JobManifest(directory).stages)
+            self.assertTrue(stages and stages <= {"summary", "media", "speech", "music"})
+
+    def test_recomputed_upstream_stage_invalidates_downstream(self):
+        with tempfile.TemporaryDirectory() as directory:
+            manager = resource_manager.ResourceManager(0)
+            manifest = job_manifest.JobManifest(directory)
+            calls = []
+
+            def run(stage, value):
+                return manager.run_stage(manifest, stage, lambda: calls.append(stage) or value)
+
+            run("summary", {"TextScript": "First."})
+            # A neutral sentiment is an output, not a failure.
+            self.assertEqual(run("sentiment", 0), 0)
+            run("sentiment", 0)
+            self.assertEqual(calls, ["summary", "sentiment"])
+
+            manifest.invalidate("summary")
+            run("summary", {"TextScript": "Second."})
+            run("sentiment", 1)
+            self.assertEqual(calls, ["summary", "sentiment", "summary", "sentiment"])
+            self.assertEqual(manifest.get("sentiment"), 1)
+
+class FakeStages:
+    """Stage methods returning canned outputs, failing at `fail_at`."""
+
+    fail_at = None
+
+    def run_fake_stage(self, name, job):
+        self.calls.append(name)
+        return None if name == self.fail_at else f"{name} of {job['trend_name']}"
+
+    def finish_job(self, job):
+        return {stage["name"]: job[stage["name"]] for stage in resource_manager.PIPELINE}
+
+for stage in resource_manager.PIPELINE:
+    setattr(FakeStages, f"stage_{stage['name']}", lambda self, job, name=stage["name"]: self.run_fake_stage(name, job))
+
+class FakeResourceManager(FakeStages, resource_manager.ResourceManager):
+    pass
+
+class FakeAsyncResourceManager(FakeStages, async_pipeline.AsyncResourceManager):
+
+    async def stage_contents_async(self, job):
+        return self.run_fake_stage("contents", job)
+
+    async def stage_media_async(self, job):
+        return self.run_fake_stage("media", job)
+
+class TestPipelineStages(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.get_trends = web_scraper.get_trends
+        self.create_media_folder = file_manager.create_media_folder
+        web_scraper.get_trends = lambda: ["Apollo"]
+        file_manager.create_media_folder = lambda trend_name: self.directory.name
+
+    def tearDown(self):
+        web_scraper.get_trends = self.get_trends
+        file_manager.create_media_folder = self.create_media_folder
+        self.directory.cleanup()
+
+    def run_sync(self, fail_at=None):
+        manager = FakeResourceManager(0)
+        manager.calls, manager.fail_at = [], fail_at
+        return manager.run_stages(), manager.calls
+
+    def run_async(self, fail_at=None):
+        manager = FakeAsyncResourceManager(0)
+        manager.calls, manager.fail_at = [], fail_at
+        return asyncio.run(manager.generate_stages()), manager.calls
+
+    def test_both_runners_run_the_stage_table(self):
+        names = [stage["name"] for stage in resource_manager.PIPELINE]
+        output, calls = self.run_sync()
+        self.assertEqual(calls, names)
+        os.remove(os.path.join(self.directory.name, job_manifest.MANIFEST_NAME))
+        self.assertEqual(self.run_async(), (output, names))
+
+    def test_both_runners_stop_at_the_same_failed_stage(self):
+        sync_output, sync_calls = self.run_sync(fail_at="sentiment")
+        os.remove(os.path.join(self.directory.name, job_manifest.MANIFEST_NAME))
+        async_output, async_calls = self.run_async(fail_at="sentiment")
+        self.assertIsNone(sync_output)
+        self.assertIsNone(async_output)
+        self.assertEqual(sync_calls, ["contents", "summary", "media", "sentiment"])
+        self.assertEqual(async_calls, sync_calls)
+
+class FakeVideoStore:
+
+    def __init__(self, stored=()):
+        self.stored = set(stored)
+        self.in_flight = set()
+        self.created = []
+
+    def get(self, key):
+        return {"path": key} if key in self.stored else None
+
+    async def get_or_create(self, key, create):
+        self.in_flight.add(key)
+        try:
+            await create()
+        finally:
+            self.in_flight.discard(key)
+        self.created.append(key)
+        self.stored.add(key)
+
+class TestPreRenderer(unittest.TestCase):
+
+    def setUp(self):
+        self.get_trends = prerender.get_trends
+        self.get_cpu_load = prerender.get_cpu_load
+        prerender.get_trends = lambda: ["Apollo", "Artemis", "Gemini", "Mercury", "Skylab"]
+        self.cpu_load = 0.0
+        prerender.get_cpu_load = lambda: self.cpu_load
+        self.running = 0
+        self.max_running = 0
+
+    def tearDown(self):
+        prerender.get_trends = self.get_trends
+        prerender.get_cpu_load = self.get_cpu_load
+
+    def make_job(self, trend_number, trend, date_string):
+        async def create():
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            await asyncio.sleep(0.01)
+            self.running -= 1
+        return f"{trend}-{date_string}", create
+
+    def run_polls(self, renderer, before_wait=None):
+        async def scenario():
+            await renderer.poll()
+            if before_wait:
+                await before_wait()
+            await asyncio.gather(*renderer.pending.values())
+        asyncio.run(scenario())
+
+    def test_renders_one_at_a_time_and_skips_stored_trends(self):
+        store = FakeVideoStore(stored=[f"Apollo-{time.strftime('%d-%m-%Y')}"])
+        renderer = prerender.PreRenderer(store, self.make_job, top_n=3, max_concurrency=1)
+        self.run_polls(renderer)
+        self.assertEqual([key.split("-")[0] for key in store.created], ["Artemis", "Gemini"])
+        self.assertEqual(self.max_running, 1)
+
+    def test_max_pending_limits_scheduled_renders(self):
+        store = FakeVideoStore()
+        renderer = prerender.PreRenderer(store, self.make_job, top_n=5, max_concurrency=2, max_pending=2)
+
+        async def poll_again():
+            self.assertEqual(len(renderer.pending), 2)
+            await renderer.poll()
+            self.assertEqual(len(renderer.pending), 2)
+
+        self.run_polls(renderer, poll_again)
+        self.assertEqual(len(store.created), 2)
+        self.assertEqual(self.max_running, 2)
+
+    def test_busy_cpu_skips_the_poll(self):
+        self.cpu_load = 0.9
+        store = FakeVideoStore()
+        renderer = prerender.PreRenderer(store, self.make_job, cpu_budget=0.75)
+        self.run_polls(renderer)
+        self.assertEqual(store.created, [])
+
+    def test_interactive_request_pauses_queued_renders(self):
+        store = FakeVideoStore()
+        renderer = prerender.PreRenderer(store, self.make_job, top_n=1, idle_check_seconds=0.01)
+
+        async def interactive_request():
+            with renderer.interactive():
+                self.assertFalse(renderer.is_idle())
+                await asyncio.sleep(0.05)
+                self.assertEqual(store.created, [])
+
+        self.run_polls(renderer, interactive_request)
+        self.assertEqual(len(store.created), 1)
+
+class TestVideoStore(unittest.TestCase):
+
+    def test_concurrent_requests_render_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = video_store.VideoStore(os.path.join(directory, "store"))
+            key = video_store.make_key("Apollo", "01-01-2024", "config")
+            renders = []
+
+            async def create():
+                renders.append(key)
+                await asyncio.sleep(0.01)
+                video_path = os.path.join(directory, "video.mp4")
+                with open(video_path, "wb") as file:
+                    file.write(b"video")
+                return store.put(key, video_path, "caption")
+
+            async def request_many():
+                return await asyncio.gather(*(store.get_or_create(key, create) for _ in range(5)))
+
+            entries = asyncio.run(request_many())
+            self.assertEqual(len(renders), 1)
+            self.assertTrue(all(entry["path"] == entries[0]["path"] for entry in entries))
+            self.assertEqual(video_store.VideoStore(os.path.join(directory, "store")).get(key)["caption"], "caption")
+
+    def test_expired_videos_are_evicted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = video_store.VideoStore(os.path.join(directory, "store"), ttl_hours=0)
+            video_path = os.path.join(directory, "video.mp4")
+            with open(video_path, "wb") as file:
+                file.write(b"video")
+            entry = store.put("key", video_path, "caption")
+            self.assertIsNone(store.get("key"))
+            self.assertFalse(os.path.exists(entry["path"]))
+
+class TestWorkQueue(unittest.TestCase):
+
+    def test_claim_and_complete(self):
+        with tempfile.TemporaryDirectory() as directory:
+            queue = work_queue.SQLiteWorkQueue(os.path.join(directory, "queue.db"))
+            job_id = queue.enqueue({"trend_number": 0}, key="trend-0")
+            self.assertEqual(queue.enqueue({"trend_number": 0}, key="trend-0"), job_id)
+
+            job = queue.claim("worker-1")
+            self.assertEqual(job["payload"], {"trend_number": 0})
+            self.assertIsNone(queue.claim("worker-2"))
+            self.assertTrue(queue.heartbeat(job_id, "worker-1"))
+            self.assertTrue(queue.complete(job_id, "worker-1", {"video": "video.mp4"}))
+            self.assertEqual(queue.get(job_id)["result"], {"video": "video.mp4"})
+
+    def test_failed_jobs_are_retried_then_given_up(self):
+        with tempfile.TemporaryDirectory() as directory:
+            queue = work_queue.SQLiteWorkQueue(os.path.join(directory, "queue.db"), max_attempts=2)
+            job_id = queue.enqueue({"trend_number": 1})
+            for attempt in range(2):
+                self.assertEqual(queue.claim("worker")["attempts"], attempt + 1)
+                queue.fail(job_id, "worker", "network error")
+            self.assertIsNone(queue.claim("worker"))
+            self.assertEqual(queue.get(job_id)["status"], work_queue.FAILED)
+
+    def test_queue_interface_is_abstract(self):
+        with self.assertRaises(TypeError):
+            work_queue.WorkQueue()
+
+    def test_enqueue_trends_twice_adds_each_job_once(self):
+        get_trends = worker.get_trends
+        worker.get_trends = lambda: ["Apollo", "Artemis", "Gemini"]
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                queue = work_queue.SQLiteWorkQueue(os.path.join(directory, "queue.db"))
+                job_ids = worker.enqueue_trends(queue, 2)
+                self.assertEqual(worker.enqueue_trends(queue, 2), job_ids)
+                self.assertEqual(len(set(job_ids)), 2)
+                self.assertNotEqual(worker.enqueue_trends(queue, 1, render_profile="preview"), job_ids[:1])
+                # The job renders the trend it was keyed on, even if the ranking changes before it is claimed.
+                self.assertEqual(queue.get(job_ids[1])["payload"]["trend"], "Artemis")
+        finally:
+            worker.get_trends = get_trends
+
+    def test_named_trend_is_rendered_whatever_its_rank(self):
+        get_trends = web_scraper.get_trends
+        create_media_folder = file_manager.create_media_folder
+        web_scraper.get_trends = lambda: ["Gemini", "Apollo", "Artemis"]
+        file_manager.create_media_folder = lambda trend_name: trend_name
+        try:
+            manager = resource_manager.ResourceManager(1, trend_name="Artemis")
+            self.assertEqual(manager.start_job(manager.fetch_trends())["trend_name"], "Artemis")
+            manager = resource_manager.ResourceManager(1)
+            self.assertEqual(manager.start_job(manager.fetch_trends())["trend_name"], "Apollo")
+        finally:
+            web_scraper.get_trends = get_trends
+            file_manager.create_media_folder = create_media_folder
+
+    def test_result_of_a_lost_lease_is_not_reported(self):
+        class LostLeaseQueue(work_queue.WorkQueue):
+            lease_seconds = 0.03
+
+            def __init__(self):
+                self.jobs = [{"id": 1, "payload": {}, "attempts": 1}]
+                self.reported = []
+
+            def enqueue(self, payload, key=None):
+                pass
+
+            def claim(self, worker_id):
+                return self.jobs.pop() if self.jobs else None
+
+            def heartbeat(self, job_id, worker_id):
+                return False
+
+            def complete(self, job_id, worker_id, result):
+                self.reported.append("complete")
+
+            def fail(self, job_id, worker_id, error):
+                self.reported.append("fail")
+
+            def get(self, job_id):
+                pass
+
+        def slow_job(payload):
+            time.sleep(0.2)
+            return {}
+
+        process_job = worker.process_job
+        worker.process_job = slow_job
+        try:
+            queue = LostLeaseQueue()
+            worker.run_worker(queue, "worker", exit_when_empty=True)
+            self.assertEqual(queue.reported, [])
+        finally:
+            worker.process_job = process_job
+
+    def test_expired_lease_is_reclaimed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            queue = work_queue.SQLiteWorkQueue(os.path.join(directory, "queue.db"), lease_seconds=0)
+            job_id = queue.enqueue({"trend_number": 2})
+            queue.claim("crashed-worker")
+            self.assertEqual(queue.claim("worker")["worker"], "worker")
+            self.assertFalse(queue.heartbeat(job_id, "crashed-worker"))
+
 if __name__ == '__main__':
     unittest.main()
 